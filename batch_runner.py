@@ -3,21 +3,31 @@ import os
 import re
 import time
 import argparse
-import pandas as pd
-from glob import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
 
 # usa o que você já tem no projeto
 from setup import interest_zones  # lista "label?raio?tipo"
-from places import search_places, get_api_key  # sua função que gera os CSVs
-from regions import infer_region_from_csv, move_to_region_folder
+import rate_limit
+from metrics import get_metrics
+from job_journal import JobJournal, format_eta, DONE_STATES, PLANNED, SUCCEEDED, EMPTY, FAILED
 
-try:
-    from places import make_csv_filename  # normalizador de nome com 5 casas
-except Exception:
-    def make_csv_filename(place_type, lat, lng):
+if TYPE_CHECKING:
+    import pandas as pd
+
+# places, índice, catálogo, regiões, store e preflight (todos sobre o pandas)
+# são importados dentro das funções que os usam: importar este módulo, p.ex.
+# num processo de trabalho, não carrega o pandas nem o cliente da API.
+
+def make_csv_filename(place_type, lat, lng):
+    try:
+        from places import make_csv_filename as places_csv_filename  # normalizador de nome com 5 casas
+    except Exception:
         return f"{place_type}_near_{lat}_{lng}.csv"
+    return places_csv_filename(place_type, lat, lng)
 
 RESULTS_DIR = os.path.join("system", "results")
+METRICS_DIR = os.path.join("system", "metrics")
 
 # --------- tipologias a partir do setup.interest_zones ----------
 def parse_interest_types(zones):
@@ -53,69 +63,98 @@ def resolve_types(user_csv: str | None, zones):
     return out
 
 # --------- helpers para extrair coordenadas de células "Lat, Long" ----------
-def _parse_latlng_cell(val):
+# Um número como o re.findall(r'[-+]?\d+(?:[.,]\d+)?') encontraria: os
+# lookaheads impedem o backtracking de partir um número em dois (ex.: "-23.5505"
+# virar "-23.550" e "5"), então o par são os dois primeiros números da célula.
+_NUMBER = r'[-+]?\d+(?!\d)(?:[.,]\d+(?!\d)|(?![.,]\d))'
+_PAIR_RE = re.compile(rf'(?P<lat>{_NUMBER}).*?(?P<lng>{_NUMBER})', re.DOTALL)
+COORDS_CHUNK_ROWS = 50_000    # linhas da planilha lidas por vez
+SNIFF_ROWS = 5                # células não vazias olhadas para reconhecer uma coluna-par pelo conteúdo
+COORD_DECIMALS = 5            # mesma precisão do nome dos arquivos (places.make_csv_filename)
+
+def parse_latlng_cells(values: "pd.Series") -> "pd.DataFrame":
     """
-    Aceita string com um par 'lat, lng' (com/sem parênteses, vírgula ou ponto como decimal).
-    Ex.: '-23.5505, -46.6333' ou '-23,5505, -46,6333' ou '( -23.55 , -46.63 )'
-    Retorna (lat, lng) como float, ou None.
+    Extrai de uma vez o par 'lat, lng' de cada célula (com/sem parênteses,
+    vírgula ou ponto como decimal, texto depois do par).
+    Ex.: '-23.5505, -46.6333' ou '-23,5505, -46,6333' ou '( -23.55 , -46.63 ) (Centro)'
+    Retorna DataFrame latitude/longitude (float, NaN quando a célula não tem um par).
     """
-    if val is None:
-        return None
-    s = str(val).strip()
-    if not s:
-        return None
-    nums = re.findall(r'[-+]?\d+(?:[.,]\d+)?', s)
-    if len(nums) < 2:
-        return None
-
-    def to_float_pt(x):
-        x = x.strip()
-        # se tem vírgula e não tem ponto, trate vírgula como decimal
-        if ',' in x and '.' not in x:
-            x = x.replace(',', '.')
-        return float(x)
-
+    import pandas as pd
+
+    pairs = values.astype(str).str.extract(_PAIR_RE)
+    # cada número tem no máximo um separador decimal: vírgula vira ponto
+    return pd.DataFrame({"latitude": pd.to_numeric(pairs["lat"].str.replace(",", ".", regex=False)),
+                         "longitude": pd.to_numeric(pairs["lng"].str.replace(",", ".", regex=False))},
+                        index=values.index)
+
+def _excel_columns(header) -> list[str]:
+    """Cabeçalho como o pandas nomearia: vazio -> 'Unnamed: i', repetido -> 'nome.1'."""
+    columns, seen = [], {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == "" else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+def _iter_xlsx(path: str, chunk_rows: int):
+    """Primeira aba em modo read_only do openpyxl: as linhas vêm em streaming, sem montar a planilha inteira."""
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
     try:
-        lat = to_float_pt(nums[0])
-        lng = to_float_pt(nums[1])
-        return (lat, lng)
-    except Exception:
-        return None
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _excel_columns(header)
+        chunk, index = [], []
+        for i, row in enumerate(rows):
+            if all(v is None for v in row):
+                continue      # linhas vazias ficam de fora, mas o índice segue a numeração da planilha
+            chunk.append(row[:len(columns)])
+            index.append(i)
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=columns, index=index)
+                chunk, index = [], []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, index=index)
+    finally:
+        wb.close()
+
+def iter_coords_frames(path: str, chunk_rows: int = COORDS_CHUNK_ROWS):
+    """Lê CSV/Excel em blocos de até chunk_rows linhas (DataFrames com índice contínuo)."""
+    import pandas as pd
 
-def read_coords_table(path: str, pair_cols_filter: list[str] | None = None) -> pd.DataFrame:
-    """
-    Lê CSV/Excel e retorna um DF padronizado com:
-      latitude | longitude | name | source_col
-    Regras:
-      1) Se houver colunas separadas (lat/lng), usa direto.
-      2) Caso contrário, varre colunas que aparentam conter pares '(Lat, Long)'
-         (ex.: 'Centro da Cidade (Lat, Long)') e extrai TODAS as células preenchidas.
-    """
     ext = os.path.splitext(path)[1].lower()
-    if ext in (".xlsx", ".xls"):
-        # precisa de openpyxl instalado
-        df = pd.read_excel(path)
+    if ext == ".xlsx":
+        yield from _iter_xlsx(path, chunk_rows)
+    elif ext == ".xls":
+        # formato antigo: o openpyxl não lê, vai inteiro pelo pandas (precisa do xlrd)
+        yield pd.read_excel(path)
     else:
-        # tenta ; e cai para , se necessário
-        try:
-            df = pd.read_csv(path, sep=";", engine="python")
-        except Exception:
-            df = pd.read_csv(path, sep=",", engine="python")
+        # separador pelo cabeçalho: ';' (padrão do projeto) ou ','
+        with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+            sep = ";" if ";" in f.readline() else ","
+        yield from pd.read_csv(path, sep=sep, encoding="utf-8-sig", chunksize=chunk_rows)
 
-    # 1) tentar lat/lng separados
+def _coord_columns(df: "pd.DataFrame", pair_cols_filter: list[str] | None):
+    """
+    Decide, pelo primeiro bloco, de onde vêm as coordenadas:
+    (lat_col, lng_col, name_col, pair_cols).
+    """
     lower = {c.lower().strip(): c for c in df.columns}
     lat_col = next((lower[k] for k in lower if k in ("lat", "latitude")), None)
     lng_col = next((lower[k] for k in lower if k in ("lng", "long", "lon", "longitude")), None)
     name_col = next((lower[k] for k in lower if "nome" in k or "empreendimento" in k or "name" in k), None)
-
     if lat_col and lng_col:
-        cols = [lat_col, lng_col] + ([name_col] if name_col else [])
-        out = df[cols].copy()
-        out.columns = ["latitude", "longitude"] + (["name"] if name_col else [])
-        out["source_col"] = lat_col + " & " + lng_col
-        return out
+        return lat_col, lng_col, name_col, []
 
-    # 2) identificar colunas "par" (Lat, Long)
+    # colunas "par" (Lat, Long) pelo nome
     def looks_like_pair(colname: str) -> bool:
         cl = colname.lower()
         return ("lat" in cl and "long" in cl) or ("lat, long" in cl) or ("(lat" in cl and "long" in cl)
@@ -124,48 +163,329 @@ def read_coords_table(path: str, pair_cols_filter: list[str] | None = None) -> p
     if pair_cols_filter:
         pair_cols = [c for c in pair_cols if c in pair_cols_filter]
 
-    # fallback: detectar por conteúdo (duas ocorrências numéricas nas células)
+    # fallback: detectar por conteúdo (um par nas primeiras células preenchidas)
     if not pair_cols:
-        for c in df.columns:
-            sample = df[c].dropna().astype(str).head(5).tolist()
-            if any(len(re.findall(r'[-+]?\d+(?:[.,]\d+)?', s)) >= 2 for s in sample):
-                pair_cols.append(c)
-        pair_cols = [c for c in pair_cols if 'unnamed' not in c.lower()]
+        pair_cols = [c for c in df.columns if 'unnamed' not in c.lower()
+                     and parse_latlng_cells(df[c].dropna().head(SNIFF_ROWS))["longitude"].notna().any()]
+    return None, None, name_col, pair_cols
+
+def _extract_chunk(df: "pd.DataFrame", lat_col, lng_col, name_col, pair_cols) -> "pd.DataFrame":
+    """Bloco da planilha -> latitude | longitude | name | source_col | row (linha de dados, base 0)."""
+    import pandas as pd
+
+    names = df[name_col].astype(object).where(df[name_col].notna(), None) if name_col else None
+    if lat_col:
+        out = pd.DataFrame({
+            "latitude": pd.to_numeric(df[lat_col].astype(str).str.replace(",", ".", regex=False), errors="coerce"),
+            "longitude": pd.to_numeric(df[lng_col].astype(str).str.replace(",", ".", regex=False), errors="coerce"),
+            "name": names if names is not None else None,
+            "source_col": lat_col + " & " + lng_col,
+            "row": df.index,
+        })
+        return out.dropna(subset=["latitude", "longitude"])
+
+    # todas as células preenchidas das colunas-par, linha a linha (ordem da planilha)
+    cells = df[pair_cols].stack().dropna()
+    if cells.empty:
+        return pd.DataFrame(columns=["latitude", "longitude", "name", "source_col", "row"])
+    rows = cells.index.get_level_values(0)
+    out = parse_latlng_cells(cells.reset_index(drop=True))
+    out["name"] = names.reindex(rows).to_numpy() if names is not None else None
+    out["source_col"] = cells.index.get_level_values(1)
+    out["row"] = rows
+    return out.dropna(subset=["latitude", "longitude"])
+
+def dedupe_coords(coords: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Une coordenadas idênticas (na precisão dos nomes de arquivo) mantendo a
+    primeira ocorrência; `provenance` lista todas as origens ('nome — coluna (linha N)').
+    """
+    import numpy as np
+    import pandas as pd
+
+    key = pd.DataFrame({"lat": coords["latitude"].round(COORD_DECIMALS),
+                        "lng": coords["longitude"].round(COORD_DECIMALS)})
+    group = key.groupby(["lat", "lng"], sort=False).ngroup()     # numerados pela primeira ocorrência
+    label = coords["name"].fillna("").astype(str)
+    origin = (label.where(label == "", label + " — ") + coords["source_col"].astype(str)
+              + " (linha " + (coords["row"] + 2).astype(str) + ")")   # +2: cabeçalho e base 1, como na planilha
+    out = coords.loc[~group.duplicated()].drop(columns="row").reset_index(drop=True)
+    # origens agrupadas por ordenação estável (o groupby().agg(list) faz um laço Python por grupo)
+    ids = group.to_numpy()
+    order = np.argsort(ids, kind="stable")
+    bounds = np.flatnonzero(np.diff(ids[order])) + 1
+    out["provenance"] = [part.tolist() for part in np.split(origin.to_numpy()[order], bounds)]
+    out["name"] = out["name"].astype(object).where(out["name"].notna(), None)
+    return out
 
-    if not pair_cols:
-        raise ValueError(
-            f"Não encontrei colunas lat/lng nem colunas de par em {path}.\nColunas: {list(df.columns)}"
-        )
-
-    rows = []
-    name_col = name_col or next((c for c in df.columns if 'nome' in c.lower() or 'empreendimento' in c.lower()), None)
-    for _, r in df.iterrows():
-        base_name = r[name_col] if (name_col and name_col in r) else None
-        for c in pair_cols:
-            pair = _parse_latlng_cell(r.get(c))
-            if pair:
-                lat, lng = pair
-                rows.append({
-                    "latitude": lat,
-                    "longitude": lng,
-                    "name": base_name if pd.notna(base_name) else None,
-                    "source_col": c
-                })
-
-    if not rows:
-        raise ValueError(f"Não foi possível extrair nenhum par lat/lng a partir de {pair_cols}.")
-
-    return pd.DataFrame(rows, columns=["latitude", "longitude", "name", "source_col"])
+def read_coords_table(path: str, pair_cols_filter: list[str] | None = None,
+                      chunk_rows: int = COORDS_CHUNK_ROWS) -> "pd.DataFrame":
+    """
+    Lê CSV/Excel em blocos e retorna um DF padronizado com:
+      latitude | longitude | name | source_col | provenance
+    Regras:
+      1) Se houver colunas separadas (lat/lng), usa direto.
+      2) Caso contrário, varre colunas que aparentam conter pares '(Lat, Long)'
+         (ex.: 'Centro da Cidade (Lat, Long)') e extrai TODAS as células preenchidas.
+    Coordenadas repetidas viram uma linha só; `provenance` guarda de onde cada uma veio.
+    """
+    import pandas as pd
+
+    layout, parts = None, []
+    for chunk in iter_coords_frames(path, chunk_rows):
+        if layout is None:
+            layout = _coord_columns(chunk, pair_cols_filter)
+            if not layout[0] and not layout[3]:
+                raise ValueError(
+                    f"Não encontrei colunas lat/lng nem colunas de par em {path}.\nColunas: {list(chunk.columns)}"
+                )
+        parts.append(_extract_chunk(chunk, *layout))
+
+    coords = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    if coords.empty:
+        raise ValueError(f"Não foi possível extrair nenhum par lat/lng de {path}.")
+    return dedupe_coords(coords)
+
+# --------- jobs (coordenada × tipo) ----------
+def plan_jobs(df_coords: "pd.DataFrame", tipos: list[str]) -> list[dict]:
+    """
+    Lista os jobs na ordem original (coordenada, depois tipo). Coordenadas
+    repetidas na planilha geram o mesmo arquivo e entram uma vez só (as
+    origens de cada uma ficam em job["provenance"]).
+    """
+    jobs, seen = [], set()
+    for pos, row in enumerate(df_coords.to_dict("records")):
+        lat = float(row["latitude"])
+        lng = float(row["longitude"])
+        label = row.get("name") or row.get("source_col") or f"{lat},{lng}"
+        for t in tipos:
+            out_name = make_csv_filename(t, lat, lng)
+            if out_name in seen:
+                continue
+            seen.add(out_name)
+            jobs.append({"coord_pos": pos, "label": label, "lat": lat, "lng": lng,
+                         "type": t, "out_name": out_name, "provenance": row.get("provenance") or []})
+    return jobs
+
+def find_existing(out_name: str) -> str | None:
+    # consulta o catálogo (system/cache/results_manifest.sqlite) em vez de varrer a árvore
+    from results_manifest import get_manifest
+    return get_manifest().find_path(out_name)
+
+def _from_index(job: dict, ctx: dict) -> str | None:
+    """Grava o resultado a partir do índice local se ele cobrir o ponto com dados frescos."""
+    from places import get_city_state, save_results
+    from places_index import rows_for_csv, fetched_at
+
+    index = ctx.get("index")
+    if index is None:
+        return None
+    nearest, coverage = index.answer(job["lat"], job["lng"], job["type"])
+    if not (coverage["covered"] and coverage["fresh"]) or not len(nearest):
+        return None
+    # município do ponto consultado, como numa busca pela API (não o da busca de origem das linhas)
+    city_state = get_city_state(job["lat"], job["lng"], ctx["api_key"])
+    return save_results(rows_for_csv(nearest, job["type"], city_state), job["type"], job["lat"], job["lng"],
+                        city_state, fetched_at=fetched_at(nearest))
+
+def _from_leader(job: dict, ctx: dict):
+    """
+    Para um ponto seguidor (ver overlap_planner): grava os resultados do líder
+    reordenados pela distância. Retorna o caminho, EMPTY se o líder não teve
+    resultados, ou None se o líder não tem resultado utilizável (vai para a API).
+    """
+    from places import get_city_state, save_results
+    from overlap_planner import rows_from_leader
+
+    leader = job.get("leader")
+    if not leader:
+        return None
+    leader_path = find_existing(leader)
+    if leader_path:
+        # município do seguidor: perto de divisas ele pode ser outro que o do líder
+        city_state = get_city_state(job["lat"], job["lng"], ctx["api_key"])
+        return save_results(rows_from_leader(leader_path, job["lat"], job["lng"], city_state),
+                            job["type"], job["lat"], job["lng"], city_state, fetched_at=os.path.getmtime(leader_path))
+    if ctx["journal"].states([leader]).get(leader) == EMPTY:
+        return EMPTY
+    return None
+
+def run_job(job: dict, ctx: dict) -> str:
+    """
+    Executa um job, registrando running -> succeeded/empty/failed no journal,
+    e devolve o texto de status ('ok -> ...', 'sem retorno' ou 'ERRO: ...').
+    Com orçamento, o job reserva o seu pior caso antes de começar; se não
+    couber, fica pendente no journal ('adiado').
+    """
+    from preflight import job_cost
+
+    budget = ctx.get("budget")
+    fan_in = ctx.get("fan_in")
+    if budget is not None and fan_in is not None and job["estimate"]["source"] == "api":
+        # no fan-in, o job que faz as buscas do ponto reserva o ponto inteiro (todas as tipologias dele),
+        # segurando o lock do ponto: os demais esperam e depois rodam sem reservar nada
+        with fan_in.point_lock(job):
+            if fan_in.needs_search(job):
+                cost = sum(job_cost(j["estimate"], worst=True) for j in fan_in.point_jobs(job))
+                if not budget.reserve(cost):
+                    return "adiado (orçamento esgotado)"
+                try:
+                    return _run_job(job, ctx)
+                finally:
+                    budget.release(cost)
+        return _run_job(job, ctx)
+    cost = job_cost(job["estimate"], worst=True) if budget is not None else 0.0
+    if cost and not budget.reserve(cost):
+        return "adiado (orçamento esgotado)"
+    try:
+        return _run_job(job, ctx)
+    finally:
+        if cost:
+            budget.release(cost)
+
+def _run_job(job: dict, ctx: dict) -> str:
+    from places import search_places
+    from regions import infer_region_from_csv, region_from_point, move_to_region_folder
+    import results_store
+
+    lat, lng, t = job["lat"], job["lng"], job["type"]
+    api_key, journal = ctx["api_key"], ctx["journal"]
+    journal.start(job["out_name"])
+    try:
+        saved_path, source = _from_leader(job, ctx), "vizinho"
+        if saved_path == EMPTY:
+            journal.finish(job["out_name"], EMPTY)
+            return "sem retorno (vizinho)"
+        if not saved_path:
+            saved_path, source = _from_index(job, ctx), "índice"
+        if not saved_path and ctx.get("fan_in") is not None:
+            source = "fan-in"
+            saved_path = ctx["fan_in"].path_for(job)
+        elif not saved_path:
+            source = "api"
+            saved_path = search_places(lat, lng, t, api_key=api_key, details_workers=ctx["details_workers"],
+                                       lite=ctx["lite"])
+        if not saved_path:
+            journal.finish(job["out_name"], EMPTY)
+            return "sem retorno"
+        # UF e Região pela coordenada (resolver offline); o CSV fica como reserva
+        uf, region = region_from_point(lat, lng, api_key)
+        if not region:
+            uf, region = infer_region_from_csv(saved_path)
+        with get_metrics().stage("region_move"):
+            final_path = move_to_region_folder(saved_path, region) if region else saved_path
+        if ctx.get("parquet"):
+            results_store.append_csv(final_path, region)
+        journal.finish(job["out_name"], SUCCEEDED, final_path)
+        if region:
+            return f"ok ({source}) -> {os.path.basename(final_path)}  [{uf or '-'} / {region}]"
+        return f"ok ({source}) -> {os.path.basename(final_path)}  [região não identificada]"
+    except Exception as e:
+        journal.finish(job["out_name"], FAILED, error=f"{type(e).__name__}: {e}")
+        return f"ERRO: {e}"
+
+def _skip_if_existing(job: dict, ctx: dict) -> bool:
+    existing = find_existing(job["out_name"]) if ctx["skip_existing"] else None
+    if not existing:
+        return False
+    ctx["journal"].finish(job["out_name"], SUCCEEDED, existing)
+    print(f"  [skip] {job['out_name']} já existe em {os.path.relpath(existing, RESULTS_DIR)}")
+    return True
+
+def _progress(ctx: dict) -> str:
+    info = ctx["journal"].progress(ctx["run_id"], ctx["workers"])
+    return f"{info['done']}/{info['total']}, ETA {format_eta(info['eta_s'])}"
+
+def _run_serial(jobs, total_rows, ctx):
+    current = None
+    for job in jobs:
+        if ctx["budget"] is not None and ctx["budget"].exhausted:
+            if ctx["fan_in"] is None:
+                break
+            if ctx["fan_in"].needs_search(job):
+                continue      # ponto sem busca: fica pendente; os de pontos já buscados ainda gravam
+        if job["coord_pos"] != current:
+            current = job["coord_pos"]
+            also = len(job["provenance"]) - 1
+            print(f"\n▶ Coordenada {current+1}/{total_rows}: {job['label']} ({job['lat']}, {job['lng']})"
+                  + (f" (+{also} origens na planilha)" if also > 0 else "") + f"  [{_progress(ctx)}]")
+
+        if _skip_if_existing(job, ctx):
+            continue
+
+        print(f"  [go ] {job['type']} .", end="", flush=True)
+        print(f" {run_job(job, ctx)}")
+
+        if ctx["sleep_sec"] > 0:
+            time.sleep(ctx["sleep_sec"])
+
+def _run_parallel(jobs, ctx):
+    """
+    Distribui os jobs num pool de `workers` threads. O ritmo global de
+    chamadas continua sendo o do limitador de QPS (compartilhado no processo).
+    """
+    import transport
+
+    workers = ctx["workers"]
+    pending = [job for job in jobs if not _skip_if_existing(job, ctx)]
+    print(f"Jobs a executar: {len(pending)} (de {len(jobs)}), {workers} workers em paralelo")
+    # seguidores dependem do resultado do líder: rodam depois, já sem chamar a API
+    followers = [job for job in pending if job.get("leader")]
+    pending = [job for job in pending if not job.get("leader")]
+
+    # cada job abre até details_workers conexões; o pool HTTP precisa comportar todas
+    transport.configure_pool(max(transport.POOL_SIZE, workers * max(1, ctx["details_workers"])))
+
+    def work(job):
+        status = run_job(job, ctx)
+        if ctx["sleep_sec"] > 0:
+            time.sleep(ctx["sleep_sec"])
+        return status
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(work, job): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            print(f"  [{_progress(ctx)}] {job['type']} @ ({job['lat']}, {job['lng']}): {future.result()}",
+                  flush=True)
+    for job in followers:
+        print(f"  [{_progress(ctx)}] {job['type']} @ ({job['lat']}, {job['lng']}): {run_job(job, ctx)}",
+              flush=True)
 
 # --------- runner principal ----------
 def run_batch(input_path: str, sleep_sec: float, max_rows: int | None,
               types_csv: str | None, skip_existing: bool,
-              pair_cols: list[str] | None):
-
+              pair_cols: list[str] | None,
+              details_workers: int | None = None,
+              qps: str | None = None,
+              workers: int = 1,
+              resume: bool = False,
+              retry_failed: bool = False,
+              parquet: bool = False,
+              from_index: bool = False,
+              overlap_km: float = 0.0,
+              profile: bool = False,
+              dry_run: bool = False,
+              budget: float | None = None,
+              priority: str | None = None,
+              lite: bool = False,
+              fan_in: bool = False):
+    from places import get_api_key, DETAILS_WORKERS
+    from places_index import get_places_index
+    from overlap_planner import assign_leaders, format_report
+    from fan_in import FanIn
+    from preflight import Budget, estimate_jobs, fits_budget, format_summary, order_by_priority, summarize
+    import results_store
+
+    if details_workers is None:
+        details_workers = DETAILS_WORKERS
     os.makedirs(RESULTS_DIR, exist_ok=True)
+    rate_limit.configure(qps)
+    if parquet:
+        results_store.require_pyarrow()
 
     api_key = get_api_key()
-    if not api_key:
+    if not api_key and not dry_run:
         raise SystemExit("API Key não encontrada em system/api_key.txt")
 
     # lê a planilha (suporta colunas-par '(Lat, Long)' e lat/lng separados)
@@ -176,55 +496,142 @@ def run_batch(input_path: str, sleep_sec: float, max_rows: int | None,
     print(f"Tipos a processar ({len(tipos)}): {', '.join(tipos)}")
 
     total_rows = len(df_coords) if max_rows is None else min(max_rows, len(df_coords))
-    print(f"Coordenadas a processar: {total_rows} (de {len(df_coords)} extraídas)")
-
-    for i, row in df_coords.head(total_rows).iterrows():
-        lat = float(row["latitude"])
-        lng = float(row["longitude"])
-        label = row.get("name") or row.get("source_col") or f"{lat},{lng}"
-        print(f"\n▶ Coordenada {i+1}/{total_rows}: {label} ({lat}, {lng})")
-
-        for t in tipos:
-            out_name = make_csv_filename(t, lat, lng)
-            existing = glob(os.path.join(RESULTS_DIR, "**", out_name), recursive=True)
-            if skip_existing and existing:
-                print(f"  [skip] {out_name} já existe em {os.path.relpath(existing[0], RESULTS_DIR)}")
-                continue
-
-            print(f"  [go ] {t} .", end="", flush=True)
-            try:
-                saved_path = search_places(lat, lng, t, api_key=api_key)
-                if saved_path:
-                    # tenta descobrir UF e Região a partir do CSV
-                    uf, region = infer_region_from_csv(saved_path)
-                    if region:
-                        new_path = move_to_region_folder(saved_path, region)
-                        print(f" ok -> {os.path.basename(new_path)}  [{uf or '-'} / {region}]")
-                    else:
-                        print(f" ok -> {os.path.basename(saved_path)}  [região não identificada]")
-                else:
-                    print(" sem retorno")
-            except Exception as e:
-                print(f" ERRO: {e}")
-
-            if sleep_sec > 0:
-                time.sleep(sleep_sec)
-
+    repeated = int(df_coords["provenance"].map(len).sum()) - len(df_coords)
+    print(f"Coordenadas a processar: {total_rows} (de {len(df_coords)} extraídas"
+          + (f"; {repeated} repetidas na planilha unidas)" if repeated else ")"))
+
+    jobs = plan_jobs(df_coords.head(total_rows), tipos)
+    if overlap_km > 0:
+        print(format_report(assign_leaders(jobs, overlap_km), len(jobs)))
+
+    # journal: com --resume/--retry-failed, jobs já concluídos (inclusive vazios) ficam de fora
+    journal = JobJournal()
+    if resume or retry_failed:
+        finished = {SUCCEEDED, EMPTY} if retry_failed else set(DONE_STATES)
+        known = journal.states(j["out_name"] for j in jobs)
+        before = len(jobs)
+        jobs = [j for j in jobs if known.get(j["out_name"]) not in finished]
+        print(f"Retomando pelo journal: {before - len(jobs)} jobs já concluídos, {len(jobs)} restantes")
+
+    # estimativa de chamadas/custo (--dry-run) e ordem por prioridade no modo com orçamento
+    if dry_run or budget:
+        estimate_jobs(jobs, skip_existing, from_index, find_existing, lite=lite, fan_in=fan_in)
+        summary = summarize(jobs)
+        print(format_summary(summary))
+        if budget:
+            jobs = order_by_priority(jobs, resolve_types(priority, interest_zones) if priority else tipos)
+            print(f"Orçamento US$ {budget:.2f}: ~{fits_budget(jobs, budget)} de {len(jobs)} jobs cabem "
+                  f"pelo custo esperado, na ordem de prioridade")
+        if dry_run:
+            return summary
+
+    run_id = journal.new_run(input_path, tipos, workers)
+    journal.plan(run_id, jobs)
+    print(f"Execução {run_id} (journal em {journal.path})")
+    metrics = get_metrics()
+    if profile:
+        metrics.enable_profiling(os.path.join(METRICS_DIR, f"profile_{run_id}"))
+    started = time.time()
+
+    ctx = {"api_key": api_key, "details_workers": details_workers, "journal": journal, "run_id": run_id,
+           "skip_existing": skip_existing, "sleep_sec": sleep_sec, "workers": max(1, workers),
+           "parquet": parquet, "index": None, "budget": Budget(budget) if budget else None, "lite": lite,
+           "fan_in": None}
+    if fan_in:
+        # o fan-in de cada coordenada cobre as tipologias que vão à API (sem arquivo e sem líder)
+        ctx["fan_in"] = FanIn([j for j in jobs if not j.get("leader")
+                               and not (skip_existing and find_existing(j["out_name"]))],
+                              api_key, details_workers, lite)
+    if from_index:
+        # o índice é montado uma vez; os CSVs gravados nesta execução não entram nele
+        ctx["index"] = get_places_index()
+        print(f"Índice local carregado: {len(ctx['index'].types())} tipos")
+    if workers <= 1:
+        _run_serial(jobs, total_rows, ctx)
+    else:
+        _run_parallel(jobs, ctx)
+    journal.finish_run(run_id)
+
+    info = journal.progress(run_id)
+    print(f"\nJobs: {info['counts']}")
+    for endpoint, info_qps in rate_limit.snapshot().items():
+        print(f"  [qps] {endpoint}: {info_qps['calls']} chamadas, {info_qps['throttled']} throttles, "
+              f"taxa final {info_qps['current_qps']}/{info_qps['max_qps']} req/s")
+    summary_path = metrics.write_summary(
+        os.path.join(METRICS_DIR, f"batch_{run_id}.json"),
+        extra={"run_id": run_id, "input": input_path, "types": tipos, "workers": workers,
+               "elapsed_s": round(time.time() - started, 1), "jobs": info["counts"],
+               "fan_in": ctx["fan_in"].summary() if fan_in else None})
+    if ctx["budget"] is not None:
+        pending = info["counts"].get(PLANNED, 0)
+        print(f"Orçamento: {ctx['budget']} gastos" + (
+            f"; esgotado com {pending} jobs pendentes (continue com --resume e um novo --budget)"
+            if ctx["budget"].exhausted else ""))
+    if fan_in:
+        print(ctx["fan_in"].format_summary())
+    for name, stage in metrics.summary()["stages"].items():
+        print(f"  [etapa] {name}: {stage['count']}x, total {stage['total_s']}s, "
+              f"p50 {stage['p50_ms']}ms, p95 {stage['p95_ms']}ms")
+    print(f"Métricas em {summary_path}")
+    for path in metrics.dump_profiles():
+        print(f"  [perfil] {path}")
     print("\n✅ Finalizado. Planilhas em:", os.path.abspath(RESULTS_DIR))
 
 # --------- CLI ---------
 if __name__ == "__main__":
+    from setup import init_console
+    from places import DETAILS_WORKERS
+    from overlap_planner import DEFAULT_TOLERANCE_KM
+
+    init_console()
     p = argparse.ArgumentParser(description="Runner para testar search_places em lote (todas as tipologias).")
     p.add_argument("-f", "--file", "--input", dest="input",
                    default=os.path.join("input", "Coordenadas_API_novastipologias (1).xlsx"),
                    help="Planilha com coordenadas (CSV ; ou Excel).")
-    p.add_argument("--sleep", type=float, default=0.3, help="Pausa entre chamadas (segundos).")
+    p.add_argument("--sleep", type=float, default=0.0,
+                   help="Pausa extra entre jobs (segundos). Normalmente desnecessária: o ritmo é dado pelo limitador de QPS.")
+    p.add_argument("--qps", type=str, default=None,
+                   help="Teto de requisições/s por endpoint (ex.: 'nearby=10,details=25,geocode=25,distance_matrix=10').")
     p.add_argument("--max-rows", type=int, default=None, help="Limitar número de coordenadas processadas.")
     p.add_argument("--types", type=str, default=None,
                    help="Filtrar tipos (ex.: 'school,hospital,restaurant'). Aceita rótulos do setup (ex.: 'cinema').")
     p.add_argument("--no-skip", action="store_true", help="Não pular arquivos já existentes.")
     p.add_argument("--pair-cols", type=str, default=None,
                    help="Restrinja às colunas-par informadas (ex.: \"Centro da Cidade (Lat, Long),'Bairro Estratégico (Lat, Long)'\").")
+    p.add_argument("--details-workers", type=int, default=DETAILS_WORKERS,
+                   help=f"Chamadas de Place Details simultâneas por busca (padrão: {DETAILS_WORKERS}).")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Jobs (coordenada × tipo) executados em paralelo (padrão: 1, serial).")
+    p.add_argument("--resume", action="store_true",
+                   help="Retoma pelo journal (system/jobs.sqlite): pula jobs concluídos, vazios ou com falha.")
+    p.add_argument("--retry-failed", action="store_true",
+                   help="Como --resume, mas executa de novo os jobs que falharam.")
+    p.add_argument("--parquet", action="store_true",
+                   help="Também grava cada resultado no store Parquet (system/store/results, requer pyarrow).")
+    p.add_argument("--from-index", action="store_true",
+                   help="Responde pelo índice local (places_index.py) os jobs cujos pontos já estão cobertos "
+                        "por buscas recentes, sem chamar a API.")
+    p.add_argument("--lite", action="store_true",
+                   help="Não chama o Place Details: grava nome, local, tipos e status (open_now da Nearby Search), "
+                        "com enriched=False; os horários vêm depois com 'python enrichment.py backfill'.")
+    p.add_argument("--fan-in", action="store_true",
+                   help="Uma Nearby Search por tipologia com filtro próprio e uma busca ampla por coordenada, "
+                        "classificada localmente nas tipologias sem filtro na API (hotel, shop, ...); "
+                        "veja fan_in.py e 'python fan_in.py coverage'.")
+    p.add_argument("--dry-run", action="store_true",
+                   help="Só estima chamadas e custo por endpoint (skip, journal, índice e cache considerados) e sai.")
+    p.add_argument("--budget", type=float, default=None,
+                   help="Limite de gasto em US$ (preços em preflight.py): ordena os jobs por prioridade e para "
+                        "antes de estourar; os restantes ficam pendentes para --resume.")
+    p.add_argument("--priority", type=str, default=None,
+                   help="Ordem dos tipos no modo --budget (ex.: 'hospital,school'); padrão: a ordem de --types.")
+    p.add_argument("--profile", action="store_true",
+                   help="Roda cada etapa (geocode, nearby, details, csv_write, region_move) sob cProfile e grava "
+                        "um .prof por etapa em system/metrics/profile_<execução>/ (use com --workers 1).")
+    p.add_argument("--overlap-km", type=float, nargs="?", const=DEFAULT_TOLERANCE_KM, default=0.0,
+                   help="Agrupa coordenadas a até N km (padrão do flag sem valor: "
+                        f"{DEFAULT_TOLERANCE_KM}) e responde os pontos vizinhos com os resultados "
+                        "do primeiro do grupo, reordenados por distância.")
     args = p.parse_args()
 
     pair_cols = None
@@ -238,5 +645,19 @@ if __name__ == "__main__":
         max_rows=args.max_rows,
         types_csv=args.types,
         skip_existing=not args.no_skip,
-        pair_cols=pair_cols
+        pair_cols=pair_cols,
+        details_workers=args.details_workers,
+        qps=args.qps,
+        workers=args.workers,
+        resume=args.resume,
+        retry_failed=args.retry_failed,
+        parquet=args.parquet,
+        from_index=args.from_index,
+        overlap_km=args.overlap_km,
+        profile=args.profile,
+        dry_run=args.dry_run,
+        budget=args.budget,
+        priority=args.priority,
+        lite=args.lite,
+        fan_in=args.fan_in
     )
@@ -0,0 +1,370 @@
+# Benchmark offline dos pipelines contra a imitação local da API
+# (maps_standin.py): mede search_places, batch_runner.run_batch e
+# routesMatrix sem gastar cota. Para cada etapa reporta jobs/s, chamadas por
+# job (por endpoint), latência p50/p95 dos jobs e das chamadas HTTP e o pico
+# de memória Python (tracemalloc).
+#
+# Tudo roda numa pasta temporária (system/, input/, output/ próprios): os
+# resultados, caches e o journal de verdade não são tocados.
+#
+# Com --startup, mede o tempo de importação de cada ponto de entrada num
+# interpretador novo (descontado o do interpretador vazio), rodando numa
+# pasta vazia e sem chave: importar não pode ler arquivos nem criar o cliente
+# da API. Compara com STARTUP_BUDGET_MS e sai com erro se algum estourar.
+#
+# Uso pela linha de comando:
+#   python benchmark.py [--stages search,batch,matrix] [--jobs 40] [--workers 4]
+#                       [--types restaurant,school] [--latency-ms 80] [--jitter-ms 40]
+#                       [--error-rate 0.01] [--oql-rate 0.02] [--qps "nearby=50,details=100"]
+#                       [--json saida.json] [--keep]
+#   python benchmark.py --startup [--runs 5] [--json saida.json]
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import subprocess
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import transport
+import rate_limit
+from maps_standin import MapsStandIn, load_fixtures, NEARBY_RESULTS
+
+STAGES = ("search", "batch", "matrix")
+BENCH_KEY = "AIzaSyBENCHMARK-maps-standin"   # o cliente googlemaps exige o prefixo AIza
+DEFAULT_JOBS = 40
+DEFAULT_WORKERS = 4
+DEFAULT_TYPES = "restaurant,school,hospital"
+
+# código importado por ponto de entrada; "main web" inclui o que run_web carrega antes do app.run
+STARTUP_ENTRY_POINTS = {
+    "main": "import main",
+    "main web": "import main, search_jobs, result_cache, enrichment",
+    "batch_runner": "import batch_runner",
+    "routes_matrix": "import routes_matrix",
+}
+# teto (ms) do tempo de importação acima do interpretador vazio (melhor de --runs execuções).
+# Medido aqui, com ruído: main 105-175, main web 155-215, batch_runner 8-32, routes_matrix 5-19.
+# O pandas sozinho custa ~300ms: se ele (ou o cliente da API) voltar ao topo de um desses
+# módulos, o teto estoura
+STARTUP_BUDGET_MS = {
+    "main": 200,
+    "main web": 300,
+    "batch_runner": 50,
+    "routes_matrix": 50,
+}
+STARTUP_RUNS = 5
+
+
+class CallRecorder:
+    """Latência (s) de cada resposta HTTP, por endpoint, via hook da Session compartilhada."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+
+    def hook(self, response, *args, **kwargs):
+        endpoint = transport.endpoint_for_url(response.url) or "other"
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(response.elapsed.total_seconds())
+
+    def take(self) -> dict:
+        with self._lock:
+            out, self.latencies = self.latencies, {}
+        return out
+
+
+def _percentiles(values) -> dict:
+    if not len(values):
+        return {"p50_ms": None, "p95_ms": None}
+    p50, p95 = np.percentile(np.asarray(values, dtype=float) * 1000, [50, 95])
+    return {"p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1)}
+
+def _calls_delta(before: dict, after: dict) -> dict:
+    return {name: {k: after[name][k] - before[name][k] for k in after[name]}
+            for name in after if after[name]["calls"] - before[name]["calls"]}
+
+
+def _prepare_workdir(source_dir: str) -> str:
+    """Pasta temporária com a estrutura esperada pelo projeto e a chave de teste."""
+    workdir = tempfile.mkdtemp(prefix="hab_bench_")
+    for folder in ("system", "input", "output"):
+        os.makedirs(os.path.join(workdir, folder), exist_ok=True)
+    municipios = os.path.join(source_dir, "system", "municipios.csv")
+    if os.path.exists(municipios):
+        shutil.copy2(municipios, os.path.join(workdir, "system", "municipios.csv"))
+    with open(os.path.join(workdir, "system", "api_key.txt"), "w") as f:
+        f.write(BENCH_KEY)
+    return workdir
+
+def _reset_local_state():
+    """
+    Fecha os caches/catálogos do processo (presos a caminhos relativos a system/):
+    chamada ao trocar de pasta, para que nada aberto numa pasta seja gravado na
+    outra, nem no fim do processo, depois que a pasta de trabalho foi apagada.
+    """
+    from details_cache import reset_details_cache
+    from municipios import reset_resolver
+    from places_index import reset_places_index
+    from results_manifest import reset_manifest
+
+    reset_places_index()
+    reset_details_cache()
+    reset_manifest()
+    reset_resolver()
+
+def _sample_jobs(fixtures, types: list[str], n: int, seed: int) -> list[tuple]:
+    """n pontos (lat, lng, tipo) sorteados entre as origens das buscas guardadas dos tipos pedidos."""
+    pool = [o for o in fixtures.origins if o[2] in types] or list(fixtures.origins)
+    rng = random.Random(seed)
+    return [rng.choice(pool) for _ in range(n)] if len(pool) < n else rng.sample(pool, n)
+
+
+# ---------- etapas ----------
+def stage_search(jobs: list[tuple], workers: int) -> list[float]:
+    from places import search_places
+
+    def one(job):
+        start = time.perf_counter()
+        search_places(job[0], job[1], job[2], api_key=BENCH_KEY)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(one, jobs))
+
+def stage_batch(jobs: list[tuple], workers: int, types: list[str], qps: str | None) -> tuple[int, list[float]]:
+    from batch_runner import run_batch
+    from job_journal import JOURNAL_PATH
+
+    n_coords = max(1, len(jobs) // max(1, len(types)))
+    coords = pd.DataFrame([(lat, lng, f"bench_{i}") for i, (lat, lng, _) in enumerate(jobs[:n_coords])],
+                          columns=["latitude", "longitude", "name"])
+    input_path = os.path.join("input", "bench_coords.csv")
+    coords.to_csv(input_path, sep=";", index=False)
+    run_batch(input_path=input_path, sleep_sec=0.0, max_rows=None, types_csv=",".join(types),
+              skip_existing=False, pair_cols=None, qps=qps, workers=workers)
+    with sqlite3.connect(JOURNAL_PATH) as conn:
+        durations = [row[0] for row in conn.execute(
+            "SELECT finished_at - started_at FROM jobs WHERE started_at IS NOT NULL AND finished_at IS NOT NULL")]
+    return len(durations), durations
+
+def stage_matrix(fixtures, jobs: list[tuple], workers: int) -> int:
+    """Gera um arquivo de entrada do routesMatrix por job (os 20 lugares mais próximos) e roda a matriz."""
+    for i, (lat, lng, search_type) in enumerate(jobs):
+        entry = fixtures.places.get(search_type)
+        if entry is None:
+            continue
+        df, grid = entry
+        idx, _ = grid.nearest(lat, lng, k=NEARBY_RESULTS)
+        places = df.iloc[idx]
+        out = pd.DataFrame({
+            "nome": places["name"].to_numpy(),
+            "search_type": search_type,
+            "coordenada_do_local": [f"{{'lat': {a}, 'lng': {b}}}" for a, b in zip(places["_lat"], places["_lng"])],
+        })
+        out.to_csv(os.path.join("system", f"{i}&bench_{i}&{lat}+{lng}&.csv"), sep=";")
+    from routes_matrix import routesMatrix
+    routesMatrix(file_workers=workers, chunk_workers=2 * workers)
+    return len([f for f in os.listdir("system") if f.endswith("MATRIX_APPLIED.csv")])
+
+
+def run_benchmark(stages=STAGES, n_jobs: int = DEFAULT_JOBS, workers: int = DEFAULT_WORKERS,
+                  types: str = DEFAULT_TYPES, qps: str | None = None, seed: int = 42, keep: bool = False,
+                  **faults) -> dict:
+    """Roda as etapas pedidas contra a imitação local e devolve o relatório (dict)."""
+    source_dir = os.getcwd()
+    print("Carregando fixtures de system/results...")
+    fixtures = load_fixtures()
+    type_list = [t.strip() for t in types.split(",") if t.strip()]
+    jobs = _sample_jobs(fixtures, type_list, n_jobs, seed)
+    print(f"{len(fixtures)} lugares em {len(fixtures.places)} tipos; {len(jobs)} jobs por etapa")
+
+    standin = MapsStandIn(fixtures, seed=seed, **faults).start()
+    transport.BASE_URL = standin.base_url
+    recorder = CallRecorder()
+    transport.get_session().hooks["response"].append(recorder.hook)
+    workdir = _prepare_workdir(source_dir)
+    if source_dir not in sys.path:
+        sys.path.insert(0, source_dir)   # os módulos do projeto continuam importáveis depois do chdir
+    _reset_local_state()
+    os.chdir(workdir)
+    report = {"config": {"jobs": len(jobs), "workers": workers, "types": type_list, "qps": qps, **faults},
+              "stages": {}}
+    tracemalloc.start()
+    try:
+        for stage in stages:
+            rate_limit.reset()
+            rate_limit.configure(qps)
+            recorder.take()
+            before = standin.state.snapshot()
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+            if stage == "search":
+                durations = stage_search(jobs, workers)
+                done = len(durations)
+            elif stage == "batch":
+                done, durations = stage_batch(jobs, workers, type_list, qps)
+            elif stage == "matrix":
+                done, durations = stage_matrix(fixtures, jobs, workers), []
+            else:
+                raise ValueError(f"etapa desconhecida: {stage} (use {', '.join(STAGES)})")
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            calls = _calls_delta(before, standin.state.snapshot())
+            total_calls = sum(c["calls"] for c in calls.values())
+            latencies = recorder.take()
+            report["stages"][stage] = {
+                "jobs": done,
+                "seconds": round(elapsed, 3),
+                "jobs_per_s": round(done / elapsed, 3) if elapsed else None,
+                "calls_per_job": round(total_calls / done, 2) if done else None,
+                "job_latency": _percentiles(durations),
+                "calls": {name: {**c, "per_job": round(c["calls"] / done, 2) if done else None,
+                                 **_percentiles(latencies.get(name, []))}
+                          for name, c in calls.items()},
+                "peak_mem_mb": round(peak / 2**20, 1),
+            }
+    finally:
+        tracemalloc.stop()
+        _reset_local_state()
+        os.chdir(source_dir)
+        standin.stop()
+        if keep:
+            print(f"Pasta de trabalho mantida em {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def _ms(value) -> str:
+    return "-" if value is None else f"{value}ms"
+
+# ---------- tempo de inicialização ----------
+def _python(code: str, source_dir: str, workdir: str, importtime: bool = False) -> tuple[float, str]:
+    """Roda `code` num interpretador novo; devolve (segundos, stderr)."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [source_dir, os.environ.get("PYTHONPATH")]))}
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode:
+        raise RuntimeError(f"{code!r} falhou:\n{proc.stderr[-2000:]}")
+    return elapsed, proc.stderr
+
+def _direct_imports(stderr: str, skip: set) -> dict:
+    """
+    Tempo cumulativo (ms) dos módulos importados pelos pontos de entrada (um
+    nível abaixo deles), pela saída do -X importtime. `skip`: módulos do
+    interpretador vazio (site etc.).
+    """
+    out, children = {}, {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue   # cabeçalho da tabela
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        ms = round(int(cumulative) / 1000, 1)
+        # o -X importtime lista os filhos antes do pai
+        if depth == 1:
+            children[name.strip()] = ms
+        elif depth == 0:
+            if name.strip() not in skip:
+                out.update(children)
+            children = {}
+    return dict(sorted(out.items(), key=lambda item: -item[1]))
+
+def measure_startup(runs: int = STARTUP_RUNS, entry_points: dict = STARTUP_ENTRY_POINTS,
+                    budgets: dict = STARTUP_BUDGET_MS) -> dict:
+    """Tempo de importação (ms) de cada ponto de entrada, os maiores módulos e se cabe no teto."""
+    source_dir = os.path.abspath(os.getcwd())
+    workdir = tempfile.mkdtemp(prefix="hab_startup_")   # sem system/: importar não pode depender da chave
+    try:
+        baseline = min(_python("pass", source_dir, workdir)[0] for _ in range(runs))
+        skip = {line.split("|")[2].strip() for line in _python("pass", source_dir, workdir, importtime=True)[1].splitlines()
+                if line.count("|") == 2}
+        report = {"baseline_ms": round(baseline * 1000, 1), "runs": runs, "entry_points": {}}
+        for name, code in entry_points.items():
+            best = min(_python(code, source_dir, workdir)[0] for _ in range(runs))
+            import_ms = round((best - baseline) * 1000, 1)
+            modules = _direct_imports(_python(code, source_dir, workdir, importtime=True)[1], skip)
+            budget = budgets.get(name)
+            report["entry_points"][name] = {
+                "import_ms": import_ms, "budget_ms": budget,
+                "ok": budget is None or import_ms <= budget,
+                "top_modules_ms": dict(list(modules.items())[:5]),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def format_startup(report: dict) -> str:
+    lines = [f"Interpretador vazio: {report['baseline_ms']}ms (melhor de {report['runs']})"]
+    for name, r in report["entry_points"].items():
+        top = ", ".join(f"{m} {ms}ms" for m, ms in r["top_modules_ms"].items())
+        lines.append(f"  {name:<14} {r['import_ms']:>7}ms (teto {r['budget_ms']}ms) "
+                     f"{'ok' if r['ok'] else 'ESTOUROU'}  [{top}]")
+    return "\n".join(lines)
+
+def format_report(report: dict) -> str:
+    lines = []
+    for stage, r in report["stages"].items():
+        lat = r["job_latency"]
+        lines.append(f"[{stage}] {r['jobs']} jobs em {r['seconds']}s -> {r['jobs_per_s']} jobs/s, "
+                     f"{r['calls_per_job']} chamadas/job, job p50={_ms(lat['p50_ms'])} p95={_ms(lat['p95_ms'])}, "
+                     f"pico de memória {r['peak_mem_mb']} MB")
+        for name, c in r["calls"].items():
+            lines.append(f"    {name:<16} {c['calls']:>6} chamadas ({c['per_job']}/job), "
+                         f"{c['errors']} erros, {c['over_query_limit']} OQL, "
+                         f"p50={_ms(c['p50_ms'])} p95={_ms(c['p95_ms'])}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Benchmark offline dos pipelines contra a imitação local da API.")
+    p.add_argument("--stages", default=",".join(STAGES), help=f"Etapas separadas por vírgula ({', '.join(STAGES)}).")
+    p.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Jobs (coordenada × tipo) por etapa.")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    p.add_argument("--types", default=DEFAULT_TYPES, help="Tipos sorteados para os jobs.")
+    p.add_argument("--qps", default=None, help="Tetos do limitador (formato do --qps do batch_runner).")
+    p.add_argument("--latency-ms", type=float, default=50.0)
+    p.add_argument("--jitter-ms", type=float, default=25.0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--oql-rate", type=float, default=0.0)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--json", dest="json_path", default=None, help="Também grava o relatório em JSON.")
+    p.add_argument("--keep", action="store_true", help="Não apaga a pasta temporária de trabalho.")
+    p.add_argument("--startup", action="store_true",
+                   help="Só mede o tempo de importação dos pontos de entrada contra STARTUP_BUDGET_MS.")
+    p.add_argument("--runs", type=int, default=STARTUP_RUNS, help="Execuções por ponto de entrada (--startup).")
+    args = p.parse_args()
+
+    if args.startup:
+        result = measure_startup(args.runs)
+        print(format_startup(result))
+        if args.json_path:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        sys.exit(0 if all(r["ok"] for r in result["entry_points"].values()) else 1)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        sys.exit(f"Etapas desconhecidas: {', '.join(sorted(unknown))}")
+    result = run_benchmark(stages, n_jobs=args.jobs, workers=args.workers, types=args.types, qps=args.qps,
+                           seed=args.seed, keep=args.keep, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           error_rate=args.error_rate, oql_rate=args.oql_rate)
+    print("\n" + format_report(result))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Relatório salvo em {args.json_path}")
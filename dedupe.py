@@ -0,0 +1,193 @@
+# Detecção em lote de lugares duplicados nos resultados (substitui a
+# comparação par a par de setup.match_coordinates).
+#
+# Os lugares são distribuídos numa grade com células do tamanho do raio de
+# busca; só pares na mesma célula ou em células vizinhas viram candidatos
+# (junção vetorizada com pandas), e para eles se mede a distância real em
+# metros e a semelhança de nome e endereço (vicinity).
+#
+# Classificação de cada par de lugares com place_id diferentes:
+#   same_coordinates  a até SAME_COORDINATES_M metros um do outro
+#   lookalike         a até radius_m metros e com nome ou endereço parecidos
+#
+# O resultado é um único relatório CSV (system/problems/duplicates.csv).
+#
+# Uso pela linha de comando:
+#   python dedupe.py [--region Sudeste] [--type hospital] [--radius-m 50] [--out arquivo.csv]
+import os
+import re
+import math
+import argparse
+import unicodedata
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from geo import haversine_km, KM_PER_DEG_LAT
+from results_manifest import get_manifest
+
+REPORT_PATH = os.path.join("system", "problems", "duplicates.csv")
+
+SAME_COORDINATES_M = 1.5   # mesma coordenada (até ~5 casas decimais)
+RADIUS_M = 50.0            # raio máximo para "parecidos"
+NAME_SIMILARITY = 0.85     # semelhança mínima de nome (0..1)
+ADDRESS_SIMILARITY = 0.9   # semelhança mínima de endereço (0..1)
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(value) -> str:
+    """Minúsculas, sem acentos e pontuação, espaços simples."""
+    text = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode("ascii")
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+def similarity(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def load_results(region: str | None = None, search_type: str | None = None) -> pd.DataFrame:
+    """Todos os lugares dos CSVs catalogados (filtráveis por região/tipo), um por place_id."""
+    frames = []
+    for entry in get_manifest().entries(search_type=search_type, region=region):
+        try:
+            df = pd.read_csv(entry["path"], sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+        except Exception as e:
+            print(f"Aviso: {entry['path']} ignorado ({e})")
+            continue
+        frames.append(df.assign(source_file=entry["filename"]))
+    if not frames:
+        return pd.DataFrame(columns=["id", "name", "address", "latitude", "longitude", "search_type", "source_file"])
+    df = pd.concat(frames, ignore_index=True)
+    # o mesmo place_id em várias buscas não é duplicata: fica uma linha por lugar
+    with_id = df[df["id"] != ""].drop_duplicates("id", keep="last")
+    return pd.concat([with_id, df[df["id"] == ""]], ignore_index=True)
+
+
+def candidate_pairs(lats: np.ndarray, lngs: np.ndarray, radius_m: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pares (i, j), i < j, de pontos em células iguais ou vizinhas de uma grade
+    cujas células medem ao menos radius_m nas duas direções.
+    """
+    max_lat = float(np.nanmax(np.abs(lats))) if len(lats) else 0.0
+    cell_deg = radius_m / 1000 / KM_PER_DEG_LAT / max(math.cos(math.radians(min(max_lat, 89.0))), 0.01)
+    cells = pd.DataFrame({"i": np.arange(len(lats)),
+                          "row": np.floor(lats / cell_deg).astype(np.int64),
+                          "col": np.floor(lngs / cell_deg).astype(np.int64)})
+    pairs_i, pairs_j = [], []
+    for d_row in (-1, 0, 1):
+        for d_col in (-1, 0, 1):
+            shifted = cells.assign(row=cells["row"] + d_row, col=cells["col"] + d_col)
+            merged = cells.merge(shifted, on=["row", "col"], suffixes=("", "_other"))
+            merged = merged[merged["i"] < merged["i_other"]]
+            pairs_i.append(merged["i"].to_numpy())
+            pairs_j.append(merged["i_other"].to_numpy())
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+def find_duplicates(df: pd.DataFrame, radius_m: float = RADIUS_M,
+                    name_similarity: float = NAME_SIMILARITY,
+                    address_similarity: float = ADDRESS_SIMILARITY) -> pd.DataFrame:
+    """
+    Pares suspeitos de duplicidade em `df` (colunas dos CSVs de resultados).
+    Retorna um DataFrame com kind, distance_m, name_similarity,
+    address_similarity e as colunas de cada lado (sufixos _a e _b).
+    """
+    df = df.reset_index(drop=True)
+    lats = pd.to_numeric(df["latitude"], errors="coerce").to_numpy()
+    lngs = pd.to_numeric(df["longitude"], errors="coerce").to_numpy()
+    valid = ~(np.isnan(lats) | np.isnan(lngs))
+    df, lats, lngs = df[valid].reset_index(drop=True), lats[valid], lngs[valid]
+    if len(df) < 2:
+        return pd.DataFrame()
+
+    i, j = candidate_pairs(lats, lngs, radius_m)
+    distance_m = haversine_km(lats[i], lngs[i], lats[j], lngs[j]) * 1000
+    ids = df["id"].to_numpy()
+    keep = (distance_m <= radius_m) & ((ids[i] != ids[j]) | (ids[i] == ""))
+    i, j, distance_m = i[keep], j[keep], distance_m[keep]
+
+    names = df["name"].map(normalize_text).to_numpy()
+    addresses = df["address"].map(normalize_text).to_numpy()
+    name_sim = np.fromiter((similarity(a, b) for a, b in zip(names[i], names[j])), float, len(i))
+    address_sim = np.fromiter((similarity(a, b) for a, b in zip(addresses[i], addresses[j])), float, len(i))
+
+    same = distance_m <= SAME_COORDINATES_M
+    lookalike = ~same & ((name_sim >= name_similarity) | (address_sim >= address_similarity))
+    hit = same | lookalike
+    cols = [c for c in ("id", "name", "address", "latitude", "longitude", "search_type", "source_file")
+            if c in df.columns]
+    side_a = df.loc[i[hit], cols].add_suffix("_a").reset_index(drop=True)
+    side_b = df.loc[j[hit], cols].add_suffix("_b").reset_index(drop=True)
+    report = pd.DataFrame({
+        "kind": np.where(same[hit], "same_coordinates", "lookalike"),
+        "distance_m": distance_m[hit].round(2),
+        "name_similarity": name_sim[hit].round(3),
+        "address_similarity": address_sim[hit].round(3),
+    })
+    report = pd.concat([report, side_a, side_b], axis=1)
+    # pares ligados entre si (ex.: vários lugares na coordenada do centro da cidade) formam um grupo
+    report.insert(0, "group", _components(i[hit], j[hit]))
+    return report.sort_values(["group", "kind", "distance_m"], kind="stable").reset_index(drop=True)
+
+
+def _components(i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """Número do grupo (componente conexa) de cada par (i, j)."""
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(x, x) != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for a, b in zip(i.tolist(), j.tolist()):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    roots = np.array([find(a) for a in i.tolist()], dtype=np.int64)
+    return pd.factorize(roots, sort=True)[0] + 1
+
+
+def write_report(report: pd.DataFrame, path: str = REPORT_PATH) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    report.to_csv(tmp_path, sep=";", index=False, encoding="utf-8-sig")
+    os.replace(tmp_path, path)
+    return path
+
+
+def match_pair(lat, lng, vicinity, place_name, other_lat, other_lng, other_vicinity, other_name,
+               radius_m: float = RADIUS_M) -> str | None:
+    """Classificação de um único par (mesmas regras do lote): 'same_coordinates', 'lookalike' ou None."""
+    distance_m = float(haversine_km(float(lat), float(lng), float(other_lat), float(other_lng))) * 1000
+    if distance_m <= SAME_COORDINATES_M:
+        return "same_coordinates"
+    if distance_m > radius_m:
+        return None
+    if (similarity(normalize_text(place_name), normalize_text(other_name)) >= NAME_SIMILARITY
+            or similarity(normalize_text(vicinity), normalize_text(other_vicinity)) >= ADDRESS_SIMILARITY):
+        return "lookalike"
+    return None
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Relatório de lugares duplicados nos resultados.")
+    p.add_argument("--region", default=None, help="Só uma região (ex.: Sudeste).")
+    p.add_argument("--type", dest="search_type", default=None, help="Só um tipo de busca (ex.: hospital).")
+    p.add_argument("--radius-m", type=float, default=RADIUS_M, help=f"Raio para 'parecidos' (padrão: {RADIUS_M} m).")
+    p.add_argument("--out", default=REPORT_PATH, help=f"Arquivo do relatório (padrão: {REPORT_PATH}).")
+    args = p.parse_args()
+
+    places = load_results(args.region, args.search_type)
+    print(f"{len(places)} lugares carregados")
+    found = find_duplicates(places, radius_m=args.radius_m)
+    counts = found["kind"].value_counts().to_dict() if len(found) else {}
+    groups = found["group"].nunique() if len(found) else 0
+    print(f"{len(found)} pares suspeitos em {groups} grupos {counts} -> {write_report(found, args.out)}")
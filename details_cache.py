@@ -0,0 +1,287 @@
+# Cache persistente (SQLite) dos Place Details, indexado por place_id.
+# O mesmo estabelecimento aparece em vários tipos de interest_zones e em
+# coordenadas vizinhas; com o cache, os horários são buscados uma vez só.
+#
+# Uso pela linha de comando:
+#   python details_cache.py stats
+#   python details_cache.py seed     (importa os horários dos CSVs de system/results)
+#   python details_cache.py purge    (remove entradas expiradas)
+import os
+import json
+import time
+import atexit
+import argparse
+import threading
+from glob import glob
+
+from local_db import CACHE_DIR, ThreadLocalDB
+
+CACHE_PATH = os.path.join(CACHE_DIR, "details.sqlite")
+DEFAULT_TTL = 90 * 24 * 3600      # segundos (horários mudam pouco)
+DEFAULT_MAX_ENTRIES = 100_000     # acima disso, os menos usados recentemente saem
+EVICT_EVERY = 200                 # checa o limite de tamanho a cada N gravações
+FLUSH_EVERY = 500                 # acessos (LRU) e contadores hit/miss vão ao disco a cada N consultas...
+FLUSH_INTERVAL = 10.0             # ... ou a cada N segundos, o que vier primeiro
+SOURCE_API = "api"
+SOURCE_SEED = "seed"              # importado dos CSVs (seed): horários já formatados, sem open_now
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS details (
+    place_id     TEXT PRIMARY KEY,
+    weekday_text TEXT NOT NULL,
+    open_now     INTEGER,
+    fetched_at   REAL NOT NULL,
+    last_access  REAL NOT NULL,
+    source       TEXT NOT NULL DEFAULT 'api'
+);
+CREATE INDEX IF NOT EXISTS idx_details_last_access ON details(last_access);
+CREATE TABLE IF NOT EXISTS stats (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class DetailsCache:
+    """
+    Cache de (weekday_text, open_now) por place_id.
+
+    - TTL: entradas com mais de `ttl` segundos contam como miss.
+    - LRU: acima de `max_entries`, remove as de acesso mais antigo.
+    - Seguro entre processos (SQLite WAL) e entre threads (uma conexão por thread).
+    - `hits`/`misses` contam o processo atual; a tabela `stats` acumula o total.
+    - Uma consulta não escreve no banco: o último acesso (LRU) e os contadores
+      ficam em memória e vão ao disco em lote (flush), numa só transação, a cada
+      FLUSH_EVERY consultas ou FLUSH_INTERVAL segundos e no fim do processo.
+      Assim, vários processos/threads lendo o cache não disputam o lock de escrita.
+
+    Observação: `open_now` é o valor do momento em que o detalhe foi buscado;
+    entradas do seed (source='seed') não têm open_now (vem None).
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._touched = {}              # place_id -> último acesso ainda não gravado
+        self._pending = {"hits": 0, "misses": 0}
+        self._since_flush = 0
+        self._last_flush = time.monotonic()
+        self._db = ThreadLocalDB(path, _SCHEMA)
+        columns = {row[1] for row in self._conn().execute("PRAGMA table_info(details)")}
+        if "source" not in columns:     # cache criado antes da coluna
+            self._conn().execute(f"ALTER TABLE details ADD COLUMN source TEXT NOT NULL DEFAULT '{SOURCE_API}'")
+        atexit.register(self.flush)
+
+    def _conn(self):
+        return self._db.conn()
+
+    def _count(self, name: str, place_id: str | None = None, now: float | None = None):
+        with self._lock:
+            if name == "hits":
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._pending[name] += 1
+            if place_id is not None:
+                self._touched[place_id] = now
+            self._since_flush += 1
+            due = (self._since_flush >= FLUSH_EVERY
+                   or time.monotonic() - self._last_flush >= FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def close(self):
+        """Grava o que está pendente e fecha o banco (o flush do fim do processo deixa de valer)."""
+        self.flush()
+        atexit.unregister(self.flush)
+        self._db.close()
+
+    def flush(self):
+        """Grava os acessos (LRU) e os contadores hit/miss acumulados em memória."""
+        with self._lock:
+            touched, pending = self._touched, self._pending
+            self._touched, self._pending = {}, {"hits": 0, "misses": 0}
+            self._since_flush = 0
+            self._last_flush = time.monotonic()
+        if not touched and not any(pending.values()):
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("UPDATE details SET last_access = MAX(last_access, ?) WHERE place_id = ?",
+                             [(at, pid) for pid, at in touched.items()])
+            conn.executemany("INSERT INTO stats(name, value) VALUES (?, ?) "
+                             "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                             [(name, n) for name, n in pending.items() if n])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, place_id: str):
+        """Devolve (weekday_text, open_now) ou None se ausente/expirado."""
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT weekday_text, open_now, fetched_at FROM details WHERE place_id = ?",
+            (place_id,)).fetchone()
+        if row is None or (self.ttl and now - row[2] > self.ttl):
+            self._count("misses")
+            return None
+        self._count("hits", place_id, now)
+        open_now = None if row[1] is None else bool(row[1])
+        return json.loads(row[0]), open_now
+
+    def set(self, place_id: str, weekday_text, open_now, fetched_at: float | None = None,
+            source: str = SOURCE_API):
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO details(place_id, weekday_text, open_now, fetched_at, last_access, source) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(place_id) DO UPDATE SET weekday_text = excluded.weekday_text, "
+            "open_now = excluded.open_now, fetched_at = excluded.fetched_at, "
+            "last_access = excluded.last_access, source = excluded.source",
+            (place_id, json.dumps(list(weekday_text or []), ensure_ascii=False),
+             None if open_now is None else int(bool(open_now)),
+             fetched_at or now, now, source))
+        with self._lock:
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def cached_ids(self, place_ids) -> set:
+        """Quais place_id têm entrada válida (sem contar hit/miss nem mexer no LRU)."""
+        ids = [pid for pid in set(place_ids) if pid]
+        found = set()
+        min_fetched = time.time() - self.ttl if self.ttl else 0
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            found.update(row[0] for row in self._conn().execute(
+                f"SELECT place_id FROM details WHERE place_id IN ({', '.join('?' * len(chunk))}) "
+                "AND fetched_at >= ?", (*chunk, min_fetched)))
+        return found
+
+    def evict(self) -> int:
+        """Aplica o limite de tamanho (LRU). Retorna quantas entradas saíram."""
+        if not self.max_entries:
+            return 0
+        self.flush()      # a ordem do LRU precisa dos acessos ainda em memória
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total = conn.execute("SELECT COUNT(*) FROM details").fetchone()[0]
+            excess = total - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM details WHERE place_id IN "
+                    "(SELECT place_id FROM details ORDER BY last_access ASC LIMIT ?)", (excess,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return max(excess, 0)
+
+    def purge_expired(self) -> int:
+        if not self.ttl:
+            return 0
+        cur = self._conn().execute("DELETE FROM details WHERE fetched_at < ?", (time.time() - self.ttl,))
+        return cur.rowcount
+
+    def stats(self) -> dict:
+        self.flush()
+        conn = self._conn()
+        totals = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        lookups = self.hits + self.misses
+        return {
+            "entries": conn.execute("SELECT COUNT(*) FROM details").fetchone()[0],
+            "seeded": conn.execute("SELECT COUNT(*) FROM details WHERE source = ?", (SOURCE_SEED,)).fetchone()[0],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+        }
+
+    def seed_from_results(self, results_dir: str = os.path.join("system", "results"),
+                          as_fresh: bool = False) -> int:
+        """
+        Preenche o cache com os horários já gravados nos CSVs de resultados.
+        Usa o mtime de cada arquivo como data da busca (respeita o TTL), ou o
+        momento atual se `as_fresh`, e não sobrescreve entradas mais novas.
+        As entradas ficam com source='seed' e sem open_now: o CSV guarda os
+        horários já formatados e um open_now do momento da busca, que não vale
+        como resposta atual do Place Details. Retorna o nº de place_id gravados.
+        """
+        import pandas as pd
+
+        seeded = set()
+        for csv_path in glob(os.path.join(results_dir, "**", "*.csv"), recursive=True):
+            try:
+                df = pd.read_csv(csv_path, sep=";", encoding="utf-8-sig", dtype=str,
+                                 usecols=lambda c: c in ("id", "weekday_text"))
+            except Exception:
+                continue
+            if "id" not in df.columns or "weekday_text" not in df.columns:
+                continue
+            fetched_at = time.time() if as_fresh else os.path.getmtime(csv_path)
+            for place_id, raw in zip(df["id"], df["weekday_text"]):
+                if not isinstance(place_id, str) or not place_id:
+                    continue
+                try:
+                    weekday_text = json.loads(raw)
+                except Exception:
+                    continue
+                if not isinstance(weekday_text, list) or weekday_text == ["Não disponível"]:
+                    weekday_text = []
+                row = self._conn().execute(
+                    "SELECT fetched_at FROM details WHERE place_id = ?", (place_id,)).fetchone()
+                if row and row[0] >= fetched_at:
+                    continue
+                self.set(place_id, weekday_text, None, fetched_at, source=SOURCE_SEED)
+                seeded.add(place_id)
+        self.evict()
+        return len(seeded)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def get_details_cache() -> DetailsCache:
+    """Cache padrão do processo (aberto na primeira chamada)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = DetailsCache()
+        return _default_cache
+
+def reset_details_cache():
+    """Fecha o cache padrão; o próximo get_details_cache() abre o de CACHE_PATH na pasta atual."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is not None:
+            _default_cache.close()
+        _default_cache = None
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Cache local de Place Details (por place_id).")
+    p.add_argument("command", choices=["stats", "seed", "purge"])
+    p.add_argument("--path", default=CACHE_PATH, help="Arquivo SQLite do cache.")
+    p.add_argument("--results", default=os.path.join("system", "results"),
+                   help="Pasta de resultados usada pelo 'seed'.")
+    p.add_argument("--as-fresh", action="store_true",
+                   help="No 'seed', trata os CSVs como buscados agora (ignora o mtime).")
+    args = p.parse_args()
+
+    cache = DetailsCache(args.path)
+    if args.command == "seed":
+        print(f"{cache.seed_from_results(args.results, args.as_fresh)} place_id importados de {args.results}")
+    elif args.command == "purge":
+        print(f"{cache.purge_expired()} entradas expiradas removidas")
+    print(json.dumps(cache.stats(), indent=2))
@@ -0,0 +1,159 @@
+# Enriquecimento tardio dos resultados gravados no modo lite
+# (search_places(lite=True) / batch_runner --lite): completa weekday_text,
+# open_now e hours_intervals das linhas com enriched=False usando o Place
+# Details (com o cache de detalhes na frente).
+#
+# Dois caminhos:
+#   - sob demanda: a interface web pede os horários de um lugar quando o
+#     cartão é expandido (enrich_place), e o CSV de origem é atualizado;
+#   - em lote: backfill percorre os CSVs do catálogo, acertado antes com a
+#     árvore de system/results (CSVs copiados para lá fora do pipeline entram).
+#
+# Uso pela linha de comando:
+#   python enrichment.py backfill [--type restaurant] [--region Sudeste] [--max-places 500] [--workers 8]
+#   python enrichment.py stats
+import os
+import sys
+import json
+import argparse
+import threading
+from typing import TYPE_CHECKING
+
+from places import DETAILS_WORKERS, fetch_places_details, format_details, get_api_key, get_place_details
+from results_manifest import get_manifest
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+COLUMN = "enriched"
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def _file_lock(path: str) -> threading.Lock:
+    """Um lock por arquivo: duas expansões simultâneas não perdem a gravação uma da outra."""
+    with _file_locks_guard:
+        return _file_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+def _read(path: str) -> "pd.DataFrame":
+    import pandas as pd   # a interface web importa este módulo antes de qualquer backfill
+
+    return pd.read_csv(path, sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+
+def pending_mask(df: "pd.DataFrame") -> "pd.Series":
+    """Linhas ainda sem Place Details (CSVs sem a coluna vieram do modo completo)."""
+    import pandas as pd
+
+    if COLUMN not in df.columns:
+        return pd.Series(False, index=df.index)
+    return (df[COLUMN].astype(str).str.strip().str.lower() == "false") & (df["id"] != "")
+
+def enriched_fields(place_id: str, details) -> dict:
+    """Colunas do CSV preenchidas a partir de (weekday_text, open_now)."""
+    from opening_hours import hours_intervals
+
+    formatted = format_details(place_id, details)
+    return {"weekday_text": json.dumps(formatted, ensure_ascii=False), "open_now": str(bool(details[1])),
+            "hours_intervals": hours_intervals(formatted), COLUMN: "True"}
+
+def _write(df: "pd.DataFrame", path: str):
+    # mantém o mtime: ele marca a data da busca (frescor no índice), não a do enriquecimento
+    mtime = os.path.getmtime(path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.to_csv(tmp_path, sep=";", index=False, encoding="utf-8-sig")
+    os.utime(tmp_path, (mtime, mtime))
+    os.replace(tmp_path, path)
+    get_manifest().record(path, rows=len(df), columns=list(df.columns))
+
+def _catalogued(path: str) -> bool:
+    """Só CSVs do catálogo de resultados são regravados (nunca um caminho vindo de fora)."""
+    found = get_manifest().find_path(os.path.basename(path))
+    return bool(found) and os.path.realpath(found) == os.path.realpath(path)
+
+def apply_details(path: str, details_by_id: dict) -> int:
+    """Grava no CSV os detalhes já obtidos ({place_id: (weekday_text, open_now)}). Retorna nº de linhas."""
+    if not _catalogued(path):
+        raise ValueError(f"{path} não está no catálogo de resultados")
+    with _file_lock(path):
+        df = _read(path)
+        mask = pending_mask(df) & df["id"].isin(details_by_id.keys())
+        if not mask.any():
+            return 0
+        for i in df.index[mask]:
+            for column, value in enriched_fields(df.at[i, "id"], details_by_id[df.at[i, "id"]]).items():
+                df.at[i, column] = value
+        _write(df, path)
+        return int(mask.sum())
+
+def enrich_file(path: str, api_key: str, max_places: int | None = None,
+                workers: int = DETAILS_WORKERS) -> int:
+    """Busca os detalhes das linhas pendentes do CSV e regrava o arquivo. Retorna nº de linhas enriquecidas."""
+    df = _read(path)
+    ids = df.loc[pending_mask(df), "id"].drop_duplicates().tolist()[:max_places]
+    if not ids:
+        return 0
+    details = fetch_places_details(ids, api_key, max_workers=workers)
+    return apply_details(path, dict(zip(ids, details)))
+
+def enrich_place(place_id: str, api_key: str, csv_path: str | None = None) -> dict:
+    """
+    Detalhes de um lugar para a interface (cache primeiro, API se preciso) e,
+    com csv_path, grava o resultado na linha do arquivo de origem.
+    """
+    details = get_place_details(place_id, api_key)
+    fields = enriched_fields(place_id, details)
+    if csv_path:
+        apply_details(csv_path, {place_id: details})
+    return {"place_id": place_id, "weekday_text": json.loads(fields["weekday_text"]),
+            "open_now": bool(details[1]), "hours_intervals": fields["hours_intervals"], "enriched": True}
+
+def backfill(api_key: str, search_type: str | None = None, region: str | None = None,
+             max_places: int | None = None, workers: int = DETAILS_WORKERS) -> dict:
+    """Enriquece os CSVs do catálogo com linhas pendentes (até max_places lugares no total)."""
+    get_manifest().reconcile()
+    files = places = 0
+    for entry in get_manifest().entries(search_type=search_type, region=region):
+        if (entry["schema_version"] or 0) < 3:
+            continue      # sem a coluna enriched: gravado no modo completo
+        remaining = None if max_places is None else max_places - places
+        if remaining is not None and remaining <= 0:
+            break
+        done = enrich_file(entry["path"], api_key, remaining, workers)
+        if done:
+            files += 1
+            places += done
+            print(f"  {os.path.basename(entry['path'])}: {done} lugares enriquecidos")
+    return {"files": files, "places": places}
+
+def stats(search_type: str | None = None, region: str | None = None) -> dict:
+    get_manifest().reconcile()
+    pending = total = files = 0
+    for entry in get_manifest().entries(search_type=search_type, region=region):
+        if (entry["schema_version"] or 0) < 3:
+            total += entry["rows"] or 0
+            continue
+        df = _read(entry["path"])
+        n = int(pending_mask(df).sum())
+        total += len(df)
+        pending += n
+        files += bool(n)
+    return {"rows": total, "pending": pending, "files_with_pending": files}
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Completa com Place Details os resultados gravados no modo lite.")
+    p.add_argument("command", choices=["backfill", "stats"])
+    p.add_argument("--type", dest="search_type", default=None)
+    p.add_argument("--region", default=None)
+    p.add_argument("--max-places", type=int, default=None, help="Limite de lugares enriquecidos nesta passada.")
+    p.add_argument("--workers", type=int, default=DETAILS_WORKERS)
+    args = p.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(stats(args.search_type, args.region), indent=2))
+        sys.exit(0)
+    api_key = get_api_key()
+    if not api_key:
+        sys.exit("API Key não encontrada em system/api_key.txt")
+    print(json.dumps(backfill(api_key, args.search_type, args.region, args.max_places, args.workers), indent=2))
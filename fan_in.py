@@ -0,0 +1,389 @@
+# Modo fan-in das buscas (batch_runner --fan-in): em vez de uma Nearby Search
+# por tipologia do setup.interest_zones, cada coordenada recebe uma busca por
+# tipologia que a Places API de fato filtra e UMA busca ampla, cujos lugares
+# são classificados localmente (pelo array `types`) nas demais tipologias.
+#
+# Por quê: hotel, guesthouse, shop, retail, business, shopping_center,
+# convention_center, theater e health_center não são tipos aceitos no filtro
+# da Nearby Search. A API ignora o filtro e devolve os estabelecimentos mais
+# próximos do ponto — a mesma lista para as nove (no catálogo, o Jaccard entre
+# elas é 1.0 em todas as coordenadas). São 8 chamadas repetidas por ponto.
+#
+# As saídas continuam sendo um CSV por tipologia (<tipo>_near_<lat>_<lng>.csv):
+#   - tipologias com filtro próprio (school, hospital, ...): a busca delas, igual ao modo por tipo;
+#   - tipologias de CATEGORY_TYPES: os lugares de todas as buscas do ponto cujo
+#     `types` tem um dos tipos do Google mapeados, do mais perto ao mais longe
+#     (até NEARBY_PAGE); as sem equivalente (None) ficam com a lista ampla inteira,
+#     que é o que a busca por tipo já recebia.
+# Cada linha ganha a coluna found_by (a busca que trouxe o lugar), que também
+# separa as saídas do fan-in das do modo por tipo no relatório de cobertura.
+#
+# Uso pela linha de comando:
+#   python batch_runner.py -f <planilha> --fan-in [--dry-run]
+#   python fan_in.py coverage [--types hotel,shop] [--max-points 50] [--json saida.json]
+# O relatório `coverage` refaz o fan-in sobre os resultados por tipo já guardados,
+# sem chamadas à API; o batch com --fan-in compara com as saídas anteriores que achar.
+import os
+import sys
+import json
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+from geo import haversine_km
+from setup import interest_zones
+
+# tipo enviado na busca ampla: não é aceito como filtro, então a API responde com os
+# estabelecimentos mais próximos, como já fazia para as tipologias sem tipo próprio
+BROAD_TYPE = "establishment"
+NEARBY_PAGE = 20               # lugares por Nearby Search (uma página)
+FOUND_BY_COLUMN = "found_by"
+
+SHOP_TYPES = frozenset({
+    "store", "book_store", "bicycle_store", "clothing_store", "convenience_store", "department_store",
+    "electronics_store", "furniture_store", "hardware_store", "home_goods_store", "jewelry_store",
+    "liquor_store", "pet_store", "shoe_store", "supermarket", "grocery_or_supermarket", "pharmacy",
+    "drugstore", "bakery", "florist", "shopping_mall",
+})
+# tipologia sem filtro na Nearby Search -> tipos do Google que a classificam (None: lista ampla inteira)
+CATEGORY_TYPES = {
+    "hotel": frozenset({"lodging"}),
+    "guesthouse": frozenset({"lodging"}),
+    "shopping_center": frozenset({"shopping_mall"}),
+    "shop": SHOP_TYPES,
+    "retail": SHOP_TYPES,
+    "health_center": frozenset({"health", "doctor", "hospital", "dentist", "physiotherapist"}),
+    "business": None,
+    "convention_center": None,
+    "theater": None,
+}
+INTEREST_TYPES = list(dict.fromkeys(z.split("?")[2].strip() for z in interest_zones if z.count("?") >= 2))
+
+
+def is_broad(category: str) -> bool:
+    """Tipologia que sai da busca ampla (não tem filtro próprio na Nearby Search)."""
+    return category in CATEGORY_TYPES
+
+def plan_searches(categories: list[str]) -> list[str]:
+    """Nearby Searches necessárias para as tipologias: as com filtro próprio + uma ampla, se preciso."""
+    searches = [c for c in dict.fromkeys(categories) if not is_broad(c)]
+    if any(is_broad(c) for c in categories):
+        searches.append(BROAD_TYPE)
+    return searches
+
+def classify(types) -> set[str]:
+    """Tipologias de CATEGORY_TYPES em que um lugar entra pelo seu array `types`."""
+    types = set(types or ())
+    return {c for c, wanted in CATEGORY_TYPES.items() if wanted is None or wanted & types}
+
+def _location(place: dict) -> tuple[float, float]:
+    loc = place["geometry"]["location"]
+    return float(loc["lat"]), float(loc["lng"])
+
+def assign(results_by_search: dict[str, list[dict]], categories: list[str], lat, lng) -> dict[str, list[tuple]]:
+    """
+    Distribui os lugares das buscas de um ponto entre as tipologias:
+    {tipologia: [(lugar, found_by), ...]} na ordem de distância.
+    """
+    broad = results_by_search.get(BROAD_TYPE, [])
+    # todos os lugares do ponto, uma vez cada (a busca ampla primeiro), com a distância até a origem
+    pool, seen = [], set()
+    for search in [BROAD_TYPE] + [s for s in results_by_search if s != BROAD_TYPE]:
+        for place in results_by_search.get(search, []):
+            pid = place.get("place_id")
+            if pid and pid not in seen:
+                seen.add(pid)
+                pool.append((place, search))
+    distances = haversine_km(float(lat), float(lng), *np.array([_location(p) for p, _ in pool]).T) if pool else []
+    order = np.argsort(distances, kind="stable") if pool else []
+
+    out = {}
+    for category in dict.fromkeys(categories):
+        if not is_broad(category):
+            out[category] = [(place, category) for place in results_by_search.get(category, [])]
+        elif CATEGORY_TYPES[category] is None:
+            out[category] = [(place, BROAD_TYPE) for place in broad]
+        else:
+            wanted = CATEGORY_TYPES[category]
+            out[category] = [pool[i] for i in order if wanted & set(pool[i][0].get("types") or ())][:NEARBY_PAGE]
+    return out
+
+
+# ---------- cobertura contra o modo por tipo ----------
+def _read_ids(path: str) -> list[str] | None:
+    """ids de um CSV de resultados do modo por tipo (None se for saída do fan-in)."""
+    df = pd.read_csv(path, sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    if FOUND_BY_COLUMN in df.columns:
+        return None
+    return [pid for pid in df.get("id", pd.Series(dtype=str)).tolist() if pid]
+
+def compare(per_type_ids, fan_in_ids) -> dict:
+    """Quanto da saída do modo por tipo a do fan-in mantém."""
+    per_type, fan_in = set(per_type_ids), set(fan_in_ids)
+    kept = len(per_type & fan_in)
+    return {"per_type_rows": len(per_type), "fan_in_rows": len(fan_in), "kept": kept,
+            "extra": len(fan_in - per_type)}
+
+def merge_coverage(total: dict, one: dict):
+    """Soma o resultado de compare() (por tipologia) em `total`."""
+    for category, c in one.items():
+        acc = total.setdefault(category, {k: 0 for k in c})
+        for k, v in c.items():
+            acc[k] += v
+
+def format_coverage(coverage: dict) -> list[str]:
+    lines = []
+    for category, c in sorted(coverage.items()):
+        recall = c["kept"] / c["per_type_rows"] if c["per_type_rows"] else None
+        lines.append(f"  {category:<18} mantidos {c['kept']:>5}/{c['per_type_rows']:<5} "
+                     f"({'-' if recall is None else f'{recall:.0%}'}), {c['extra']} novos, "
+                     f"{c['fan_in_rows']} linhas no fan-in")
+    return lines
+
+
+# ---------- busca ----------
+def fan_in_search(lat, lng, categories: list[str], api_key: str, details_workers: int | None = None,
+                  lite: bool = False, calls: dict | None = None) -> dict:
+    """
+    Roda as buscas do fan-in em (lat, lng) e monta as linhas de cada tipologia
+    (sem gravar). Devolve {"rows": {tipologia: [linha, ...]}, "city_state",
+    "searches": [...], "places": nº de lugares distintos}. `calls`, se dado,
+    conta as Nearby Searches feitas (calls["nearby"]) mesmo se uma delas falhar.
+    """
+    from places import DETAILS_WORKERS, fetch_places_details, get_city_state, nearby_search, place_row
+    from details_cache import get_details_cache
+    from metrics import get_metrics
+
+    metrics = get_metrics()
+    with metrics.stage("geocode"):
+        city_state = get_city_state(lat, lng, api_key)
+    searches = plan_searches(categories)
+    results = {}
+    for search in searches:
+        if calls is not None:
+            calls["nearby"] = calls.get("nearby", 0) + 1
+        results[search] = nearby_search(lat, lng, search, api_key)
+    assigned = assign(results, categories, lat, lng)
+
+    # Place Details uma vez por lugar, mesmo que ele entre em várias tipologias
+    ids = list(dict.fromkeys(p["place_id"] for rows in assigned.values() for p, _ in rows if p.get("place_id")))
+    if lite:
+        cache = get_details_cache()
+        details = {pid: cache.get(pid) for pid in ids}
+    else:
+        with metrics.stage("details"):
+            details = dict(zip(ids, fetch_places_details(ids, api_key, details_workers or DETAILS_WORKERS)))
+
+    rows = {}
+    for category, places in assigned.items():
+        rows[category] = []
+        for place, found_by in places:
+            found = details.get(place.get("place_id"))
+            enriched = not lite or found is not None
+            rows[category].append({**place_row(place, found if enriched else None, city_state, category, enriched),
+                                   FOUND_BY_COLUMN: found_by})
+    return {"rows": rows, "city_state": city_state, "searches": searches, "places": len(ids)}
+
+def save_category(result: dict, category: str, lat, lng) -> tuple[str | None, dict | None]:
+    """
+    Grava o CSV de uma tipologia do fan_in_search (None se não houver linhas).
+    Devolve (caminho, cobertura), com a cobertura (compare()) contra a saída
+    anterior do modo por tipo, se houver uma no catálogo.
+    """
+    from places import make_csv_filename, save_results
+    from results_manifest import get_manifest
+
+    rows = result["rows"].get(category) or []
+    existing = get_manifest().find_path(make_csv_filename(category, lat, lng))
+    baseline = _read_ids(existing) if existing and os.path.exists(existing) else None
+    coverage = compare(baseline, [row["id"] for row in rows]) if baseline is not None else None
+    if not rows:
+        print(f"Nenhum resultado encontrado para {category} no local especificado.")
+        return None, coverage
+    return save_results(rows, category, lat, lng, result["city_state"]), coverage
+
+
+class FanInError(RuntimeError):
+    """As buscas do fan-in falharam numa coordenada; os demais jobs do ponto falham sem refazê-las."""
+
+
+class FanIn:
+    """
+    Fan-in compartilhado pelos jobs de um batch: o primeiro job de uma
+    coordenada roda as buscas para todas as tipologias planejadas nela e cada
+    job grava só o CSV da sua tipologia (skip, journal e pasta da região seguem
+    por job). Thread-safe (um lock por coordenada).
+
+    Se as buscas de um ponto falham, a falha fica guardada: os outros jobs do
+    ponto falham na hora (ficam no journal para --retry-failed) em vez de
+    repetir todas as buscas do ponto, cada um gastando a cota de novo.
+    """
+
+    def __init__(self, jobs: list[dict], api_key: str, details_workers: int | None = None, lite: bool = False):
+        self.api_key = api_key
+        self.details_workers = details_workers
+        self.lite = lite
+        self.categories = {}
+        self.jobs = {}
+        for job in jobs:
+            self.categories.setdefault(self._key(job), []).append(job["type"])
+            self.jobs.setdefault(self._key(job), []).append(job)
+        self._results = {}
+        self._failed = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+        self.coverage = {}
+        self.nearby_calls = 0
+
+    @staticmethod
+    def _key(job: dict):
+        return (job["lat"], job["lng"])
+
+    def point_lock(self, job: dict) -> threading.RLock:
+        """Lock do ponto do job (reentrante: quem o segura pode chamar path_for)."""
+        with self._guard:
+            return self._locks.setdefault(self._key(job), threading.RLock())
+
+    def needs_search(self, job: dict) -> bool:
+        """O ponto do job ainda não teve as buscas do fan-in (nem uma falha)."""
+        key = self._key(job)
+        with self._guard:
+            return key not in self._results and key not in self._failed
+
+    def point_jobs(self, job: dict) -> list[dict]:
+        """Jobs do ponto cobertos pelo fan-in (o primeiro a rodar paga as buscas de todos)."""
+        return self.jobs.get(self._key(job), [job])
+
+    def _search(self, job: dict, categories: list[str]) -> dict:
+        calls = {}
+        try:
+            return fan_in_search(job["lat"], job["lng"], categories, self.api_key, self.details_workers,
+                                 self.lite, calls)
+        finally:
+            with self._guard:
+                self.nearby_calls += calls.get("nearby", 0)
+
+    def path_for(self, job: dict) -> str | None:
+        key = self._key(job)
+        with self.point_lock(job):
+            if key in self._failed:
+                raise FanInError(f"fan-in falhou neste ponto: {self._failed[key]}")
+            if key not in self._results:
+                try:
+                    self._results[key] = self._search(job, self.categories.get(key, [job["type"]]))
+                except Exception as e:
+                    self._failed[key] = f"{type(e).__name__}: {e}"
+                    raise
+            result = self._results[key]
+        if job["type"] not in result["rows"]:
+            # tipologia fora do plano da coordenada (p.ex. job adiado pelo orçamento e refeito): busca só ela
+            result = self._search(job, [job["type"]])
+        path, coverage = save_category(result, job["type"], job["lat"], job["lng"])
+        with self._guard:
+            if coverage is not None:
+                merge_coverage(self.coverage, {job["type"]: coverage})
+            result["rows"].pop(job["type"], None)  # cada tipologia é gravada uma vez; libera a memória
+        return path
+
+    def summary(self) -> dict:
+        per_type = sum(len(set(self.categories.get(k, []))) for k in self._results)
+        return {"points": len(self._results), "failed_points": len(self._failed), "nearby_calls": self.nearby_calls,
+                "nearby_calls_per_type_mode": per_type, "coverage": self.coverage}
+
+    def format_summary(self) -> str:
+        s = self.summary()
+        lines = [f"Fan-in: {s['points']} coordenadas, {s['nearby_calls']} Nearby Searches "
+                 f"(no modo por tipo: {s['nearby_calls_per_type_mode']})"
+                 + (f"; {s['failed_points']} coordenadas falharam (jobs no journal para --retry-failed)"
+                    if s["failed_points"] else "")]
+        if s["coverage"]:
+            lines.append("Cobertura contra as saídas anteriores do modo por tipo:")
+            lines += format_coverage(s["coverage"])
+        return "\n".join(lines)
+
+
+# ---------- relatório offline ----------
+def _stored_places(path: str) -> list[dict] | None:
+    """Lugares de um CSV do modo por tipo no formato da Nearby Search (None se for saída do fan-in)."""
+    df = pd.read_csv(path, sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    if FOUND_BY_COLUMN in df.columns:
+        return None
+    places = []
+    for row in df.to_dict("records"):
+        try:
+            location = {"lat": float(row["latitude"]), "lng": float(row["longitude"])}
+        except (KeyError, ValueError):
+            continue
+        places.append({"place_id": row.get("id"), "types": json.loads(row["types"]) if row.get("types") else [],
+                       "geometry": {"location": location}})
+    return places
+
+def replay_coverage(categories: list[str] | None = None, max_points: int | None = None) -> dict:
+    """
+    Refaz o fan-in sobre as saídas guardadas do modo por tipo (coordenadas com
+    todas as tipologias), sem chamar a API: a busca ampla é a lista que as
+    tipologias sem filtro receberam e as demais buscas são os próprios CSVs.
+    """
+    from results_manifest import get_manifest
+
+    categories = categories or INTEREST_TYPES
+    by_point = {}
+    for entry in get_manifest().entries():
+        if entry["search_type"] in categories and entry["lat"] is not None:
+            by_point.setdefault((entry["lat"], entry["lng"]), {})[entry["search_type"]] = entry["path"]
+
+    coverage, points = {}, 0
+    calls = {"nearby_per_type": 0, "nearby_fan_in": 0, "details_per_type": 0, "details_fan_in": 0}
+    for (lat, lng), files in by_point.items():
+        if max_points is not None and points >= max_points:
+            break
+        if set(categories) - set(files):
+            continue
+        stored = {c: _stored_places(files[c]) for c in categories}
+        if any(places is None for places in stored.values()):
+            continue
+        searches = plan_searches(categories)
+        results = {s: stored[s] for s in searches if s != BROAD_TYPE}
+        if BROAD_TYPE in searches:
+            results[BROAD_TYPE] = stored[next(c for c in categories if is_broad(c))]
+        assigned = assign(results, categories, lat, lng)
+        one = {c: compare([p["place_id"] for p in stored[c]], [p["place_id"] for p, _ in assigned[c]])
+               for c in categories}
+        merge_coverage(coverage, one)
+        points += 1
+        calls["nearby_per_type"] += len(categories)
+        calls["nearby_fan_in"] += len(searches)
+        # sem o cache de detalhes: uma chamada por linha no modo por tipo, uma por lugar distinto no fan-in
+        calls["details_per_type"] += sum(len(stored[c]) for c in categories)
+        calls["details_fan_in"] += len({p["place_id"] for places in results.values() for p in places})
+    return {"points": points, "categories": categories, "calls": calls, "coverage": coverage}
+
+def format_replay(report: dict) -> str:
+    calls = report["calls"]
+    saved = 1 - calls["nearby_fan_in"] / calls["nearby_per_type"] if calls["nearby_per_type"] else 0.0
+    lines = [f"{report['points']} coordenadas com as {len(report['categories'])} tipologias no catálogo",
+             f"  Nearby Search: {calls['nearby_fan_in']} no fan-in contra {calls['nearby_per_type']} por tipo "
+             f"({saved:.0%} a menos)",
+             f"  Place Details (sem cache): {calls['details_fan_in']} contra {calls['details_per_type']}",
+             "Cobertura por tipologia (lugares do modo por tipo mantidos pelo fan-in):"]
+    return "\n".join(lines + format_coverage(report["coverage"]))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Fan-in das buscas: relatório de cobertura contra o modo por tipo.")
+    p.add_argument("command", choices=["coverage"])
+    p.add_argument("--types", default=None, help="Tipologias (padrão: as do setup.interest_zones).")
+    p.add_argument("--max-points", type=int, default=None)
+    p.add_argument("--json", dest="json_path", default=None, help="Também grava o relatório em JSON.")
+    args = p.parse_args()
+
+    types = [t.strip() for t in args.types.split(",") if t.strip()] if args.types else None
+    report = replay_coverage(types, args.max_points)
+    if not report["points"]:
+        sys.exit("Nenhuma coordenada com todas as tipologias no catálogo.")
+    print(format_replay(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
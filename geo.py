@@ -0,0 +1,114 @@
+# Utilitários geográficos: distância haversine (vetorizada com numpy) e um
+# índice espacial em grade para buscas de vizinhos sem varrer todos os pontos.
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = 111.32
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Distância de grande círculo em km. Aceita escalares ou arrays numpy
+    (com broadcasting), então serve tanto para um par quanto para milhares.
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class GridIndex:
+    """
+    Índice espacial em grade regular de `cell_deg` graus. Cada célula guarda
+    os índices (posições) dos pontos que caem nela; as consultas só medem a
+    distância dos pontos das células vizinhas.
+    """
+
+    def __init__(self, lats, lngs, cell_deg: float = 0.25):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lngs = np.asarray(lngs, dtype=float)
+        self.cell_deg = float(cell_deg)
+        rows = np.floor(self.lats / self.cell_deg).astype(np.int64)
+        cols = np.floor(self.lngs / self.cell_deg).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        self._cells = {}
+        if len(order):
+            keys = np.stack([rows[order], cols[order]], axis=1)
+            breaks = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+            for chunk in np.split(order, breaks):
+                self._cells[(int(rows[chunk[0]]), int(cols[chunk[0]]))] = chunk
+        self._max_ring = self._ring_limit()
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _ring_limit(self) -> int:
+        if not self._cells:
+            return 0
+        keys = np.array(list(self._cells.keys()))
+        return int(max(np.ptp(keys[:, 0]), np.ptp(keys[:, 1]))) + 1
+
+    def _cell(self, lat: float, lng: float):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def _ring(self, row: int, col: int, r: int):
+        if r == 0:
+            chunk = self._cells.get((row, col))
+            return [chunk] if chunk is not None else []
+        out = []
+        for i in range(row - r, row + r + 1):
+            for j in (col - r, col + r):
+                chunk = self._cells.get((i, j))
+                if chunk is not None:
+                    out.append(chunk)
+        for j in range(col - r + 1, col + r):
+            for i in (row - r, row + r):
+                chunk = self._cells.get((i, j))
+                if chunk is not None:
+                    out.append(chunk)
+        return out
+
+    def _ring_min_km(self, lat: float, r: int) -> float:
+        # distância mínima garantida até qualquer ponto fora dos anéis 0..r
+        worst_lat = min(89.0, abs(lat) + (r + 1) * self.cell_deg)
+        return r * self.cell_deg * KM_PER_DEG_LAT * math.cos(math.radians(worst_lat))
+
+    def query_radius(self, lat: float, lng: float, radius_km: float):
+        """Índices e distâncias (km) dos pontos a até radius_km, do mais próximo ao mais distante."""
+        row, col = self._cell(lat, lng)
+        chunks, r = [], 0
+        while r <= self._max_ring:
+            chunks.extend(self._ring(row, col, r))
+            if self._ring_min_km(lat, r) > radius_km:
+                break
+            r += 1
+        return self._rank(lat, lng, chunks, max_km=radius_km)
+
+    def nearest(self, lat: float, lng: float, k: int = 1, max_km: float | None = None):
+        """Os k pontos mais próximos (índices, distâncias em km), opcionalmente limitados a max_km."""
+        row, col = self._cell(lat, lng)
+        chunks, found, r = [], 0, 0
+        while r <= self._max_ring:
+            ring = self._ring(row, col, r)
+            chunks.extend(ring)
+            found += sum(len(c) for c in ring)
+            bound = self._ring_min_km(lat, r)
+            if max_km is not None and bound > max_km:
+                break
+            if found >= k:
+                idx, dist = self._rank(lat, lng, chunks, max_km=max_km)
+                if len(dist) >= k and dist[k - 1] <= bound:
+                    return idx[:k], dist[:k]
+            r += 1
+        idx, dist = self._rank(lat, lng, chunks, max_km=max_km)
+        return idx[:k], dist[:k]
+
+    def _rank(self, lat, lng, chunks, max_km=None):
+        if not chunks:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        idx = np.concatenate(chunks)
+        dist = haversine_km(lat, lng, self.lats[idx], self.lngs[idx])
+        if max_km is not None:
+            keep = dist <= max_km
+            idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return idx[order], dist[order]
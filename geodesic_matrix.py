@@ -0,0 +1,104 @@
+# Matriz "geodésica": distância em linha reta (haversine, vetorizada) da
+# origem de cada busca até cada lugar retornado, sem chamar o Distance Matrix.
+# Serve sozinha (quando basta a distância em linha reta) e como pré-filtro do
+# routes_matrix: só os top-K mais próximos de cada (origem, tipo) vão para a API.
+#
+# Uso pela linha de comando:
+#   python geodesic_matrix.py [--region Sudeste] [--type hospital] [--top-k 5] [--out arquivo.csv]
+import os
+import argparse
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from geo import haversine_km
+from results_manifest import get_manifest, parse_results_filename
+
+GEODESIC_COLUMN = 'distancia_linha_reta(metros)'
+OUTPUT_DIR = 'output'
+
+
+def geodesic_meters(origin_lat, origin_lng, lats, lngs) -> np.ndarray:
+    """Distância em metros (arredondada) de uma ou várias origens até os destinos."""
+    return np.round(haversine_km(origin_lat, origin_lng, lats, lngs) * 1000, 1)
+
+def rank_nearest(distances: pd.Series, groups=None) -> pd.Series:
+    """Posição (1 = mais próximo) de cada linha dentro do seu grupo (ou do todo)."""
+    if groups is None:
+        return distances.rank(method='first').astype('Int64')
+    return distances.groupby(groups).rank(method='first').astype('Int64')
+
+def top_k_mask(distances: pd.Series, k: int | None, groups=None) -> pd.Series:
+    """True nas linhas entre as k mais próximas do grupo (todas, se k for None)."""
+    if not k:
+        return pd.Series(True, index=distances.index)
+    return (rank_nearest(distances, groups) <= k).fillna(False).astype(bool)
+
+
+def geodesic_results(region: str | None = None, search_type: str | None = None,
+                     top_k: int | None = None) -> pd.DataFrame:
+    """
+    Distância em linha reta de todos os resultados catalogados até a origem da
+    própria busca, calculada de uma vez sobre o dataset inteiro.
+    """
+    frames = []
+    for entry in get_manifest().entries(search_type=search_type, region=region):
+        parsed = parse_results_filename(entry['filename'])
+        if not parsed:
+            continue
+        try:
+            df = pd.read_csv(entry['path'], sep=';', encoding='utf-8-sig', dtype=str, keep_default_na=False)
+        except Exception as e:
+            print(f'Aviso: {entry["path"]} ignorado ({e})')
+            continue
+        frames.append(df.assign(source_file=entry['filename'], origin_lat=parsed[1], origin_lng=parsed[2]))
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    df[GEODESIC_COLUMN] = geodesic_meters(df['origin_lat'].to_numpy(), df['origin_lng'].to_numpy(),
+                                          pd.to_numeric(df['latitude'], errors='coerce').to_numpy(),
+                                          pd.to_numeric(df['longitude'], errors='coerce').to_numpy())
+    df['rank'] = rank_nearest(df[GEODESIC_COLUMN], df['source_file'])
+    if top_k:
+        df = df[df['rank'] <= top_k]
+    return df.sort_values(['source_file', 'rank'], kind='stable').reset_index(drop=True)
+
+
+class MatrixSavings:
+    """Contagem de elementos do Distance Matrix pedidos e evitados numa execução."""
+
+    def __init__(self):
+        self.total = 0
+        self.requested = 0
+        self._lock = threading.Lock()
+
+    def add(self, total: int, requested: int):
+        with self._lock:
+            self.total += total
+            self.requested += requested
+
+    @property
+    def saved(self) -> int:
+        return self.total - self.requested
+
+    def __str__(self):
+        pct = 100 * self.saved / self.total if self.total else 0.0
+        return (f'Distance Matrix: {self.requested} de {self.total} elementos pedidos à API, '
+                f'{self.saved} evitados ({pct:.1f}%)')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Distância em linha reta origem -> lugares de todos os resultados.')
+    p.add_argument('--region', default=None, help='Só uma região (ex.: Sudeste).')
+    p.add_argument('--type', dest='search_type', default=None, help='Só um tipo de busca (ex.: hospital).')
+    p.add_argument('--top-k', type=int, default=None, help='Só os K mais próximos de cada busca.')
+    p.add_argument('--out', default=None, help='Arquivo de saída (padrão: output/geodesic_<data>.csv).')
+    args = p.parse_args()
+
+    result = geodesic_results(args.region, args.search_type, args.top_k)
+    out = args.out or os.path.join(OUTPUT_DIR, f'geodesic_{datetime.now().strftime("%d-%m-%Y_%H-%M")}.csv')
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    result.to_csv(out, sep=';', index=False, encoding='utf-8-sig')
+    print(f'{len(result)} linhas -> {out}')
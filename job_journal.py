@@ -0,0 +1,165 @@
+# Diário (journal) durável dos jobs do batch_runner, um registro por
+# (coordenada, tipo). Cada transição de estado é gravada na hora no SQLite,
+# então uma execução interrompida pode ser retomada com --resume sem refazer
+# jobs concluídos — inclusive os "vazios", que não geram CSV.
+#
+# Estados: planned -> running -> succeeded | empty | failed
+#
+# Uso pela linha de comando:
+#   python job_journal.py status [run_id]
+import os
+import sys
+import time
+import threading
+
+from local_db import ThreadLocalDB
+
+JOURNAL_PATH = os.path.join("system", "jobs.sqlite")
+
+PLANNED, RUNNING, SUCCEEDED, EMPTY, FAILED = "planned", "running", "succeeded", "empty", "failed"
+DONE_STATES = (SUCCEEDED, EMPTY, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    input_path  TEXT,
+    types       TEXT,
+    workers     INTEGER,
+    created_at  REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_key     TEXT PRIMARY KEY,
+    run_id      TEXT NOT NULL,
+    label       TEXT,
+    lat         REAL NOT NULL,
+    lng         REAL NOT NULL,
+    place_type  TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    result_path TEXT,
+    planned_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_run_state ON jobs(run_id, state);
+"""
+
+
+class JobJournal:
+    """Estados dos jobs (chave = nome do CSV de saída) e das execuções."""
+
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        self._db = ThreadLocalDB(path, _SCHEMA)
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        return self._db.conn()
+
+    # ---------- execuções ----------
+    def new_run(self, input_path: str, types: list[str], workers: int = 1) -> str:
+        run_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        self._conn().execute(
+            "INSERT INTO runs(run_id, input_path, types, workers, created_at) VALUES (?, ?, ?, ?, ?)",
+            (run_id, input_path, ",".join(types), workers, time.time()))
+        return run_id
+
+    def last_run(self, input_path: str | None = None) -> str | None:
+        sql, params = "SELECT run_id FROM runs", []
+        if input_path:
+            sql += " WHERE input_path = ?"
+            params.append(input_path)
+        row = self._conn().execute(sql + " ORDER BY created_at DESC LIMIT 1", params).fetchone()
+        return row[0] if row else None
+
+    def finish_run(self, run_id: str):
+        self._conn().execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+
+    # ---------- jobs ----------
+    def states(self, job_keys) -> dict:
+        """{job_key: estado} para as chaves já conhecidas pelo journal."""
+        keys = list(job_keys)
+        out = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self._conn().execute(
+                f"SELECT job_key, state FROM jobs WHERE job_key IN ({', '.join('?' * len(chunk))})", chunk)
+            out.update(dict(rows.fetchall()))
+        return out
+
+    def plan(self, run_id: str, jobs: list[dict]):
+        """Registra os jobs desta execução como 'planned' (numa transação só)."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO jobs(job_key, run_id, label, lat, lng, place_type, state, planned_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(job_key) DO UPDATE SET run_id = excluded.run_id, label = excluded.label, "
+                "state = excluded.state, error = NULL, planned_at = excluded.planned_at, "
+                "started_at = NULL, finished_at = NULL",
+                [(j["out_name"], run_id, str(j.get("label") or ""), j["lat"], j["lng"], j["type"], PLANNED, now)
+                 for j in jobs])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def start(self, job_key: str):
+        self._conn().execute(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, started_at = ?, finished_at = NULL "
+            "WHERE job_key = ?", (RUNNING, time.time(), job_key))
+
+    def finish(self, job_key: str, state: str, result_path: str | None = None, error: str | None = None):
+        self._conn().execute(
+            "UPDATE jobs SET state = ?, result_path = ?, error = ?, finished_at = ? WHERE job_key = ?",
+            (state, result_path, error, time.time(), job_key))
+
+    # ---------- progresso ----------
+    def progress(self, run_id: str, workers: int = 1) -> dict:
+        """Contagem por estado, duração média por job e ETA (s) da execução."""
+        conn = self._conn()
+        counts = dict(conn.execute(
+            "SELECT state, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY state", (run_id,)).fetchall())
+        avg = conn.execute(
+            "SELECT AVG(finished_at - started_at) FROM jobs WHERE run_id = ? AND state IN (?, ?, ?) "
+            "AND started_at IS NOT NULL", (run_id, *DONE_STATES)).fetchone()[0]
+        total = sum(counts.values())
+        done = sum(counts.get(s, 0) for s in DONE_STATES)
+        remaining = total - done
+        eta = avg * remaining / max(1, workers) if avg is not None else None
+        return {"run_id": run_id, "total": total, "done": done, "remaining": remaining,
+                "counts": counts, "avg_job_s": avg, "eta_s": eta}
+
+    def failures(self, run_id: str) -> list[tuple]:
+        return self._conn().execute(
+            "SELECT job_key, attempts, error FROM jobs WHERE run_id = ? AND state = ? ORDER BY job_key",
+            (run_id, FAILED)).fetchall()
+
+
+def format_eta(seconds: float | None) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+if __name__ == "__main__":
+    journal = JobJournal()
+    if len(sys.argv) > 2 and sys.argv[1] == "status":
+        run_id = sys.argv[2]
+    else:
+        run_id = journal.last_run()
+    if not run_id:
+        print("Nenhuma execução registrada em", JOURNAL_PATH)
+        sys.exit(0)
+    info = journal.progress(run_id)
+    print(f"Execução {run_id}: {info['done']}/{info['total']} concluídos, estados {info['counts']}, "
+          f"ETA {format_eta(info['eta_s'])}")
+    for key, attempts, error in journal.failures(run_id):
+        print(f"  [falhou x{attempts}] {key}: {error}")
@@ -0,0 +1,59 @@
+# Conexões SQLite compartilhadas pelos caches/índices locais do sistema
+# (system/cache/...). Usa WAL + busy_timeout para permitir que vários
+# processos do batch_runner leiam e escrevam no mesmo arquivo ao mesmo tempo.
+import os
+import sqlite3
+import threading
+
+CACHE_DIR = os.path.join("system", "cache")
+
+def connect(db_path: str, timeout: float = 30.0) -> sqlite3.Connection:
+    """
+    Abre (criando a pasta se preciso) um banco SQLite em modo autocommit,
+    com journal WAL e espera de até `timeout` segundos por locks de outros
+    processos. Transações de escrita devem usar `BEGIN IMMEDIATE`.
+    """
+    folder = os.path.dirname(db_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.OperationalError:
+        # outro processo pode estar trocando o modo ao mesmo tempo; o banco continua utilizável
+        pass
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ThreadLocalDB:
+    """
+    Uma conexão por thread para o mesmo arquivo (sqlite3 não compartilha
+    conexões entre threads com segurança). `schema` é executado na criação.
+    """
+
+    def __init__(self, db_path: str, schema: str | None = None):
+        self.path = db_path
+        self._local = threading.local()
+        self._conns = []            # todas as conexões abertas (de qualquer thread), para close()
+        self._conns_lock = threading.Lock()
+        if schema:
+            self.conn().executescript(schema)
+
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self):
+        """Fecha as conexões de todas as threads; uma chamada depois a conn() abre outra."""
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        self._local = threading.local()
+        for conn in conns:
+            conn.close()
@@ -1,27 +1,30 @@
 import sys
 import os
 import json
-import pandas as pd
-import ast
-import re
 import math
 
-from flask import Flask, render_template, request, jsonify, send_from_directory, abort, render_template_string
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, abort, render_template_string
 from glob import glob
 
 from setup import *  # mantém seus helpers/constantes
-from places import search_places, get_api_key, make_csv_filename
-from routes_matrix import routesMatrix, concatenate_dataframes
+from metrics import get_metrics
+
+# Os módulos de busca/matriz (pandas, cliente da API) são importados dentro de
+# run_web/run_cli: importar o main.py não lê a chave nem carrega o pandas.
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 
 # -------------------------------------------------------------------
 # API Key
 # -------------------------------------------------------------------
-g_api_key = get_api_key()
-if not g_api_key:
-    print("Erro: API Key não encontrada! Verifique o arquivo system/api_key.txt")
-    sys.exit(1)
+def require_api_key() -> str:
+    from places import get_api_key
+
+    api_key = get_api_key()
+    if not api_key:
+        print("Erro: API Key não encontrada! Verifique o arquivo system/api_key.txt")
+        sys.exit(1)
+    return api_key
 
 # -------------------------------------------------------------------
 # WEB
@@ -34,6 +37,7 @@ def _clean_for_json(obj):
         return [_clean_for_json(v) for v in obj]
     try:
         # pandas/numpy NaN
+        import pandas as pd
         if pd.isna(obj):
             return None
     except Exception:
@@ -44,7 +48,38 @@ def _clean_for_json(obj):
     return obj
 
 
+def _flag(value) -> bool:
+    return str(value).strip().lower() in ('1', 'true', 'on', 'sim')
+
+RESULTS_ROOT = os.path.abspath(os.path.join("system", "results"))
+
+def _results_path(filename: str) -> str | None:
+    """
+    Caminho do CSV de resultados pelo catálogo (inclui as pastas por região).
+    Só aceita um nome de arquivo simples: nada com separador de pasta ou '..',
+    e nenhum caminho fora de system/results.
+    """
+    from werkzeug.security import safe_join
+    from results_manifest import get_manifest
+
+    if not filename or '..' in filename or '/' in filename or '\\' in filename or os.sep in filename:
+        return None
+    path = get_manifest().find_path(filename) or safe_join(RESULTS_ROOT, filename)
+    if not path or not os.path.isfile(path):
+        return None
+    path, root = os.path.realpath(path), os.path.realpath(RESULTS_ROOT)
+    return path if os.path.commonpath([path, root]) == root else None
+
+
 def run_web():
+    from search_jobs import SearchJobManager, run_search, sse_stream
+    from result_cache import get_result_cache, row_to_result
+    from enrichment import enrich_place
+    from places import PlacesApiError
+
+    g_api_key = require_api_key()
+    search_jobs = SearchJobManager(g_api_key)
+
     @app.route('/')
     def index():
         return render_template('index.html')
@@ -58,92 +93,104 @@ def run_web():
         if not place_type or not lat or not lng:
             return jsonify({'error': 'Faltam parâmetros: type, lat, lng'}), 400
 
-        print(f"Rodando search_places para {place_type} em ({lat}, {lng})")
         try:
-            search_places(lat, lng, place_type, api_key=g_api_key)
+            result = run_search(place_type, lat, lng, request.args.get('source', 'auto').strip().lower(), g_api_key,
+                                lite=_flag(request.args.get('lite')))
+        except ValueError:
+            return jsonify({'error': 'lat/lng inválidos'}), 400
+        except PlacesApiError as e:
+            # status de erro da API (antes virava "sem resultados"): INVALID_REQUEST é parâmetro ruim do pedido
+            code = 400 if e.status == 'INVALID_REQUEST' else 502
+            return jsonify({'error': f'A Places API recusou a busca ({e.status})', 'detail': str(e)}), code
         except Exception as e:
             app.logger.exception("search_places falhou")
             return jsonify({'error': f'Falha ao consultar Places ({type(e).__name__})', 'detail': str(e)}), 502
+        source, coverage, csv_path = result['source'], result['coverage'], result['csv_path']
 
-        csv_filename = make_csv_filename(place_type, lat, lng)
-        csv_path = os.path.join("system", "results", csv_filename)
-        download_url = f"/download/{csv_filename}"
+        if result['rows'] is not None:
+            results_json = json.dumps([row_to_result(row) for row in result['rows']], ensure_ascii=False)
+            envelope = json.dumps(_clean_for_json({'download_url': None, 'source': source, 'coverage': coverage}))
+            return Response('{"results": ' + results_json + ', ' + envelope[1:], mimetype='application/json')
 
-        if not os.path.exists(csv_path):
+        download_url = f"/download/{result['csv_filename']}"
+        if not csv_path:
             return jsonify({'error': 'Resultado não encontrado. Tente novamente.'}), 500
 
-        results = []
         try:
-            df = pd.read_csv(
-            csv_path,
-            sep=';',
-            encoding='utf-8-sig',
-            keep_default_na=False,   # não transformar vazio em NaN
-            na_values=[],            # não considerar nenhum valor como NA
-            dtype=str                # tudo vem como string (evita NaN)
-        )
-            for _, row in df.iterrows():
-                weekday_text_raw = row.get('weekday_text', '')
-                try:
-                    weekday_text_list = json.loads(weekday_text_raw)
-                    if not isinstance(weekday_text_list, list):
-                        weekday_text_list = ['Horário não informado']
-                except Exception:
-                    weekday_text_list = ['Horário não informado']
-
-                weekday_map = {}
-                for linha in weekday_text_list:
-                    if ': ' in linha:
-                        k, v = linha.split(': ', 1)
-                        weekday_map[k] = v
-
-                viewport = row.get('viewport', '{}')
-                if isinstance(viewport, str):
-                    try:
-                        viewport = ast.literal_eval(viewport)
-                    except Exception:
-                        viewport = {}
-
-                types_raw = row.get('types', '[]')
-                try:
-                    types_list = json.loads(types_raw) if isinstance(types_raw, str) else (types_raw or [])
-                    if not isinstance(types_list, list):
-                        types_list = [str(types_list)]
-                except Exception:
-                    # fallback bem tolerante
-                    types_list = [t.strip().strip("'\"") for t in str(types_raw).strip("[]").split(",") if t.strip()]
-
-                results.append({
-                    'name': row.get('name', ''),
-                    'city_state': row.get('city_state', ''),
-                    'address': row.get('address', ''),
-                    'business_status': row.get('business_status', ''),
-                    'open_now': str(row.get('open_now', '')).strip().lower() == 'true',
-                    'weekday_text': weekday_text_list,
-                    'weekday_map': weekday_map,
-                    'types': types_list,
-                    'search_type': row.get('search_type',''),
-                    'latitude': row.get('latitude', ''),
-                    'longitude': row.get('longitude', ''),
-                    'viewport': viewport
-                })
+            results_json = get_result_cache().results_json(csv_path)
         except Exception as e:
             print("Erro ao ler CSV:", e)
             return jsonify({'error': 'Erro ao ler resultados'}), 500
 
-        payload = {
-            'results': results,
-            'download_url': download_url
-        }
-        return jsonify(_clean_for_json(payload))
-    
+        # a lista de resultados já vem serializada do cache; só o envelope é montado aqui
+        envelope = json.dumps(_clean_for_json({'download_url': download_url, 'source': source, 'coverage': coverage}))
+        body = '{"results": ' + results_json + ', ' + envelope[1:]
+        return Response(body, mimetype='application/json')
+
+
+    # Buscas em segundo plano: POST cria o job; o andamento vem por polling
+    # (GET /search/jobs/<id>?since=N) ou por SSE (GET /search/jobs/<id>/events)
+    @app.route('/search/jobs', methods=['POST'])
+    def start_search_job():
+        params = request.get_json(silent=True) or request.form
+        place_type = str(params.get('type', '')).strip()
+        lat = str(params.get('lat', '')).strip()
+        lng = str(params.get('lng', '')).strip()
+        if not place_type or not lat or not lng:
+            return jsonify({'error': 'Faltam parâmetros: type, lat, lng'}), 400
+        try:
+            float(lat), float(lng)
+        except ValueError:
+            return jsonify({'error': 'lat/lng inválidos'}), 400
+        job = search_jobs.submit(place_type, lat, lng, str(params.get('source', 'auto')).strip().lower(),
+                                 lite=_flag(params.get('lite')))
+        return jsonify({'job_id': job.id,
+                         'status_url': f'/search/jobs/{job.id}',
+                         'events_url': f'/search/jobs/{job.id}/events'}), 202
+
+    @app.route('/search/jobs/<job_id>')
+    def search_job_status(job_id):
+        job = search_jobs.get(job_id)
+        if job is None:
+            abort(404, "Job não encontrado.")
+        return jsonify(_clean_for_json(job.snapshot(request.args.get('since', 0, type=int))))
+
+    @app.route('/search/jobs/<job_id>/events')
+    def search_job_events(job_id):
+        job = search_jobs.get(job_id)
+        if job is None:
+            abort(404, "Job não encontrado.")
+        since = request.headers.get('Last-Event-ID', type=int)
+        since = since + 1 if since is not None else request.args.get('since', 0, type=int)
+        return Response(sse_stream(job, since), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    # Horários sob demanda de um lugar gravado no modo lite (o cartão foi expandido);
+    # com ?file=<csv>, a linha do arquivo também é completada
+    @app.route('/places/<place_id>/details')
+    def place_details(place_id):
+        filename = request.args.get('file')
+        csv_path = _results_path(filename) if filename else None
+        if filename and not csv_path:
+            abort(404, "Arquivo não encontrado.")
+        try:
+            return jsonify(enrich_place(place_id, g_api_key, csv_path))
+        except Exception as e:
+            app.logger.exception("Place Details falhou")
+            return jsonify({'error': f'Falha ao consultar detalhes ({type(e).__name__})', 'detail': str(e)}), 502
 
     @app.route('/download/<path:filename>')
     def download_file(filename):
-        path = os.path.join("system", "results", filename)
-        if not os.path.exists(path):
+        path = _results_path(filename)
+        if not path:
             abort(404, "Arquivo não encontrado.")
-        return send_from_directory('system/results', filename, as_attachment=True)
+        # servido sempre a partir de system/results (o send_from_directory confere o caminho relativo)
+        root = os.path.realpath(RESULTS_ROOT)
+        return send_from_directory(root, os.path.relpath(path, root), as_attachment=True)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(get_metrics().to_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
     # (Opcional) ver tabela HTML de um arquivo específico
     @app.route('/view')
@@ -151,21 +198,24 @@ def run_web():
         filename = request.args.get('file')
         if not filename:
             return "Informe ?file=<nome>.csv", 400
-        csv_path = os.path.join('system', 'results', filename)
-        if not os.path.exists(csv_path):
+        csv_path = _results_path(filename)
+        if not csv_path:
             return "Arquivo não encontrado", 404
-        df = pd.read_csv(csv_path, sep=';')
         return render_template_string("""
             <h1>Resultados</h1>
             {{ table | safe }}
-        """, table=df.to_html())
+        """, table=get_result_cache().view_html(csv_path))
 
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
 
 # -------------------------------------------------------------------
 # CLI (mantive sua lógica; lembre: precisa passar um place_type válido)
 # -------------------------------------------------------------------
 def run_cli():
+    import pandas as pd
+    from places import search_places, PlacesApiError
+    from routes_matrix import routesMatrix
+
     has_setup = open(os.path.join(path_system, 'has_setup.txt'), 'r').read().strip()
     if has_setup == '0':
         os.system('pip install --upgrade pip')
@@ -178,7 +228,7 @@ def run_cli():
 
     files = glob(f'{path_input}*.csv')
     nbp = rm = False
-    api_key = g_api_key
+    api_key = require_api_key()
 
     for base in files:
         name = os.path.basename(base)
@@ -208,19 +258,30 @@ def run_cli():
                         lng = df.at[idx, 'longitude']
                         coords = f"{lat},{lng}"
                         print(f"Buscando NearbyPlaces para {nome} em {coords} - tipo: {tipo}")
-                        search_places(
-                            api_key=api_key,
-                            coordinates=coords,
-                            place_type=tipo,
-                            input_dataframe=df,
-                            row=idx,
-                            empreendimento=nome,
-                            base=base
-                        )
+                        try:
+                            search_places(
+                                api_key=api_key,
+                                coordinates=coords,
+                                place_type=tipo,
+                                input_dataframe=df,
+                                row=idx,
+                                empreendimento=nome,
+                                base=base
+                            )
+                        except (PlacesApiError, OSError) as e:
+                            print(f"Erro na busca de {tipo} em {coords}: {e}")
                 nbp = True
 
             elif opt == '2':
-                routesMatrix()
+                print("Modo: [1] a pé via API (padrão)   [2] só linha reta, sem API   [3] API só para os K mais próximos")
+                mode = input('> ').strip()
+                if mode == '2':
+                    routesMatrix(mode='geodesic')
+                elif mode == '3':
+                    k = input('K (padrão 5): ').strip()
+                    routesMatrix(top_k=int(k) if k.isdigit() and int(k) > 0 else 5)
+                else:
+                    routesMatrix()
                 rm = True
 
             elif opt == '3':
@@ -240,6 +301,7 @@ def run_cli():
 # Entry point
 # -------------------------------------------------------------------
 if __name__ == '__main__':
+    init_console()
     if len(sys.argv) > 1 and sys.argv[1] == 'web':
         run_web()
     else:
@@ -0,0 +1,297 @@
+# Imitação local da API do Google Maps para testes de desempenho sem gastar
+# cota. Responde Nearby Search, Place Details, Geocoding (direto e reverso) e
+# Distance Matrix a partir dos CSVs já coletados em system/results, com
+# latência, erros HTTP 500 e OVER_QUERY_LIMIT injetados sob configuração.
+#
+# O código do projeto fala com ela trocando transport.BASE_URL (ou a variável
+# de ambiente MAPS_BASE_URL antes de iniciar o processo).
+#
+# Uso pela linha de comando:
+#   python maps_standin.py [--port 8765] [--latency-ms 80] [--jitter-ms 40] [--error-rate 0.01] [--oql-rate 0.02]
+#   MAPS_BASE_URL=http://127.0.0.1:8765 python batch_runner.py ...
+import os
+import ast
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from fan_in import CATEGORY_TYPES
+from geo import GridIndex, haversine_km
+from results_manifest import ResultsManifest, MANIFEST_PATH, RESULTS_DIR
+from transport import ENDPOINTS
+
+DEFAULT_PORT = 8765
+NEARBY_RESULTS = 20         # uma página da Nearby Search
+WALK_DETOUR = 1.3           # distância a pé ~ 1,3x a linha reta
+WALK_SPEED_MS = 1.25        # m/s
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+
+_PATHS = {path: name for name, path in ENDPOINTS.items()}
+
+
+class Fixtures:
+    """
+    Lugares guardados (por tipo, com GridIndex), detalhes por place_id e origens
+    das buscas. `generic` junta os tipos que a Nearby Search não filtra (hotel,
+    shop, ...; fan_in.CATEGORY_TYPES): é o que a busca responde a um tipo sem filtro.
+    """
+
+    def __init__(self, frame: pd.DataFrame, origins: list[tuple]):
+        self.places = {}
+        for search_type, df in frame.groupby("search_type"):
+            df = df.reset_index(drop=True)
+            self.places[search_type] = (df, GridIndex(df["_lat"], df["_lng"], cell_deg=0.05))
+        everything = frame.drop_duplicates("id").reset_index(drop=True)
+        generic = frame[frame["search_type"].isin(CATEGORY_TYPES)].drop_duplicates("id").reset_index(drop=True)
+        self.generic = (generic, GridIndex(generic["_lat"], generic["_lng"], cell_deg=0.05)) if len(generic) else None
+        self.all = (everything, GridIndex(everything["_lat"], everything["_lng"], cell_deg=0.05))
+        self.details = dict(zip(everything["id"], zip(everything["weekday_text"], everything["open_now"])))
+        self.origins = origins     # (lat, lng, search_type) das buscas originais
+
+    def __len__(self):
+        return len(self.all[0])
+
+
+def load_fixtures(manifest_path: str = MANIFEST_PATH, results_dir: str = RESULTS_DIR,
+                  max_files: int | None = None) -> Fixtures:
+    """Lê os CSVs do catálogo (caminhos absolutos: pode mudar de pasta depois)."""
+    manifest = ResultsManifest(os.path.abspath(manifest_path), os.path.abspath(results_dir))
+    entries = [e for e in manifest.entries() if e["search_type"] and e["lat"] is not None]
+    if max_files:
+        entries = entries[:max_files]
+    frames, origins = [], []
+    for entry in entries:
+        try:
+            df = pd.read_csv(os.path.abspath(entry["path"]), sep=";", encoding="utf-8-sig", dtype=str,
+                             keep_default_na=False)
+        except Exception:
+            continue
+        df["search_type"] = entry["search_type"]
+        frames.append(df)
+        origins.append((entry["lat"], entry["lng"], entry["search_type"]))
+    if not frames:
+        raise RuntimeError("Nenhum resultado catalogado para montar as fixtures (rode results_manifest.py rebuild).")
+    frame = pd.concat(frames, ignore_index=True)
+    frame["_lat"] = pd.to_numeric(frame["latitude"], errors="coerce")
+    frame["_lng"] = pd.to_numeric(frame["longitude"], errors="coerce")
+    frame = frame.dropna(subset=["_lat", "_lng"])
+    frame = frame[frame["id"] != ""].drop_duplicates(["search_type", "id"])
+    return Fixtures(frame, origins)
+
+
+def _viewport(raw: str) -> dict:
+    try:
+        return ast.literal_eval(raw) if raw else {}
+    except Exception:
+        return {}
+
+def _place(row: dict) -> dict:
+    try:
+        types = json.loads(row.get("types") or "[]")
+    except Exception:
+        types = []
+    return {
+        "place_id": row["id"],
+        "name": row.get("name", ""),
+        "vicinity": row.get("address", ""),
+        "business_status": row.get("business_status") or "OPERATIONAL",
+        "types": types,
+        "geometry": {"location": {"lat": row["_lat"], "lng": row["_lng"]}, "viewport": _viewport(row.get("viewport"))},
+    }
+
+def _latlng(text: str):
+    lat, lng = str(text).split(",")
+    return float(lat), float(lng)
+
+
+class StandInState:
+    """Configuração das falhas injetadas + contadores por endpoint (thread-safe)."""
+
+    def __init__(self, fixtures: Fixtures, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, oql_rate: float = 0.0, seed: int | None = None):
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.oql_rate = oql_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {name: {"calls": 0, "errors": 0, "over_query_limit": 0} for name in ENDPOINTS}
+
+    def draw(self, endpoint: str) -> tuple[float, str | None]:
+        """(latência em s, falha: None | 'error' | 'oql') da próxima resposta."""
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            roll = self._random.random()
+            fault = "error" if roll < self.error_rate else (
+                "oql" if roll < self.error_rate + self.oql_rate else None)
+            counts = self.counts[endpoint]
+            counts["calls"] += 1
+            if fault == "error":
+                counts["errors"] += 1
+            elif fault == "oql":
+                counts["over_query_limit"] += 1
+        return delay, fault
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: dict(c) for name, c in self.counts.items()}
+
+    # ---------- respostas ----------
+    def nearby(self, q: dict) -> dict:
+        lat, lng = _latlng(q["location"])
+        place_type = q.get("type", "")
+        # como a API: um tipo que ela não filtra devolve os estabelecimentos mais próximos
+        unfiltered = place_type in CATEGORY_TYPES or place_type not in self.fixtures.places
+        entry = self.fixtures.generic if unfiltered else self.fixtures.places[place_type]
+        if entry is None:
+            return {"status": "ZERO_RESULTS", "results": []}
+        df, grid = entry
+        idx, _ = grid.nearest(lat, lng, k=NEARBY_RESULTS)
+        results = [_place(row) for row in df.iloc[idx].to_dict("records")]
+        return {"status": "OK" if results else "ZERO_RESULTS", "results": results}
+
+    def details(self, q: dict) -> dict:
+        found = self.fixtures.details.get(q.get("place_id"))
+        if found is None:
+            return {"status": "NOT_FOUND"}
+        weekday_text, open_now = found
+        try:
+            lines = json.loads(weekday_text)
+        except Exception:
+            lines = []
+        result = {}
+        if lines and lines != ["Não disponível"]:
+            result["opening_hours"] = {"weekday_text": lines, "open_now": str(open_now).lower() == "true"}
+        return {"status": "OK", "result": result}
+
+    def geocode(self, q: dict) -> dict:
+        df, grid = self.fixtures.all
+        if "latlng" in q:
+            idx, _ = grid.nearest(*_latlng(q["latlng"]), k=1)
+            if not len(idx):
+                return {"status": "ZERO_RESULTS", "results": []}
+            city, _, uf = str(df.iloc[idx[0]]["city_state"]).partition("/")
+            components = [{"long_name": city, "short_name": city, "types": ["administrative_area_level_2", "political"]},
+                          {"long_name": uf, "short_name": uf, "types": ["administrative_area_level_1", "political"]}]
+            return {"status": "OK", "results": [{"address_components": components}]}
+        text = q.get("address", "").strip().lower()
+        match = df[df["address"].str.lower().str.contains(text, regex=False)] if text else df.iloc[:0]
+        if match.empty:
+            return {"status": "ZERO_RESULTS", "results": []}
+        row = match.iloc[0]
+        return {"status": "OK", "results": [{"formatted_address": row["address"],
+                                             "geometry": {"location": {"lat": row["_lat"], "lng": row["_lng"]}}}]}
+
+    def distance_matrix(self, q: dict) -> dict:
+        origins = [_latlng(o) for o in q.get("origins", "").split("|") if o]
+        destinations = [_latlng(d) for d in q.get("destinations", "").split("|") if d]
+        if not origins or not destinations or len(destinations) > MAX_DESTINATIONS:
+            return {"status": "INVALID_REQUEST", "rows": []}
+        if len(origins) * len(destinations) > MAX_ELEMENTS:
+            return {"status": "MAX_ELEMENTS_EXCEEDED", "rows": []}
+        d_lat = np.array([d[0] for d in destinations])
+        d_lng = np.array([d[1] for d in destinations])
+        rows = []
+        for o_lat, o_lng in origins:
+            meters = haversine_km(o_lat, o_lng, d_lat, d_lng) * 1000 * WALK_DETOUR
+            rows.append({"elements": [
+                {"status": "OK", "distance": {"value": int(m), "text": f"{m / 1000:.1f} km"},
+                 "duration": {"value": int(m / WALK_SPEED_MS), "text": f"{int(m / WALK_SPEED_MS / 60)} min"}}
+                for m in meters]})
+        return {"status": "OK", "origin_addresses": [], "destination_addresses": [], "rows": rows}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"      # keep-alive, como a API de verdade
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = _PATHS.get(url.path)
+        if endpoint is None:
+            return self._send(404, {"status": "NOT_FOUND"})
+        state = self.server.state
+        delay, fault = state.draw(endpoint)
+        if delay:
+            time.sleep(delay)
+        if fault == "error":
+            return self._send(500, {"status": "UNKNOWN_ERROR"})
+        if fault == "oql":
+            return self._send(200, {"status": "OVER_QUERY_LIMIT", "error_message": "cota simulada"})
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            body = getattr(state, endpoint)(q)
+        except Exception as e:
+            body = {"status": "INVALID_REQUEST", "error_message": str(e)}
+        self._send(200, body)
+
+    def _send(self, code: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class MapsStandIn:
+    """Servidor HTTP da imitação, rodando numa thread; use como context manager."""
+
+    def __init__(self, fixtures: Fixtures, port: int = 0, host: str = "127.0.0.1", **faults):
+        self.state = StandInState(fixtures, **faults)
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.state = self.state
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MapsStandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="maps-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Imitação local da API do Google Maps a partir de system/results.")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Latência média por resposta (ms).")
+    p.add_argument("--jitter-ms", type=float, default=0.0, help="Variação uniforme da latência (± ms).")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fração de respostas HTTP 500.")
+    p.add_argument("--oql-rate", type=float, default=0.0, help="Fração de respostas OVER_QUERY_LIMIT.")
+    p.add_argument("--seed", type=int, default=None)
+    args = p.parse_args()
+
+    fixtures = load_fixtures()
+    standin = MapsStandIn(fixtures, port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                          error_rate=args.error_rate, oql_rate=args.oql_rate, seed=args.seed)
+    print(f"{len(fixtures)} lugares em {len(fixtures.places)} tipos; servindo em {standin.base_url}")
+    print(f"Use: MAPS_BASE_URL={standin.base_url} python batch_runner.py ...")
+    try:
+        standin._server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n" + json.dumps(standin.state.snapshot(), indent=2))
@@ -0,0 +1,224 @@
+# Métricas de processo: chamadas à API por endpoint (contagem, latência,
+# status) e tempo das etapas dos pipelines (geocode, nearby, details,
+# gravação do CSV, mudança de pasta por região, lotes do Distance Matrix).
+#
+# Exposto em formato Prometheus na rota /metrics do main.py e gravado como
+# resumo JSON ao fim de cada batch_runner. Opcionalmente cada etapa roda sob
+# cProfile e os perfis acumulados são gravados (um .prof por etapa).
+#
+# Uso:
+#   from metrics import get_metrics
+#   with get_metrics().stage("nearby"):
+#       ...
+import os
+import time
+import json
+import threading
+from contextlib import contextmanager
+
+# limites (s) dos histogramas de latência
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "hab"
+
+
+class Histogram:
+    """Histograma cumulativo no formato Prometheus (buckets + soma + contagem)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # o último é +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, limit in enumerate(self.buckets):
+            if value <= limit:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        out, total = [], 0
+        for limit, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            out.append(("+Inf" if limit == float("inf") else repr(limit), total))
+        return out
+
+    def quantile(self, q: float) -> float | None:
+        """Estimativa por interpolação linear dentro do bucket (como o histogram_quantile do Prometheus)."""
+        if not self.count:
+            return None
+        target, total, lower = q * self.count, 0, 0.0
+        for limit, n in zip(self.buckets, self.counts):
+            if n and total + n >= target:
+                return min(lower + (limit - lower) * (target - total) / n, self.max)
+            total += n
+            lower = limit
+        return self.max
+
+
+class Metrics:
+    """Registro thread-safe de contadores e histogramas por rótulo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.calls = {}          # (endpoint, status) -> nº de chamadas
+        self.call_latency = {}   # endpoint -> Histogram
+        self.stages = {}         # etapa -> Histogram
+        self.stage_errors = {}   # etapa -> nº de exceções
+        self._profile_dir = None
+        self._profiles = {}      # etapa -> pstats.Stats acumulado
+        self.profile_skipped = 0
+
+    # ---------- registro ----------
+    def observe_call(self, endpoint: str | None, seconds: float, status: str):
+        endpoint = endpoint or "other"
+        with self._lock:
+            key = (endpoint, str(status))
+            self.calls[key] = self.calls.get(key, 0) + 1
+            self.call_latency.setdefault(endpoint, Histogram()).observe(seconds)
+
+    def call_counts(self) -> dict:
+        """Chamadas por endpoint (todos os status)."""
+        with self._lock:
+            out = {}
+            for (endpoint, _), n in self.calls.items():
+                out[endpoint] = out.get(endpoint, 0) + n
+            return out
+
+    def observe_stage(self, name: str, seconds: float, failed: bool = False):
+        with self._lock:
+            self.stages.setdefault(name, Histogram()).observe(seconds)
+            if failed:
+                self.stage_errors[name] = self.stage_errors.get(name, 0) + 1
+
+    @contextmanager
+    def stage(self, name: str):
+        """Cronometra o bloco como etapa `name` (e o perfila, se o cProfile estiver ligado)."""
+        profiler = self._start_profile()
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.observe_stage(name, time.perf_counter() - start, failed)
+            if profiler is not None:
+                self._stop_profile(name, profiler)
+
+    # ---------- cProfile ----------
+    def enable_profiling(self, directory: str):
+        """Liga o cProfile por etapa; os perfis vão para <directory>/<etapa>.prof em dump_profiles()."""
+        self._profile_dir = directory
+
+    def _start_profile(self):
+        if self._profile_dir is None:
+            return None
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # outro perfilador ativo (etapas aninhadas/paralelas): esta execução fica sem perfil
+            with self._lock:
+                self.profile_skipped += 1
+            return None
+        return profiler
+
+    def _stop_profile(self, name: str, profiler):
+        import pstats
+        profiler.disable()
+        with self._lock:
+            if name in self._profiles:
+                self._profiles[name].add(profiler)
+            else:
+                self._profiles[name] = pstats.Stats(profiler)
+
+    def dump_profiles(self) -> list[str]:
+        if self._profile_dir is None:
+            return []
+        os.makedirs(self._profile_dir, exist_ok=True)
+        paths = []
+        with self._lock:
+            for name, stats in self._profiles.items():
+                path = os.path.join(self._profile_dir, f"{name}.prof")
+                stats.dump_stats(path)
+                paths.append(path)
+        return paths
+
+    # ---------- saídas ----------
+    def summary(self) -> dict:
+        """Resumo JSON: chamadas por endpoint/status, latências e tempos por etapa."""
+        def hist(h: Histogram) -> dict:
+            return {"count": h.count, "total_s": round(h.sum, 3),
+                    "mean_ms": round(h.sum / h.count * 1000, 1) if h.count else None,
+                    "p50_ms": _ms(h.quantile(0.5)), "p95_ms": _ms(h.quantile(0.95)), "max_ms": _ms(h.max)}
+
+        with self._lock:
+            endpoints = {}
+            for (endpoint, status), n in sorted(self.calls.items()):
+                endpoints.setdefault(endpoint, {"calls": 0, "status": {}})
+                endpoints[endpoint]["calls"] += n
+                endpoints[endpoint]["status"][status] = n
+            for endpoint, h in self.call_latency.items():
+                endpoints[endpoint]["latency"] = hist(h)
+            stages = {name: {**hist(h), "errors": self.stage_errors.get(name, 0)}
+                      for name, h in sorted(self.stages.items())}
+            return {"uptime_s": round(time.time() - self.started_at, 1), "endpoints": endpoints, "stages": stages}
+
+    def to_prometheus(self) -> str:
+        """Texto no formato de exposição do Prometheus (version 0.0.4)."""
+        lines = [f"# HELP {PREFIX}_api_calls_total Chamadas à API do Google Maps por endpoint e status.",
+                 f"# TYPE {PREFIX}_api_calls_total counter"]
+        with self._lock:
+            for (endpoint, status), n in sorted(self.calls.items()):
+                lines.append(f'{PREFIX}_api_calls_total{{endpoint="{endpoint}",status="{status}"}} {n}')
+            lines += _histogram_lines(f"{PREFIX}_api_call_seconds", "Latência das chamadas à API.",
+                                      "endpoint", self.call_latency)
+            lines += _histogram_lines(f"{PREFIX}_stage_seconds", "Tempo das etapas dos pipelines.",
+                                      "stage", self.stages)
+            lines += [f"# HELP {PREFIX}_stage_errors_total Etapas encerradas com exceção.",
+                      f"# TYPE {PREFIX}_stage_errors_total counter"]
+            for name, n in sorted(self.stage_errors.items()):
+                lines.append(f'{PREFIX}_stage_errors_total{{stage="{name}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, path: str, extra: dict | None = None) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**(extra or {}), **self.summary()}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+def _histogram_lines(name: str, help_text: str, label: str, histograms: dict) -> list[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for value, h in sorted(histograms.items()):
+        for le, n in h.cumulative():
+            lines.append(f'{name}_bucket{{{label}="{value}",le="{le}"}} {n}')
+        lines.append(f'{name}_sum{{{label}="{value}"}} {h.sum:.6f}')
+        lines.append(f'{name}_count{{{label}="{value}"}} {h.count}')
+    return lines
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics() -> Metrics:
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
@@ -0,0 +1,235 @@
+# Reverse geocoding offline de "Município/UF" para coordenadas no Brasil.
+#
+# Base: system/municipios.csv — sede de cada município (código IBGE, nome,
+# UF, lat/lng), gerada a partir do GeoNames (cities500, CC-BY 4.0) cruzado
+# com a lista de municípios do IBGE. `ambiguo=1` marca municípios cujo nome
+# bateu com mais de um lugar do GeoNames (a sede exata não é conhecida).
+#
+# Ordem de resolução:
+#   1) respostas já aprendidas (system/cache/geocode.sqlite, por coordenada arredondada);
+#   2) sede mais próxima no índice espacial, se não for ambígua;
+#   3) fallback (reverse geocode na API), cuja resposta é aprendida — inclusive
+#      "Desconhecido", que vale por NEGATIVE_TTL. Consultas simultâneas ao mesmo
+#      ponto (um job por tipologia) esperam a primeira em vez de repetir a chamada.
+#
+# Uso pela linha de comando:
+#   python municipios.py -23.5505 -46.6333
+#   python municipios.py seed     (aprende as coordenadas de origem dos CSVs de system/results)
+import os
+import re
+import csv
+import sys
+import time
+import threading
+from glob import glob
+from contextlib import contextmanager
+
+from local_db import CACHE_DIR, ThreadLocalDB
+
+MUNICIPIOS_PATH = os.path.join("system", "municipios.csv")
+GEOCODE_CACHE_PATH = os.path.join(CACHE_DIR, "geocode.sqlite")
+
+MAX_DISTANCE_KM = 30.0    # sede mais distante que isso: não arrisca, vai para a API
+AMBIGUITY_RATIO = 1.5     # a 2ª sede (de outro município) precisa estar ao menos 1.5x mais longe
+LEARNED_DECIMALS = 4      # ~11 m: precisão da chave das respostas aprendidas
+NEGATIVE_TTL = 7 * 24 * 3600   # segundos em que um "Desconhecido" da API vale antes de perguntar de novo
+
+UNKNOWN = "Desconhecido"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reverse_geocode (
+    lat_key    REAL NOT NULL,
+    lng_key    REAL NOT NULL,
+    city_state TEXT NOT NULL,
+    source     TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (lat_key, lng_key)
+);
+"""
+
+def _to_float(value) -> float:
+    return float(str(value).replace(",", "."))
+
+
+class MunicipalityIndex:
+    """Sedes municipais em um GridIndex, com teste de ambiguidade na consulta."""
+
+    def __init__(self, path: str = MUNICIPIOS_PATH):
+        self.codes, self.names, self.ufs, self.ambiguous = [], [], [], []
+        lats, lngs = [], []
+        with open(path, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f, delimiter=";"):
+                self.codes.append(row["codigo_ibge"])
+                self.names.append(row["nome"])
+                self.ufs.append(row["uf"])
+                self.ambiguous.append(row.get("ambiguo") == "1")
+                lats.append(float(row["latitude"]))
+                lngs.append(float(row["longitude"]))
+        from geo import GridIndex
+
+        self.index = GridIndex(lats, lngs, cell_deg=0.25)
+
+    def lookup(self, lat: float, lng: float) -> str | None:
+        """'Município/UF' se a sede mais próxima for inequívoca; senão None."""
+        idx, dist = self.index.nearest(lat, lng, k=8, max_km=MAX_DISTANCE_KM * AMBIGUITY_RATIO)
+        if not len(idx) or dist[0] > MAX_DISTANCE_KM:
+            return None
+        first = idx[0]
+        if self.ambiguous[first]:
+            return None
+        # a sede concorrente mais próxima precisa ser de outro município
+        for i, d in zip(idx[1:], dist[1:]):
+            if self.codes[i] != self.codes[first]:
+                if d < dist[0] * AMBIGUITY_RATIO:
+                    return None
+                break
+        return f"{self.names[first]}/{self.ufs[first]}"
+
+    def lookup_uf(self, lat: float, lng: float) -> str | None:
+        city_state = self.lookup(lat, lng)
+        return city_state.split("/")[-1] if city_state else None
+
+
+class CityStateResolver:
+    """
+    Resolve 'Município/UF' combinando respostas aprendidas, o índice offline e
+    um fallback opcional (API). Contadores: learned, offline, api, unknown.
+    """
+
+    def __init__(self, index: MunicipalityIndex | None = None, cache_path: str = GEOCODE_CACHE_PATH):
+        self.index = index or MunicipalityIndex()
+        self.cache_path = cache_path
+        self.counters = {"learned": 0, "offline": 0, "api": 0, "unknown": 0}
+        self._lock = threading.Lock()
+        self._point_locks = {}      # chave arredondada -> [Lock, nº de threads usando]
+        self._db = ThreadLocalDB(cache_path, _SCHEMA)
+
+    def _conn(self):
+        return self._db.conn()
+
+    def close(self):
+        self._db.close()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    @staticmethod
+    def _key(lat: float, lng: float):
+        return round(lat, LEARNED_DECIMALS), round(lng, LEARNED_DECIMALS)
+
+    @contextmanager
+    def _point_lock(self, key):
+        """Lock por coordenada arredondada: uma só chamada ao fallback por ponto."""
+        with self._lock:
+            entry = self._point_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._point_locks[key]
+
+    def learned(self, lat: float, lng: float) -> str | None:
+        """Resposta aprendida para o ponto; um "Desconhecido" mais velho que NEGATIVE_TTL não conta."""
+        row = self._conn().execute(
+            "SELECT city_state, created_at FROM reverse_geocode WHERE lat_key = ? AND lng_key = ?",
+            self._key(lat, lng)).fetchone()
+        if not row or (row[0] == UNKNOWN and time.time() - row[1] > NEGATIVE_TTL):
+            return None
+        return row[0]
+
+    def learn(self, lat: float, lng: float, city_state: str, source: str = "api"):
+        if not city_state:
+            return
+        self._conn().execute(
+            "INSERT OR REPLACE INTO reverse_geocode(lat_key, lng_key, city_state, source, created_at) "
+            "VALUES (?, ?, ?, ?, ?)", (*self._key(lat, lng), city_state, source, time.time()))
+
+    def resolve(self, latitude, longitude, fallback=None) -> str:
+        """
+        'Município/UF' para a coordenada. `fallback(lat, lng)` só é chamado
+        quando o ponto não está aprendido e a consulta offline é ambígua.
+        """
+        lat, lng = _to_float(latitude), _to_float(longitude)
+        city_state = self.learned(lat, lng)
+        if city_state:
+            self._count("learned")
+            return city_state
+        city_state = self.index.lookup(lat, lng)
+        if city_state:
+            self._count("offline")
+            return city_state
+        if fallback is None:
+            self._count("unknown")
+            return UNKNOWN
+        with self._point_lock(self._key(lat, lng)):
+            # outra thread pode ter perguntado à API enquanto esta esperava
+            city_state = self.learned(lat, lng)
+            if city_state:
+                self._count("learned")
+                return city_state
+            city_state = fallback(lat, lng) or UNKNOWN
+            self._count("api" if city_state != UNKNOWN else "unknown")
+            self.learn(lat, lng, city_state, source="api")
+        return city_state
+
+    def seed_from_results(self, results_dir: str = os.path.join("system", "results")) -> int:
+        """
+        Aprende o city_state das coordenadas de origem dos CSVs já gerados
+        (coordenada do nome do arquivo + city_state da 1ª linha).
+        """
+        pattern = re.compile(r"_near_(-?\d+(?:\.\d+)?)_(-?\d+(?:\.\d+)?)\.csv$")
+        seen = set()
+        for csv_path in glob(os.path.join(results_dir, "**", "*.csv"), recursive=True):
+            m = pattern.search(os.path.basename(csv_path))
+            if not m:
+                continue
+            key = self._key(float(m.group(1)), float(m.group(2)))
+            if key in seen:
+                continue
+            try:
+                with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+                    first = next(csv.DictReader(f, delimiter=";"), None)
+            except Exception:
+                continue
+            city_state = (first or {}).get("city_state")
+            if city_state and "/" in city_state:
+                self.learn(*key, city_state, source="results")
+                seen.add(key)
+        return len(seen)
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+def get_resolver() -> CityStateResolver:
+    """Resolver padrão do processo (carrega o índice na primeira chamada)."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = CityStateResolver()
+        return _resolver
+
+def reset_resolver():
+    """Fecha o resolver padrão; o próximo get_resolver() abre o cache da pasta atual."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is not None:
+            _resolver.close()
+        _resolver = None
+
+def resolve_city_state(latitude, longitude, fallback=None) -> str:
+    return get_resolver().resolve(latitude, longitude, fallback)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == "seed":
+        print(f"{get_resolver().seed_from_results()} coordenadas aprendidas de system/results")
+    elif len(sys.argv) == 3:
+        print(resolve_city_state(sys.argv[1], sys.argv[2]))
+    else:
+        print("Uso: python municipios.py <lat> <lng> | python municipios.py seed")
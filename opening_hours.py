@@ -0,0 +1,295 @@
+# Horários de funcionamento compilados em intervalos de "minutos da semana"
+# (segunda 00:00 = 0 ... domingo 23:59 = 10079). Cada lugar guarda a forma
+# compacta "início-fim,início-fim" na coluna hours_intervals dos resultados,
+# e a pergunta "quais estão abertos sábado às 20:00?" vira uma comparação
+# vetorizada com numpy sobre o dataset inteiro, sem reinterpretar texto.
+#
+# Entende o texto da API em pt-BR e em inglês: "Fechado"/"Closed",
+# "Atendimento 24 horas"/"Aberto 24 horas"/"Open 24 hours", turnos divididos
+# ("08:00 – 12:00, 14:00 – 18:00") e turnos que passam da meia-noite.
+#
+# Uso pela linha de comando:
+#   python opening_hours.py "sábado 20:00" [--type restaurant] [--region Sudeste]
+#   python opening_hours.py backfill      (grava hours_intervals nos CSVs que ainda não têm)
+import os
+import re
+import sys
+import json
+import argparse
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+COLUMN = "hours_intervals"
+SCHEMA_VERSION = 2          # versão dos CSVs de resultados que já trazem a coluna (results_manifest)
+
+# dia -> índice (segunda = 0, como datetime.weekday())
+_DAYS = {
+    "segunda-feira": 0, "segunda": 0, "monday": 0,
+    "terca-feira": 1, "terca": 1, "tuesday": 1,
+    "quarta-feira": 2, "quarta": 2, "wednesday": 2,
+    "quinta-feira": 3, "quinta": 3, "thursday": 3,
+    "sexta-feira": 4, "sexta": 4, "friday": 4,
+    "sabado": 5, "saturday": 5,
+    "domingo": 6, "sunday": 6,
+}
+
+_SPACES_RE = re.compile(r"[\s\u00a0\u2009\u200b\u202f\u2060\ufeff]+")
+_LINE_RE = re.compile(r"^\s*([^:]+?)\s*:\s*(.*)$")
+_TIME_RE = re.compile(r"(\d{1,2})(?:[:h](\d{2}))?\s*([ap]\.?\s?m\.?)?", re.IGNORECASE)
+_RANGE_RE = re.compile(
+    r"(\d{1,2}(?:[:h]\d{2})?\s*(?:[ap]\.?\s?m\.?)?)\s*[–—-]\s*(\d{1,2}(?:[:h]\d{2})?\s*(?:[ap]\.?\s?m\.?)?)",
+    re.IGNORECASE)
+_SUFFIX_RE = re.compile(r"[ap]\.?\s?m", re.IGNORECASE)
+_PM_RE = re.compile(r"p\.?\s?m", re.IGNORECASE)
+_ALWAYS_RE = re.compile(r"24\s*horas|24\s*hours|24h", re.IGNORECASE)
+_CLOSED_RE = re.compile(r"^(fechado|closed)$", re.IGNORECASE)
+
+
+def _plain(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return _SPACES_RE.sub(" ", text).strip().lower()
+
+@lru_cache(maxsize=4096)
+def time_to_minutes(token: str) -> int | None:
+    """'8:00 PM', '20:00', '20h', '8 pm' -> minutos desde 00:00 (None se não entender)."""
+    m = _TIME_RE.fullmatch(_SPACES_RE.sub(" ", token).strip())
+    if not m:
+        return None
+    hour, minute = int(m.group(1)), int(m.group(2) or 0)
+    suffix = (m.group(3) or "").replace(".", "").replace(" ", "").lower()
+    if suffix == "pm" and hour != 12:
+        hour += 12
+    elif suffix == "am" and hour == 12:
+        hour = 0
+    if hour > 24 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+@lru_cache(maxsize=4096)
+def to_24h(token: str) -> str:
+    """'8:00 PM' -> '20:00'; devolve o texto original se não for um horário."""
+    minutes = time_to_minutes(token)
+    if minutes is None:
+        return token
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+@lru_cache(maxsize=8192)
+def parse_day_hours(hours: str):
+    """
+    Texto de um dia -> tupla de (início, fim) em minutos do dia; () = fechado;
+    None = sem informação. O fim pode passar de 1440 (turno até a madrugada).
+    """
+    text = _SPACES_RE.sub(" ", hours or "").strip()
+    if not text:
+        return None
+    if _ALWAYS_RE.search(text):
+        return ((0, MINUTES_PER_DAY),)
+    if _CLOSED_RE.match(text):
+        return ()
+    shifts = []
+    for start_raw, end_raw in _RANGE_RE.findall(text):
+        start, end = time_to_minutes(start_raw), time_to_minutes(end_raw)
+        if start is None or end is None:
+            continue
+        # "9:00 – 5:00 PM" / "5:00 – 11:00 PM": sem sufixo, o início herda o do fim
+        if not _SUFFIX_RE.search(start_raw) and _PM_RE.search(end_raw) and start < 720 and start + 720 < end:
+            start += 720
+        if end <= start:
+            end += MINUTES_PER_DAY
+        shifts.append((start, end))
+    return tuple(shifts) if shifts else None
+
+@lru_cache(maxsize=8192)
+def _parse_lines(lines: tuple) -> tuple | None:
+    intervals, known = [], False
+    for line in lines:
+        m = _LINE_RE.match(str(line))
+        if not m:
+            continue
+        day = _DAYS.get(_plain(m.group(1)))
+        if day is None:
+            continue
+        shifts = parse_day_hours(m.group(2))
+        if shifts is None:
+            continue
+        known = True
+        base = day * MINUTES_PER_DAY
+        for start, end in shifts:
+            start, end = base + start, base + end
+            if end > MINUTES_PER_WEEK:
+                # domingo à noite até segunda de madrugada: volta para o início da semana
+                intervals.append((0, end - MINUTES_PER_WEEK))
+                end = MINUTES_PER_WEEK
+            intervals.append((start, end))
+    if not known:
+        return None
+    return tuple(_merge(intervals))
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def parse_weekday_text(weekday_text) -> tuple | None:
+    """
+    Lista de linhas "dia: horários" (ou o JSON dela, como fica no CSV) ->
+    intervalos (início, fim) em minutos da semana; () = sempre fechado;
+    None = horário não informado.
+    """
+    if isinstance(weekday_text, str):
+        try:
+            weekday_text = json.loads(weekday_text)
+        except Exception:
+            return None
+    if not isinstance(weekday_text, list):
+        return None
+    return _parse_lines(tuple(str(line) for line in weekday_text))
+
+def encode_intervals(intervals) -> str:
+    """Forma compacta guardada no CSV: '' = não informado, '-' = sempre fechado, 'a-b,c-d'."""
+    if intervals is None:
+        return ""
+    if not intervals:
+        return "-"
+    return ",".join(f"{start}-{end}" for start, end in intervals)
+
+@lru_cache(maxsize=8192)
+def decode_intervals(encoded: str) -> tuple | None:
+    if not encoded:
+        return None
+    if encoded == "-":
+        return ()
+    return tuple(tuple(int(v) for v in part.split("-")) for part in encoded.split(","))
+
+def hours_intervals(weekday_text) -> str:
+    return encode_intervals(parse_weekday_text(weekday_text))
+
+
+def minute_of_week(day, hhmm: str | None = None) -> int:
+    """minute_of_week('sábado', '20:00'), minute_of_week(5, '20:00') ou minute_of_week(datetime)."""
+    if isinstance(day, datetime):
+        return day.weekday() * MINUTES_PER_DAY + day.hour * 60 + day.minute
+    index = day if isinstance(day, int) else _DAYS.get(_plain(str(day)))
+    if index is None:
+        raise ValueError(f"dia da semana desconhecido: {day}")
+    minutes = time_to_minutes(hhmm or "00:00")
+    if minutes is None:
+        raise ValueError(f"horário inválido: {hhmm}")
+    return index * MINUTES_PER_DAY + minutes % MINUTES_PER_DAY
+
+def parse_when(text: str) -> int:
+    """'sábado 20:00' -> minuto da semana."""
+    parts = _SPACES_RE.sub(" ", text).strip().rsplit(" ", 1)
+    if len(parts) != 2:
+        raise ValueError("use '<dia> <HH:MM>', ex.: 'sábado 20:00'")
+    return minute_of_week(parts[0], parts[1])
+
+
+def interval_arrays(encoded: pd.Series):
+    """
+    Intervalos de todas as linhas em arrays planos (linha, início, fim) +
+    máscara de linhas com horário conhecido. Cada texto distinto é decodificado uma vez.
+    """
+    codes, uniques = pd.factorize(encoded.fillna("").astype(str), sort=False)
+    decoded = [decode_intervals(u) for u in uniques]
+    counts = np.array([len(d) if d else 0 for d in decoded], dtype=np.int64)
+    starts = np.array([s for d in decoded if d for s, _ in d], dtype=np.int64)
+    ends = np.array([e for d in decoded if d for _, e in d], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    per_row = counts[codes]
+    rows = np.repeat(np.arange(len(codes)), per_row)
+    # posição de cada intervalo da linha dentro dos arrays dos textos distintos
+    first = np.repeat(offsets[codes], per_row)
+    within = np.arange(per_row.sum()) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    known = np.array([d is not None for d in decoded], dtype=bool)[codes] if len(codes) else np.zeros(0, bool)
+    return rows, starts[first + within], ends[first + within], known
+
+def open_at(encoded: pd.Series, minute: int) -> pd.Series:
+    """
+    Para cada linha (coluna hours_intervals), aberto no minuto da semana?
+    True/False, ou <NA> quando o horário não é informado.
+    """
+    rows, starts, ends, known = interval_arrays(encoded)
+    hit = (starts <= minute) & (minute < ends)
+    is_open = np.zeros(len(encoded), dtype=bool)
+    is_open[rows[hit]] = True
+    out = pd.array(is_open, dtype="boolean")
+    out[~known] = pd.NA
+    return pd.Series(out, index=encoded.index, name="open")
+
+def intervals_column(df: pd.DataFrame) -> pd.Series:
+    """
+    hours_intervals do DataFrame; onde faltar (CSVs antigos, concatenação com
+    arquivos novos) é calculada do weekday_text, uma vez por texto distinto.
+    """
+    if COLUMN in df.columns:
+        current = df[COLUMN].fillna("").astype(str)
+    else:
+        current = pd.Series("", index=df.index, dtype=object, name=COLUMN)
+    missing = (current == "").to_numpy()
+    if missing.any() and "weekday_text" in df.columns:
+        texts = df["weekday_text"].fillna("").astype(str)[missing]
+        codes, uniques = pd.factorize(texts)
+        encoded = np.array([hours_intervals(u) for u in uniques], dtype=object)
+        current = current.copy()
+        current[missing] = encoded[codes]
+    return current.rename(COLUMN)
+
+def backfill(results_dir: str = os.path.join("system", "results")) -> int:
+    """Grava hours_intervals nos CSVs de resultados que ainda não têm a coluna. Retorna nº de arquivos."""
+    from results_manifest import get_manifest
+    manifest = get_manifest()
+    updated = 0
+    for entry in manifest.entries():
+        if (entry["schema_version"] or 0) >= SCHEMA_VERSION:
+            continue
+        path = entry["path"]
+        try:
+            df = pd.read_csv(path, sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+        except Exception as e:
+            print(f"Aviso: {path} ignorado ({e})")
+            continue
+        if "weekday_text" not in df.columns:
+            continue
+        df[COLUMN] = intervals_column(df)
+        mtime = os.path.getmtime(path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_csv(tmp_path, sep=";", index=False, encoding="utf-8-sig")
+        os.utime(tmp_path, (mtime, mtime))   # mantém a data da coleta
+        os.replace(tmp_path, path)
+        manifest.record(path, rows=len(df), columns=list(df.columns))
+        updated += 1
+    return updated
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        print(f"{backfill()} arquivos atualizados com {COLUMN}")
+        sys.exit(0)
+
+    p = argparse.ArgumentParser(description="Lugares abertos num dia/horário, sobre todos os resultados.")
+    p.add_argument("when", help="Dia e horário, ex.: 'sábado 20:00'")
+    p.add_argument("--type", dest="search_type", default=None, help="Só um tipo de busca (ex.: restaurant).")
+    p.add_argument("--region", default=None, help="Só uma região (ex.: Sudeste).")
+    args = p.parse_args()
+
+    from results_manifest import get_manifest
+    frames = [pd.read_csv(e["path"], sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+              for e in get_manifest().entries(search_type=args.search_type, region=args.region)]
+    if not frames:
+        print("Nenhum resultado catalogado.")
+        sys.exit(0)
+    places = pd.concat(frames, ignore_index=True).drop_duplicates("id")
+    is_open = open_at(intervals_column(places), parse_when(args.when))
+    print(f"{int(is_open.sum())} abertos, {int((~is_open).sum())} fechados, "
+          f"{int(is_open.isna().sum())} sem horário (de {len(places)} lugares) em {args.when}")
@@ -0,0 +1,93 @@
+# Planejamento por sobreposição: coordenadas de entrada muito próximas
+# (ex.: "Centro da Cidade" e "Bairro Estratégico" a poucas centenas de metros)
+# fariam buscas rankeadas por distância quase idênticas. Antes de qualquer
+# chamada à API, as coordenadas são agrupadas por distância; em cada grupo só
+# o "líder" (primeira coordenada na ordem da planilha) é consultado, e os
+# demais pontos recebem os resultados do líder reordenados pela própria distância.
+import numpy as np
+import pandas as pd
+
+from geo import GridIndex, haversine_km
+
+DEFAULT_TOLERANCE_KM = 0.5
+
+
+def cluster_points(lats, lngs, tolerance_km: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Agrupamento guloso na ordem de entrada: cada ponto ainda livre vira líder
+    e absorve os pontos livres a até tolerance_km dele.
+    Retorna (posição do líder de cada ponto, distância ao líder em km).
+    """
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    leader = np.full(len(lats), -1, dtype=np.int64)
+    dist_to_leader = np.zeros(len(lats))
+    if tolerance_km <= 0:
+        return np.arange(len(lats)), dist_to_leader
+    grid = GridIndex(lats, lngs, cell_deg=max(0.01, tolerance_km / 111.32 * 2))
+    for i in range(len(lats)):
+        if leader[i] >= 0:
+            continue
+        leader[i] = i
+        idx, dist = grid.query_radius(lats[i], lngs[i], tolerance_km)
+        free = leader[idx] < 0
+        leader[idx[free]] = i
+        dist_to_leader[idx[free]] = dist[free]
+    return leader, dist_to_leader
+
+
+def assign_leaders(jobs: list[dict], tolerance_km: float) -> dict:
+    """
+    Marca, em cada job de coordenada seguidora, `leader` (out_name do job do
+    líder com o mesmo tipo) e `leader_km`. Retorna o relatório de sobreposição.
+    """
+    coords = {}
+    for job in jobs:
+        coords.setdefault((job["lat"], job["lng"]), len(coords))
+    points = list(coords)
+    report = {"tolerance_km": tolerance_km, "coords": len(points), "clusters": len(points),
+              "followers": 0, "max_km": 0.0, "mean_km": 0.0, "searches_saved": 0}
+    if not points or tolerance_km <= 0:
+        return report
+
+    leader, dist = cluster_points([p[0] for p in points], [p[1] for p in points], tolerance_km)
+    by_coord_type = {((job["lat"], job["lng"]), job["type"]): job for job in jobs}
+    followers = leader != np.arange(len(points))
+    for job in jobs:
+        pos = coords[(job["lat"], job["lng"])]
+        if not followers[pos]:
+            continue
+        leader_job = by_coord_type.get((points[leader[pos]], job["type"]))
+        if leader_job is not None:
+            job["leader"] = leader_job["out_name"]
+            job["leader_km"] = float(dist[pos])
+            report["searches_saved"] += 1
+
+    report["clusters"] = int(len(np.unique(leader)))
+    report["followers"] = int(followers.sum())
+    if followers.any():
+        report["max_km"] = round(float(dist[followers].max()), 4)
+        report["mean_km"] = round(float(dist[followers].mean()), 4)
+    return report
+
+
+def format_report(report: dict, total_jobs: int) -> str:
+    return (f"Sobreposição (tolerância {report['tolerance_km']} km): {report['coords']} coordenadas em "
+            f"{report['clusters']} grupos; {report['followers']} pontos reaproveitam o vizinho "
+            f"(distância média {report['mean_km']} km, máx. {report['max_km']} km); "
+            f"{report['searches_saved']} de {total_jobs} buscas evitadas")
+
+
+def rows_from_leader(leader_csv: str, lat: float, lng: float, city_state: str | None = None) -> list[dict]:
+    """
+    Linhas do CSV do líder, reordenadas pela distância até (lat, lng). Com
+    `city_state`, a coluna passa a ser a do seguidor (não a do ponto do líder).
+    """
+    df = pd.read_csv(leader_csv, sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    if city_state:
+        df["city_state"] = city_state
+    dist = haversine_km(lat, lng,
+                        pd.to_numeric(df["latitude"], errors="coerce"),
+                        pd.to_numeric(df["longitude"], errors="coerce"))
+    order = np.argsort(np.nan_to_num(dist, nan=np.inf), kind="stable")
+    return df.iloc[order].to_dict("records")
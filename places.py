@@ -1,8 +1,29 @@
-import googlemaps
-import requests
 import os
-import pandas as pd
+import re
 import json
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from details_cache import get_details_cache
+from transport import get_client, get_json
+from municipios import resolve_city_state
+from results_manifest import get_manifest
+from regions import uf_from_city_state
+from metrics import get_metrics
+
+# opening_hours (numpy/pandas) é importado dentro das funções de horário: importar
+# este módulo (main.py, interface web) não carrega o pandas.
+
+# Nº máximo de chamadas de Place Details simultâneas por busca
+DETAILS_WORKERS = 8
+
+class PlacesApiError(RuntimeError):
+    """Erro devolvido pela API (REQUEST_DENIED, INVALID_REQUEST...), diferente de 'sem resultados'."""
+
+    def __init__(self, message: str, status: str | None = None):
+        super().__init__(message)
+        self.status = status
 
 # -------------------------------------------------------------------
 # API Key
@@ -22,7 +43,7 @@ def get_api_key(file_path='system/api_key.txt'):
 # Geocoding / Reverse
 # -------------------------------------------------------------------
 def get_coordinates(address, api_key):
-    gmaps = googlemaps.Client(key=api_key)
+    gmaps = get_client(api_key)
     geocode_result = gmaps.geocode(address)
     if geocode_result:
         location = geocode_result[0]['geometry']['location']
@@ -31,8 +52,19 @@ def get_coordinates(address, api_key):
         print(f"Erro: Não foi possível encontrar coordenadas para o endereço: {address}")
         return None, None
 
-def get_city_state(latitude, longitude, api_key):
-    gmaps = googlemaps.Client(key=api_key)
+def get_city_state(latitude, longitude, api_key, offline: bool = True):
+    """
+    'Município/UF' da coordenada. Por padrão resolve offline (municipios.py)
+    e só faz o reverse geocode na API quando o ponto é ambíguo.
+    """
+    if offline:
+        return resolve_city_state(
+            latitude, longitude,
+            fallback=lambda lat, lng: reverse_geocode_city_state(lat, lng, api_key))
+    return reverse_geocode_city_state(latitude, longitude, api_key)
+
+def reverse_geocode_city_state(latitude, longitude, api_key):
+    gmaps = get_client(api_key)
     reverse_geocode_result = gmaps.reverse_geocode((latitude, longitude))
     if reverse_geocode_result:
         for result in reverse_geocode_result:
@@ -51,23 +83,39 @@ def get_city_state(latitude, longitude, api_key):
 # Helpers de horário e filename
 # -------------------------------------------------------------------
 def convert_to_24h(time_str):
-    from datetime import datetime
-    try:
-        t = datetime.strptime(time_str, "%I:%M %p")
-        return t.strftime("%H:%M")
-    except Exception:
-        return time_str
+    from opening_hours import to_24h
+
+    return to_24h(time_str)
+
+_DIAS_SEMANA = {
+    "Monday": "Segunda-feira",
+    "Tuesday": "Terça-feira",
+    "Wednesday": "Quarta-feira",
+    "Thursday": "Quinta-feira",
+    "Friday": "Sexta-feira",
+    "Saturday": "Sábado",
+    "Sunday": "Domingo"
+}
+_TIME_SPLIT_RE = re.compile(r"\s*[–—]\s*")
+
+@lru_cache(maxsize=8192)
+def _format_hours(hours: str) -> str:
+    from opening_hours import to_24h
+
+    if hours.lower() == "open 24 hours":
+        return "Aberto 24 horas"
+    if hours.lower() == "closed":
+        return "Fechado"
+    converted_parts = []
+    for part in hours.split(" / "):
+        times = _TIME_SPLIT_RE.split(part)
+        if len(times) == 2:
+            converted_parts.append(f"{to_24h(times[0])} – {to_24h(times[1])}")
+        else:
+            converted_parts.append(part)
+    return " / ".join(converted_parts)
 
 def format_weekday_text(weekday_text):
-    dias_semana = {
-        "Monday": "Segunda-feira",
-        "Tuesday": "Terça-feira",
-        "Wednesday": "Quarta-feira",
-        "Thursday": "Quinta-feira",
-        "Friday": "Sexta-feira",
-        "Saturday": "Sábado",
-        "Sunday": "Domingo"
-    }
     if not isinstance(weekday_text, list) or not weekday_text:
         return ["Não disponível"]
 
@@ -75,28 +123,8 @@ def format_weekday_text(weekday_text):
     for entry in weekday_text:
         if ": " in entry:
             day_en, hours_raw = entry.split(": ", 1)
-            day_pt = dias_semana.get(day_en, day_en)
-            hours = hours_raw.strip()
-
-            if hours.lower() == "open 24 hours":
-                hours = "Aberto 24 horas"
-            elif hours.lower() == "closed":
-                hours = "Fechado"
-            else:
-                parts = hours.split(" / ")
-                converted_parts = []
-                for part in parts:
-                    times = part.split("–")
-                    if len(times) == 2:
-                        start, end = times
-                        start_24 = convert_to_24h(start.strip())
-                        end_24 = convert_to_24h(end.strip())
-                        converted_parts.append(f"{start_24} – {end_24}")
-                    else:
-                        converted_parts.append(part)
-                hours = " / ".join(converted_parts)
-
-            formatted_hours.append(f"{day_pt}: {hours}")
+            day_pt = _DIAS_SEMANA.get(day_en, day_en)
+            formatted_hours.append(f"{day_pt}: {_format_hours(hours_raw.strip())}")
         else:
             formatted_hours.append(f"  - {entry}")
     return formatted_hours
@@ -111,8 +139,13 @@ def make_csv_filename(place_type, lat, lng):
 # -------------------------------------------------------------------
 # Places Details
 # -------------------------------------------------------------------
-def get_place_details(place_id, api_key):
-    DETAILS_URL = "https://maps.googleapis.com/maps/api/place/details/json"
+def get_place_details(place_id, api_key, use_cache: bool = True):
+    cache = get_details_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(place_id)
+        if cached is not None:
+            return cached
+
     params = {
         "key": api_key,
         "place_id": place_id,
@@ -120,16 +153,125 @@ def get_place_details(place_id, api_key):
         "language": "pt-BR",
         "region": "BR"
     }
-    response = requests.get(DETAILS_URL, params=params, timeout=5)
-    data = response.json()
+    data = get_json("details", params)
     if "result" in data and "opening_hours" in data["result"]:
-        return data["result"]["opening_hours"].get("weekday_text", []), \
-               data["result"]["opening_hours"].get("open_now", False)
-    return [], False
+        weekday_text = data["result"]["opening_hours"].get("weekday_text", [])
+        open_now = data["result"]["opening_hours"].get("open_now", False)
+    else:
+        weekday_text, open_now = [], False
+    # só guarda respostas válidas (erros de cota/chave não entram no cache)
+    if cache is not None and data.get("status") == "OK":
+        cache.set(place_id, weekday_text, open_now)
+    return weekday_text, open_now
+
+def _safe_place_details(place_id, api_key):
+    # uma falha isolada não derruba a busca inteira: o local fica sem horários
+    try:
+        return get_place_details(place_id, api_key)
+    except Exception as e:
+        print(f"Erro ao buscar detalhes de {place_id}: {e}")
+        return [], False
+
+def fetch_places_details(place_ids, api_key, max_workers: int = DETAILS_WORKERS, on_result=None):
+    """
+    Busca os Place Details de vários place_id em paralelo (pool limitado a
+    max_workers). Devolve uma lista de (weekday_text, open_now) na mesma
+    ordem de place_ids; entradas sem place_id viram ([], None).
+    `on_result(i, detalhes)` é chamado assim que cada um fica pronto.
+    """
+    results = [([], None)] * len(place_ids)
+    pending = [(i, pid) for i, pid in enumerate(place_ids) if pid]
+    if on_result is not None:
+        for i, pid in enumerate(place_ids):
+            if not pid:
+                on_result(i, results[i])
+    if not pending:
+        return results
+    workers = max(1, min(int(max_workers or 1), len(pending)))
+    if workers == 1:
+        for i, pid in pending:
+            results[i] = _safe_place_details(pid, api_key)
+            if on_result is not None:
+                on_result(i, results[i])
+        return results
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_safe_place_details, pid, api_key): i for i, pid in pending}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if on_result is not None:
+                on_result(i, results[i])
+    return results
 
 # -------------------------------------------------------------------
 # Nearby Search principal
 # -------------------------------------------------------------------
+def format_details(place_id, details) -> list[str]:
+    """weekday_text formatado para o CSV a partir de (weekday_text, open_now) do Place Details."""
+    weekday_text, _ = details
+    if not place_id:
+        print("Horários brutos retornados: Não disponível (place_id ausente)")
+        return []
+    print("Horários brutos retornados:", weekday_text)
+    if not isinstance(weekday_text, list) or not weekday_text:
+        return ["Não disponível"]
+    return format_weekday_text(weekday_text)
+
+def place_row(place: dict, details, city_state: str, place_type: str, enriched: bool = True) -> dict:
+    """
+    Linha do CSV de resultados para um lugar da Nearby Search + seus detalhes.
+    Sem detalhes (enriched=False, modo lite) os horários ficam vazios e o
+    open_now é o da própria Nearby Search.
+    """
+    from opening_hours import hours_intervals
+
+    place_id = place.get("place_id")
+    nearby_open_now = (place.get("opening_hours") or {}).get("open_now", False)
+    if enriched:
+        formatted_weekday = format_details(place_id, details)
+        # detalhes importados pelo seed do cache não têm open_now: vale o da Nearby Search
+        open_now = nearby_open_now if details[1] is None else details[1]
+    else:
+        formatted_weekday = []
+        open_now = nearby_open_now
+
+    tipos = place.get("types", [])
+    viewport = place.get("geometry", {}).get("viewport", {})
+    return {
+        "id": place_id,
+        "city_state": city_state,
+        "name": place.get("name"),
+        "address": place.get("vicinity"),
+        "open_now": bool(open_now),
+        "business_status": place.get("business_status"),
+        "latitude": place["geometry"]["location"]["lat"],
+        "longitude": place["geometry"]["location"]["lng"],
+        "weekday_text": json.dumps(formatted_weekday, ensure_ascii=False),
+        "types": json.dumps(tipos, ensure_ascii=False),
+        "search_type": str(place_type),
+        "viewport": viewport,
+        "hours_intervals": hours_intervals(formatted_weekday),
+        "enriched": bool(enriched),
+    }
+
+def nearby_search(lat, lng, place_type: str, api_key: str) -> list[dict]:
+    """Uma página da Nearby Search (rankby=distance) do tipo em (lat, lng); status de erro -> PlacesApiError."""
+    params = {
+        "key": api_key,
+        "location": f"{lat},{lng}",
+        "type": place_type,          # <— aqui
+        "rankby": "distance",
+        "language": "pt-BR",         # <— ajuda na consistência de idioma
+        "region": "BR"
+    }
+
+    with get_metrics().stage("nearby"):
+        data = get_json("nearby", params)
+    status = data.get("status")
+    if status not in (None, "OK", "ZERO_RESULTS"):
+        raise PlacesApiError(f"Nearby Search retornou {status}: {data.get('error_message', '')}".rstrip(": "), status)
+    return data.get("results") or []
+
 def search_places(
     latitude: float | str = None,
     longitude: float | str = None,
@@ -140,8 +282,18 @@ def search_places(
     input_dataframe=None,
     row=None,
     empreendimento: str | None = None,
-    base: str | None = None
+    base: str | None = None,
+    details_workers: int = DETAILS_WORKERS,
+    on_place=None,
+    lite: bool = False
 ):
+    """
+    Nearby Search (rankby=distance) + Place Details de cada resultado, gravados
+    em system/results. `on_place(posição, linha, total)` recebe cada lugar assim
+    que os detalhes dele chegam (fora de ordem), para quem quer mostrar aos poucos.
+    Com lite=True não há fase de detalhes: só quem já está no cache sai com
+    horários; os demais ficam com enriched=False para enrichment.py completar.
+    """
     key = api_key or get_api_key()
     if not key:
         print("Erro: API Key não encontrada!")
@@ -159,68 +311,71 @@ def search_places(
 
     print(f"Buscando {place_type} perto de ({lat}, {lng})")
 
-    city_state = get_city_state(lat, lng, key)
+    metrics = get_metrics()
+    with metrics.stage("geocode"):
+        city_state = get_city_state(lat, lng, key)
 
-    PLACES_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-    params = {
-        "key": key,
-        "location": f"{lat},{lng}",
-        "type": place_type,          # <— aqui
-        "rankby": "distance",
-        "language": "pt-BR",         # <— ajuda na consistência de idioma
-        "region": "BR"
-    }
+    results = nearby_search(lat, lng, place_type, key)
+    rows = [None] * len(results)
+
+    def build_row(i, details, enriched=True):
+        rows[i] = place_row(results[i], details, city_state, place_type, enriched)
+        if on_place is not None:
+            on_place(i, rows[i], len(results))
 
-    response = requests.get(PLACES_URL, params=params, timeout=10)
-    data = response.json()
-
-    places_list = []
-    if "results" in data:
-        for place in data["results"]:
-            place_id = place.get("place_id")
-            if place_id:
-                weekday_text, open_now = get_place_details(place_id, key)
-                if not isinstance(weekday_text, list) or not weekday_text:
-                    formatted_weekday = ["Não disponível"]
-                else:
-                    formatted_weekday = format_weekday_text(weekday_text)
-                print("Horários brutos retornados:", weekday_text)
-            else:
-                weekday_text = []
-                open_now = None
-                formatted_weekday = []
-                print("Horários brutos retornados: Não disponível (place_id ausente)")
-            
-            tipos = place.get("types", [])
-            viewport = place.get("geometry", {}).get("viewport", {})
-            places_list.append({
-                "id": place_id,
-                "city_state": city_state,
-                "name": place.get("name"),
-                "address": place.get("vicinity"),
-                "open_now": bool(open_now),
-                "business_status": place.get("business_status"),
-                "latitude": place["geometry"]["location"]["lat"],
-                "longitude": place["geometry"]["location"]["lng"],
-                "weekday_text": json.dumps(formatted_weekday, ensure_ascii=False),
-                "types": json.dumps(tipos, ensure_ascii=False),
-                "search_type": str(place_type), 
-                "viewport": viewport
-            })
+    if lite:
+        cache = get_details_cache()
+        for i, place in enumerate(results):
+            cached = cache.get(place["place_id"]) if place.get("place_id") else None
+            build_row(i, cached, enriched=cached is not None)
+    else:
+        with metrics.stage("details"):
+            fetch_places_details([p.get("place_id") for p in results], key, details_workers, on_result=build_row)
+    places_list = [row for row in rows if row is not None]
 
     if not places_list:
         print(f"Nenhum resultado encontrado para {place_type} no local especificado.")
         return
 
+    return save_results(places_list, place_type, lat, lng, city_state)
+
+def save_results(places_list: list[dict], place_type: str, lat, lng, city_state: str | None = None,
+                 fetched_at: float | None = None):
+    """
+    Grava os resultados de uma busca em system/results/<tipo>_near_<lat>_<lng>.csv
+    (escrita atômica) e registra o arquivo no catálogo. Retorna o caminho; uma
+    falha de gravação (disco, permissão) sobe como exceção, para não ser
+    confundida com uma busca sem resultados.
+    `fetched_at` (epoch) mantém no mtime a data da coleta original quando os
+    resultados vêm de dados já guardados (índice, vizinho), e não da API agora.
+    """
     # Salvar CSV no padrão unificado
     csv_filename = make_csv_filename(place_type, lat, lng)
     file_path = os.path.join("system", "results", csv_filename)
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
+    # grava num temporário e troca de uma vez: buscas paralelas nunca veem um CSV pela metade
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        pd.DataFrame(places_list).to_csv(file_path, sep=';', index=False, encoding='utf-8-sig')
+        with get_metrics().stage("csv_write"):
+            import pandas as pd
+
+            pd.DataFrame(places_list).to_csv(tmp_path, sep=';', index=False, encoding='utf-8-sig')
+            if fetched_at is not None:
+                os.utime(tmp_path, (fetched_at, fetched_at))
+            os.replace(tmp_path, file_path)
         print(f"Resultados salvos em: {file_path}")
-        return file_path
     except Exception as e:
         print(f"Erro ao salvar o CSV: {e}")
-        return
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    try:
+        if city_state is None and places_list:
+            city_state = places_list[0].get("city_state")
+        get_manifest().record(file_path, rows=len(places_list), columns=list(places_list[0].keys()),
+                              uf=uf_from_city_state(city_state))
+    except Exception as e:
+        print(f"Aviso: não foi possível atualizar o catálogo de resultados: {e}")
+    return file_path
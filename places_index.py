@@ -0,0 +1,206 @@
+# Índice espacial local sobre todos os lugares já coletados (system/results),
+# por tipo de busca. Responde "os N lugares do tipo T mais próximos de
+# (lat, lng)" sem chamar a API e diz se os dados guardados cobrem o ponto.
+#
+# Cobertura: uma Nearby Search rankeada por distância na origem O que trouxe
+# lugares até a distância R enxerga TODOS os lugares do tipo no disco (O, R).
+# Para um ponto P a d km de O, o disco (P, R - d) está completo; se o N-ésimo
+# vizinho de P estiver dentro dele, a resposta local é a mesma da API.
+#
+# Uso pela linha de comando:
+#   python places_index.py <tipo> <lat> <lng> [n]
+import sys
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+
+from geo import GridIndex, haversine_km
+from results_manifest import get_manifest
+from opening_hours import intervals_column
+
+MAX_RESULTS = 20            # a Nearby Search devolve até 20 lugares por página
+FRESH_DAYS = 30.0           # dados mais antigos que isso não são servidos automaticamente
+ORIGIN_SEARCH_KM = 10.0     # origens consideradas ao avaliar a cobertura de um ponto
+UNBOUNDED_KM = 50.0         # busca que trouxe < MAX_RESULTS lugares viu tudo o que existia (até ~50 km)
+
+
+class PlacesIndex:
+    """
+    Lugares guardados em memória, agrupados por search_type, cada grupo com
+    um GridIndex dos lugares e outro das origens das buscas. `refresh()`
+    carrega só os arquivos novos/alterados do catálogo.
+    """
+
+    def __init__(self, manifest=None):
+        self.manifest = manifest or get_manifest()
+        self._loaded = {}       # filename -> mtime
+        self._frames = {}       # search_type -> {filename: DataFrame}
+        self._origins = {}      # search_type -> {filename: (lat, lng, reach_km, rows, mtime)}
+        self._places = {}       # search_type -> (DataFrame deduplicado, GridIndex)
+        self._origin_grid = {}  # search_type -> (lista de origens, GridIndex)
+        self._lock = threading.Lock()
+
+    # ---------- carga ----------
+    @staticmethod
+    def _read(path: str) -> pd.DataFrame:
+        return pd.read_csv(path, sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+
+    def refresh(self) -> int:
+        """Carrega arquivos novos ou alterados e refaz os índices dos tipos afetados."""
+        with self._lock:
+            changed = set()
+            for entry in self.manifest.entries():
+                name, mtime, search_type = entry["filename"], entry["mtime"], entry["search_type"]
+                if not search_type or self._loaded.get(name) == mtime:
+                    continue
+                try:
+                    df = self._read(entry["path"])
+                except Exception:
+                    continue
+                lat = pd.to_numeric(df.get("latitude", pd.Series(dtype=str)), errors="coerce").to_numpy()
+                lng = pd.to_numeric(df.get("longitude", pd.Series(dtype=str)), errors="coerce").to_numpy()
+                dist = haversine_km(entry["lat"], entry["lng"], lat, lng)
+                dist = dist[~np.isnan(dist)]
+                reach = float(dist.max()) if len(dist) else 0.0
+                if len(dist) < MAX_RESULTS:
+                    reach = UNBOUNDED_KM
+                self._frames.setdefault(search_type, {})[name] = df
+                self._origins.setdefault(search_type, {})[name] = (entry["lat"], entry["lng"], reach, len(dist), mtime)
+                self._loaded[name] = mtime
+                changed.add(search_type)
+            for search_type in changed:
+                self._rebuild(search_type)
+            return len(changed)
+
+    def _rebuild(self, search_type: str):
+        frames = self._frames[search_type]
+        origins = self._origins[search_type]
+        df = pd.concat(frames, names=["_source", None]).reset_index(level=0) if frames else pd.DataFrame()
+        if not df.empty:
+            df = df.reset_index(drop=True)
+            df["_lat"] = pd.to_numeric(df["latitude"], errors="coerce")
+            df["_lng"] = pd.to_numeric(df["longitude"], errors="coerce")
+            df["_fetched_at"] = df["_source"].map(lambda name: origins[name][4])
+            df = df.dropna(subset=["_lat", "_lng"])
+            # o mesmo lugar vindo de buscas diferentes: fica a versão mais recente
+            key = df["id"].where(df["id"] != "", df["_source"] + "#" + df.index.astype(str))
+            df = df.assign(_key=key).sort_values("_fetched_at", kind="stable").drop_duplicates("_key", keep="last")
+            df = df.drop(columns="_key").reset_index(drop=True)
+            df["hours_intervals"] = intervals_column(df)
+            df["enriched"] = df["enriched"].fillna("True").replace("", "True") if "enriched" in df else "True"
+        self._places[search_type] = (df, GridIndex(df.get("_lat", []), df.get("_lng", []), cell_deg=0.05))
+        origins = list(origins.values())
+        self._origin_grid[search_type] = (origins, GridIndex([o[0] for o in origins], [o[1] for o in origins],
+                                                             cell_deg=0.05))
+
+    # ---------- consultas ----------
+    def types(self) -> list[str]:
+        return sorted(self._places)
+
+    def nearest(self, lat: float, lng: float, search_type: str, n: int = MAX_RESULTS) -> pd.DataFrame:
+        """Os n lugares guardados mais próximos (colunas do CSV + distance_km), do mais perto ao mais longe."""
+        if search_type not in self._places:
+            return pd.DataFrame()
+        df, grid = self._places[search_type]
+        idx, dist = grid.nearest(lat, lng, k=n)
+        return df.iloc[idx].assign(distance_km=dist).reset_index(drop=True)
+
+    def coverage(self, lat: float, lng: float, search_type: str, n: int = MAX_RESULTS,
+                 fresh_days: float = FRESH_DAYS, nearest: pd.DataFrame | None = None) -> dict:
+        """
+        Diz se os dados guardados respondem aos n vizinhos de (lat, lng) como a API
+        responderia: `covered` (raio completo >= distância do n-ésimo vizinho) e
+        `fresh` (a origem usada não passa de fresh_days).
+        """
+        info = {"covered": False, "fresh": False, "complete_km": 0.0, "origin": None,
+                "origin_distance_km": None, "age_days": None, "available": 0}
+        if search_type not in self._origin_grid:
+            return info
+        if nearest is None:
+            nearest = self.nearest(lat, lng, search_type, n)
+        info["available"] = len(nearest)
+        origins, grid = self._origin_grid[search_type]
+        idx, dist = grid.query_radius(lat, lng, ORIGIN_SEARCH_KM)
+        now = time.time()
+        best = None
+        for i, d in zip(idx, dist):
+            o_lat, o_lng, reach, rows, mtime = origins[i]
+            age = (now - mtime) / 86400
+            complete = reach - d
+            # preferimos origens frescas; entre elas, o maior raio completo
+            rank = (age <= fresh_days, complete)
+            if best is None or rank > best[0]:
+                best = (rank, (o_lat, o_lng), float(d), age, complete)
+        if best is None:
+            return info
+        _, origin, d, age, complete = best
+        needed = float(nearest["distance_km"].iloc[-1]) if len(nearest) else 0.0
+        enough = len(nearest) >= n or complete >= UNBOUNDED_KM - ORIGIN_SEARCH_KM
+        info.update({
+            "covered": bool(complete > 0 and enough and needed <= complete),
+            "fresh": age <= fresh_days,
+            "complete_km": round(float(max(complete, 0.0)), 4),
+            "origin": origin,
+            "origin_distance_km": round(d, 4),
+            "age_days": round(age, 2),
+        })
+        return info
+
+    def answer(self, lat: float, lng: float, search_type: str, n: int = MAX_RESULTS,
+               fresh_days: float = FRESH_DAYS):
+        """(DataFrame dos n vizinhos, info de cobertura) — sem chamar a API."""
+        nearest = self.nearest(lat, lng, search_type, n)
+        return nearest, self.coverage(lat, lng, search_type, n, fresh_days, nearest)
+
+
+def rows_for_csv(nearest: pd.DataFrame, search_type: str, city_state: str | None = None) -> list[dict]:
+    """Converte o resultado de nearest() em linhas no formato dos CSVs de search_places."""
+    out = []
+    for row in nearest.drop(columns=[c for c in nearest.columns if c.startswith("_") or c == "distance_km"])\
+                      .to_dict("records"):
+        row["search_type"] = search_type
+        if city_state:
+            row["city_state"] = city_state
+        out.append(row)
+    return out
+
+
+def fetched_at(nearest: pd.DataFrame) -> float | None:
+    """Data (epoch) da coleta mais antiga entre os lugares de nearest()."""
+    return float(nearest["_fetched_at"].min()) if len(nearest) else None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_places_index() -> PlacesIndex:
+    """Índice padrão do processo, atualizado com os arquivos novos do catálogo a cada chamada."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PlacesIndex()
+    _index.refresh()
+    return _index
+
+def reset_places_index():
+    """Descarta o índice padrão (ele fica preso ao catálogo em que foi carregado)."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Uso: python places_index.py <tipo> <lat> <lng> [n]")
+        sys.exit(1)
+    place_type, q_lat, q_lng = sys.argv[1], float(sys.argv[2]), float(sys.argv[3])
+    q_n = int(sys.argv[4]) if len(sys.argv) > 4 else MAX_RESULTS
+    t0 = time.time()
+    index = get_places_index()
+    t1 = time.time()
+    found, cov = index.answer(q_lat, q_lng, place_type, q_n)
+    print(f"Índice carregado em {t1 - t0:.2f}s; consulta em {(time.time() - t1) * 1000:.1f} ms")
+    print(found[["name", "address", "distance_km"]].to_string() if len(found) else "Nenhum lugar guardado.")
+    print(cov)
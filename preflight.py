@@ -0,0 +1,216 @@
+# Estimativa de chamadas e custo antes de rodar o batch_runner, e o
+# orçamento que faz a execução parar antes de estourar o limite.
+#
+# Por job (coordenada × tipo), o custo esperado considera o estado atual:
+#   - arquivo já existente (skip), seguidor de um líder (--overlap-km) ou
+#     ponto coberto pelo índice local (--from-index): nenhuma chamada;
+#   - senão: 1 Nearby Search + Place Details dos lugares que ainda não estão
+#     no cache de detalhes + 1 reverse geocode por coordenada que o resolver
+#     offline não resolve. Lugares já guardados perto do ponto servem de
+#     previsão dos resultados; sem eles, vale a média de linhas do tipo e a
+#     taxa histórica de acerto do cache.
+# No modo fan-in (batch_runner --fan-in), as tipologias sem filtro próprio na
+# Nearby Search dividem uma busca ampla por coordenada: só a primeira delas
+# no ponto leva a Nearby Search e os Details.
+# O pior caso (20 Details por busca, nenhum acerto de cache) é o que o
+# orçamento reserva para cada job antes de iniciá-lo.
+#
+# Uso pela linha de comando (mesmas opções do batch_runner):
+#   python batch_runner.py --dry-run [--types ...] [--budget 50]
+import threading
+
+import pandas as pd
+
+from metrics import get_metrics
+
+# USD por 1000 chamadas (Distance Matrix: por 1000 elementos); ajuste à sua tabela de preços
+PRICES_PER_1000 = {
+    "nearby": 32.0,
+    "details": 20.0,          # Place Details + campo opening_hours (Contact Data)
+    "geocode": 5.0,
+    "distance_matrix": 5.0,
+}
+MAX_DETAILS = 20              # uma página da Nearby Search
+ENDPOINTS = ("geocode", "nearby", "details")
+
+
+def _type_averages(manifest) -> dict:
+    """Média de linhas por busca de cada tipo (catálogo de resultados)."""
+    rows = {}
+    for entry in manifest.entries():
+        if entry["search_type"] and entry["rows"] is not None:
+            rows.setdefault(entry["search_type"], []).append(entry["rows"])
+    return {t: sum(v) / len(v) for t, v in rows.items()}
+
+def _historical_hit_rate(cache) -> float:
+    stats = cache.stats()
+    lookups = stats["total_hits"] + stats["total_misses"]
+    return stats["total_hits"] / lookups if lookups else 0.0
+
+def estimate_jobs(jobs: list[dict], skip_existing: bool, from_index: bool, find_existing,
+                  index=None, manifest=None, cache=None, resolver=None, lite: bool = False,
+                  fan_in: bool = False) -> list[dict]:
+    """
+    Preenche job["estimate"] = {source, geocode, nearby, details, details_max,
+    elements} com as chamadas esperadas de cada job. source: existing | leader |
+    index | api. `elements` é a previsão de elementos do Distance Matrix depois.
+    No modo lite (sem Place Details) os Details ficam zerados; no fan-in, a
+    busca ampla de cada coordenada é cobrada só do primeiro job que a usa.
+    O índice local só é carregado com from_index (ou se vier pronto); sem ele,
+    a previsão de Details sai das médias por tipo do catálogo.
+    """
+    from fan_in import is_broad
+    from details_cache import get_details_cache
+    from municipios import get_resolver
+    from places_index import get_places_index
+    from results_manifest import get_manifest
+
+    if index is None and from_index:
+        index = get_places_index()
+    cache = cache or get_details_cache()
+    resolver = resolver or get_resolver()
+    averages = _type_averages(manifest or get_manifest())
+    hit_rate = _historical_hit_rate(cache)
+    geocoded = set()
+    broad_searched = set()
+
+    for job in jobs:
+        est = {"source": "api", "geocode": 0, "nearby": 0, "details": 0.0, "details_max": 0, "elements": 0.0}
+        job["estimate"] = est
+        if skip_existing and find_existing(job["out_name"]):
+            est["source"] = "existing"
+            continue
+        if job.get("leader"):
+            est["source"] = "leader"
+            continue
+        if index is not None:
+            nearest, coverage = index.answer(job["lat"], job["lng"], job["type"])
+        else:
+            nearest, coverage = (), {"covered": False, "fresh": False}
+        if from_index and coverage["covered"] and coverage["fresh"] and len(nearest):
+            est["source"] = "index"
+            continue
+
+        point = (job["lat"], job["lng"])
+        est["elements"] = float(averages.get(job["type"], MAX_DETAILS))
+        if fan_in and is_broad(job["type"]):
+            if point in broad_searched:
+                continue      # classificado da busca ampla já cobrada no ponto
+            broad_searched.add(point)
+        if point not in geocoded:
+            geocoded.add(point)
+            if not resolver.learned(*point) and not resolver.index.lookup(*point):
+                est["geocode"] = 1
+        est["nearby"] = 1
+        est["details_max"] = MAX_DETAILS
+        if coverage["covered"] and len(nearest):
+            # os lugares guardados ao redor são a melhor previsão do que a API vai devolver
+            ids = [pid for pid in nearest["id"].tolist() if pid]
+            rows = len(nearest)
+            est["details"] = float(rows - len(cache.cached_ids(ids) & set(ids)))
+        else:
+            rows = averages.get(job["type"], MAX_DETAILS)
+            est["details"] = rows * (1 - hit_rate)
+        est["elements"] = float(rows)
+        if lite:
+            est["details"], est["details_max"] = 0.0, 0
+    return jobs
+
+def job_cost(estimate: dict, prices: dict = PRICES_PER_1000, worst: bool = False) -> float:
+    """Custo (USD) esperado do job, ou o pior caso com worst=True."""
+    details = estimate["details_max"] if worst else estimate["details"]
+    return (estimate["geocode"] * prices["geocode"] + estimate["nearby"] * prices["nearby"]
+            + details * prices["details"]) / 1000
+
+def summarize(jobs: list[dict], prices: dict = PRICES_PER_1000) -> dict:
+    """Totais por endpoint (esperado e pior caso), custo e contagem por origem."""
+    est = pd.DataFrame([job["estimate"] for job in jobs]) if jobs else pd.DataFrame(
+        columns=["source", "geocode", "nearby", "details", "details_max", "elements"])
+    calls = {e: round(float(est[e].sum()), 1) for e in ENDPOINTS}
+    worst = {"geocode": calls["geocode"], "nearby": calls["nearby"], "details": float(est["details_max"].sum())}
+    cost = {e: round(calls[e] * prices[e] / 1000, 2) for e in ENDPOINTS}
+    worst_cost = {e: round(worst[e] * prices[e] / 1000, 2) for e in ENDPOINTS}
+    elements = float(est["elements"].sum())
+    return {
+        "jobs": len(jobs),
+        "by_source": est["source"].value_counts().to_dict(),
+        "calls": calls,
+        "calls_worst": worst,
+        "cost_usd": cost,
+        "cost_usd_total": round(sum(cost.values()), 2),
+        "cost_usd_worst": round(sum(worst_cost.values()), 2),
+        "matrix_elements": round(elements),
+        "matrix_cost_usd": round(elements * prices["distance_matrix"] / 1000, 2),
+    }
+
+def format_summary(summary: dict) -> str:
+    lines = [f"Estimativa para {summary['jobs']} jobs: {summary['by_source']}"]
+    for e in ENDPOINTS:
+        lines.append(f"  {e:<8} ~{summary['calls'][e]:>9} chamadas (pior caso {summary['calls_worst'][e]:>7.0f})"
+                     f"  ~US$ {summary['cost_usd'][e]:.2f}")
+    lines.append(f"  total    ~US$ {summary['cost_usd_total']:.2f} (pior caso US$ {summary['cost_usd_worst']:.2f})")
+    lines.append(f"  depois, Distance Matrix: ~{summary['matrix_elements']} elementos, "
+                 f"~US$ {summary['matrix_cost_usd']:.2f}")
+    return "\n".join(lines)
+
+
+def order_by_priority(jobs: list[dict], priority: list[str], prices: dict = PRICES_PER_1000) -> list[dict]:
+    """
+    Ordena para o modo com orçamento: tipos na ordem de `priority` (os demais
+    depois), e dentro de cada tipo os jobs mais baratos primeiro. Seguidores
+    (--overlap-km) vão para o fim, depois dos seus líderes.
+    """
+    rank = {t: i for i, t in enumerate(priority)}
+    followers = [job for job in jobs if job.get("leader")]
+    leaders = [job for job in jobs if not job.get("leader")]
+    leaders = sorted(enumerate(leaders), key=lambda p: (
+        rank.get(p[1]["type"], len(rank)), job_cost(p[1]["estimate"], prices) if "estimate" in p[1] else 0.0, p[0]))
+    return [job for _, job in leaders] + followers
+
+def fits_budget(jobs: list[dict], budget_usd: float, prices: dict = PRICES_PER_1000) -> int:
+    """Quantos jobs (na ordem dada) cabem no orçamento pelo custo esperado."""
+    total = 0.0
+    for i, job in enumerate(jobs):
+        total += job_cost(job["estimate"], prices)
+        if total > budget_usd:
+            return i
+    return len(jobs)
+
+
+class Budget:
+    """
+    Limite de gasto (USD) da execução. O gasto real vem das métricas de
+    chamadas (transport.py); cada job reserva o seu pior caso antes de começar
+    e libera a reserva ao terminar. Quando um job não cabe, o orçamento se
+    esgota e os jobs restantes ficam pendentes no journal (retomáveis com --resume).
+    """
+
+    def __init__(self, limit_usd: float, prices: dict = PRICES_PER_1000, metrics=None):
+        self.limit_usd = float(limit_usd)
+        self.prices = prices
+        self.metrics = metrics or get_metrics()
+        self._baseline = self.metrics.call_counts()
+        self.reserved = 0.0
+        self.exhausted = False
+        self._lock = threading.Lock()
+
+    def spent(self) -> float:
+        counts = self.metrics.call_counts()
+        return sum((n - self._baseline.get(e, 0)) * self.prices.get(e, 0.0) / 1000 for e, n in counts.items())
+
+    def reserve(self, cost: float) -> bool:
+        with self._lock:
+            if self.exhausted:
+                return False
+            if self.spent() + self.reserved + cost > self.limit_usd:
+                self.exhausted = True
+                return False
+            self.reserved += cost
+            return True
+
+    def release(self, cost: float):
+        with self._lock:
+            self.reserved -= cost
+
+    def __str__(self):
+        return f"US$ {self.spent():.2f} de US$ {self.limit_usd:.2f}"
@@ -0,0 +1,128 @@
+# Limitador de QPS adaptativo por endpoint do Google Maps (token bucket).
+# Substitui a pausa fixa entre jobs: cada chamada pega um token do bucket do
+# seu endpoint; quando a API responde OVER_QUERY_LIMIT/429 a taxa cai pela
+# metade e o bucket pausa, e a cada resposta saudável ela volta a subir aos
+# poucos até o teto configurado (AIMD).
+import time
+import threading
+
+# teto de chamadas por segundo de cada endpoint (ajustável via configure())
+DEFAULT_QPS = {
+    "nearby": 10.0,
+    "details": 25.0,
+    "geocode": 25.0,
+    "distance_matrix": 10.0,
+}
+FALLBACK_QPS = 10.0
+MIN_QPS = 0.5
+DECREASE_FACTOR = 0.5     # corte da taxa a cada throttle
+RECOVERY_STEP = 0.02      # fração do teto recuperada a cada sucesso
+THROTTLE_PAUSE = 2.0      # pausa (s) após um throttle sem Retry-After
+
+
+class AdaptiveRateLimiter:
+    """Token bucket thread-safe com taxa ajustada por AIMD."""
+
+    def __init__(self, max_rate: float, min_rate: float = MIN_QPS, burst: float | None = None):
+        self.max_rate = float(max_rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.rate = self.max_rate
+        self.capacity = float(burst or max(1.0, self.max_rate))
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self.calls = 0
+        self.throttled = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Bloqueia até haver um token (e fora de pausas por throttle)."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.calls += 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
+
+    def on_throttle(self, retry_after: float | None = None):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + (retry_after or THROTTLE_PAUSE))
+
+    def set_max_rate(self, max_rate: float):
+        with self._lock:
+            self.max_rate = float(max_rate)
+            self.min_rate = min(self.min_rate, self.max_rate)
+            self.rate = min(self.rate, self.max_rate) if self.throttled else self.max_rate
+            self.capacity = max(1.0, self.max_rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "max_qps": self.max_rate,
+                "current_qps": round(self.rate, 3),
+                "calls": self.calls,
+                "throttled": self.throttled,
+            }
+
+
+_limiters = {}
+_lock = threading.Lock()
+
+def get_limiter(endpoint: str | None) -> AdaptiveRateLimiter:
+    """Limitador do endpoint (criado na primeira chamada com DEFAULT_QPS)."""
+    name = endpoint or "other"
+    with _lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(DEFAULT_QPS.get(name, FALLBACK_QPS))
+            _limiters[name] = limiter
+        return limiter
+
+def configure(spec: str | dict | None):
+    """
+    Ajusta os tetos de QPS. Aceita dict {endpoint: qps} ou texto
+    'details=20,nearby=5' (formato do --qps do batch_runner).
+    """
+    if not spec:
+        return
+    if isinstance(spec, str):
+        items = {}
+        for part in spec.split(","):
+            if "=" in part:
+                name, value = part.split("=", 1)
+                items[name.strip()] = float(value)
+        spec = items
+    for name, qps in spec.items():
+        DEFAULT_QPS[name] = float(qps)
+        get_limiter(name).set_max_rate(qps)
+
+def snapshot() -> dict:
+    with _lock:
+        limiters = dict(_limiters)
+    return {name: limiter.snapshot() for name, limiter in limiters.items()}
+
+def reset():
+    """Descarta os limitadores e seus contadores (recriados no teto na próxima chamada)."""
+    with _lock:
+        _limiters.clear()
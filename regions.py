@@ -1,6 +1,5 @@
 # region_utils.py
 import os
-import pandas as pd
 
 UF_TO_REGION = {
     # Norte
@@ -27,11 +26,32 @@ def region_from_uf(uf: str | None) -> str | None:
         return None
     return UF_TO_REGION.get(uf)
 
+def region_from_point(latitude, longitude, api_key: str | None = None) -> tuple[str | None, str | None]:
+    """
+    Devolve (UF, Região) direto da coordenada, pelo mesmo resolver offline do
+    city_state (municipios.py), sem reler o CSV. Com api_key, pontos ambíguos
+    caem no reverse geocode da API.
+    """
+    from places import get_city_state
+    from municipios import resolve_city_state
+
+    try:
+        if api_key:
+            city_state = get_city_state(latitude, longitude, api_key)
+        else:
+            city_state = resolve_city_state(latitude, longitude)
+    except Exception:
+        return None, None
+    uf = uf_from_city_state(city_state)
+    return uf, region_from_uf(uf)
+
 def infer_region_from_csv(csv_path: str) -> tuple[str | None, str | None]:
     """
     Lê o CSV salvo pelo search_places, pega city_state do 1º registro,
     devolve (UF, Região). Se não achar, retorna (None, None).
     """
+    import pandas as pd
+
     try:
         df = pd.read_csv(csv_path, sep=";", encoding="utf-8-sig")
         if "city_state" not in df.columns or df.empty:
@@ -43,9 +63,11 @@ def infer_region_from_csv(csv_path: str) -> tuple[str | None, str | None]:
 
 def move_to_region_folder(csv_path: str, region: str) -> str:
     """
-    Move o arquivo para system/results/<REGIÃO>/ mantendo o mesmo nome.
-    Retorna o caminho novo.
+    Move o arquivo para system/results/<REGIÃO>/ mantendo o mesmo nome
+    (rename atômico) e atualiza o catálogo de resultados. Retorna o caminho novo.
     """
+    from results_manifest import get_manifest
+
     base_dir, fname = os.path.split(csv_path)
     target = os.path.join(base_dir, region)
     os.makedirs(target, exist_ok=True)
@@ -56,4 +78,8 @@ def move_to_region_folder(csv_path: str, region: str) -> str:
         except FileNotFoundError:
             # Se o arquivo não existir por algum motivo, apenas retorna o caminho original
             return csv_path
+    try:
+        get_manifest().move(fname, new_path, region)
+    except Exception as e:
+        print(f"Aviso: não foi possível atualizar o catálogo de resultados: {e}")
     return new_path
@@ -0,0 +1,150 @@
+# Cache em processo dos resultados já interpretados para as rotas web
+# (/search e /view). A entrada vale enquanto o CSV tiver a mesma assinatura
+# (mtime, tamanho, inode e ctime). Só mtime + tamanho não basta: save_results
+# (fetched_at), enrichment e opening_hours.backfill regravam o arquivo mantendo
+# ou recuando o mtime, às vezes com o mesmo tamanho. A troca atômica (os.replace)
+# muda o inode e o os.utime muda o ctime, então toda regravação invalida a entrada.
+#
+# Cada entrada guarda o corpo já serializado (JSON da lista de resultados ou
+# HTML da tabela), então repetir uma busca/visualização não passa pelo pandas
+# nem pelo json.dumps. O tamanho total é limitado (LRU por bytes).
+import os
+import ast
+import csv
+import json
+import html
+import threading
+from collections import OrderedDict
+
+MAX_BYTES = 64 * 1024 * 1024
+MAX_ENTRIES = 512
+
+NO_HOURS = 'Horário não informado'
+
+
+def _parse_list(raw) -> list:
+    try:
+        value = json.loads(raw) if isinstance(raw, str) else (raw or [])
+        return value if isinstance(value, list) else [str(value)]
+    except Exception:
+        # fallback bem tolerante
+        return [t.strip().strip("'\"") for t in str(raw).strip("[]").split(",") if t.strip()]
+
+def row_to_result(row: dict) -> dict:
+    """Linha do CSV de resultados (tudo texto) -> item da resposta do /search."""
+    try:
+        weekday_text = json.loads(row.get('weekday_text', ''))
+        if not isinstance(weekday_text, list):
+            weekday_text = [NO_HOURS]
+    except Exception:
+        weekday_text = [NO_HOURS]
+    weekday_map = dict(line.split(': ', 1) for line in weekday_text if isinstance(line, str) and ': ' in line)
+
+    viewport = row.get('viewport', '{}')
+    if isinstance(viewport, str):
+        try:
+            viewport = ast.literal_eval(viewport) if viewport else {}
+        except Exception:
+            viewport = {}
+
+    return {
+        'place_id': row.get('id', ''),
+        'name': row.get('name', ''),
+        'city_state': row.get('city_state', ''),
+        'address': row.get('address', ''),
+        'business_status': row.get('business_status', ''),
+        'open_now': str(row.get('open_now', '')).strip().lower() == 'true',
+        # CSVs anteriores ao modo lite não têm a coluna: todos passaram pelo Place Details
+        'enriched': str(row.get('enriched', '')).strip().lower() != 'false',
+        'weekday_text': weekday_text,
+        'weekday_map': weekday_map,
+        'types': _parse_list(row.get('types', '[]')),
+        'search_type': row.get('search_type', ''),
+        'latitude': row.get('latitude', ''),
+        'longitude': row.get('longitude', ''),
+        'viewport': viewport,
+    }
+
+def read_rows(path: str) -> tuple[list[str], list[dict]]:
+    """(colunas, linhas como dicts de texto) do CSV de resultados."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f, delimiter=';')
+        rows = [{k: (v if v is not None else '') for k, v in row.items()} for row in reader]
+        return reader.fieldnames or [], rows
+
+def build_results_json(path: str) -> str:
+    """Lista de resultados do CSV já serializada em JSON."""
+    _, rows = read_rows(path)
+    return json.dumps([row_to_result(row) for row in rows], ensure_ascii=False)
+
+def build_view_html(path: str) -> str:
+    """Tabela HTML do CSV (mesmo layout do DataFrame.to_html)."""
+    columns, rows = read_rows(path)
+    head = ''.join(f'<th>{html.escape(c)}</th>' for c in columns)
+    body = ''.join(
+        f'<tr><th>{i}</th>' + ''.join(f'<td>{html.escape(row.get(c, ""))}</td>' for c in columns) + '</tr>'
+        for i, row in enumerate(rows))
+    return (f'<table border="1" class="dataframe"><thead><tr style="text-align: right;"><th></th>{head}</tr>'
+            f'</thead><tbody>{body}</tbody></table>')
+
+
+def _signature(stat: os.stat_result) -> tuple:
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino, stat.st_ctime_ns)
+
+
+class ResultCache:
+    """LRU thread-safe de corpos prontos, limitado por nº de entradas e bytes."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES, max_entries: int = MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # (kind, path) -> (assinatura, body)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, path: str, builder) -> str:
+        """Corpo de `kind` para o arquivo, montado por builder(path) só quando o arquivo mudou."""
+        path = os.path.abspath(path)
+        signature = _signature(os.stat(path))
+        key = (kind, path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        body = builder(path)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= len(old[1])
+            self._entries[key] = (signature, body)
+            self._bytes += len(body)
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return body
+
+    def results_json(self, path: str) -> str:
+        return self.get('results', path, build_results_json)
+
+    def view_html(self, path: str) -> str:
+        return self.get('view', path, build_view_html)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
@@ -0,0 +1,243 @@
+# Catálogo (manifest) dos CSVs de resultados em system/results.
+# Evita varrer a árvore com glob recursivo a cada job: cada gravação/mudança
+# de pasta atualiza uma linha (upsert atômico no SQLite) com tipo,
+# coordenadas arredondadas, região, nº de linhas, mtime e versão do schema.
+#
+# Uso pela linha de comando:
+#   python results_manifest.py rebuild   (recria o catálogo a partir da árvore existente)
+#   python results_manifest.py reconcile (acerta o catálogo com CSVs copiados/apagados fora do pipeline)
+#   python results_manifest.py stats
+#   python results_manifest.py find <arquivo.csv>
+import os
+import re
+import csv
+import sys
+import time
+import threading
+from glob import glob
+
+from local_db import CACHE_DIR, ThreadLocalDB
+from regions import UF_TO_REGION, uf_from_city_state
+
+RESULTS_DIR = os.path.join("system", "results")
+MANIFEST_PATH = os.path.join(CACHE_DIR, "results_manifest.sqlite")
+
+# versões do layout dos CSVs de resultados -> colunas que as identificam
+SCHEMA_VERSIONS = {
+    1: {"id", "city_state", "name", "address", "open_now", "business_status", "latitude",
+        "longitude", "weekday_text", "types", "search_type", "viewport"},
+}
+# 2: + hours_intervals (horários em minutos da semana, ver opening_hours.py)
+SCHEMA_VERSIONS[2] = SCHEMA_VERSIONS[1] | {"hours_intervals"}
+# 3: + enriched (False = lugar gravado no modo lite, ainda sem Place Details; ver enrichment.py)
+SCHEMA_VERSIONS[3] = SCHEMA_VERSIONS[2] | {"enriched"}
+
+_FILENAME_RE = re.compile(r"^(?P<type>.+)_near_(?P<lat>-?\d+(?:\.\d+)?)_(?P<lng>-?\d+(?:\.\d+)?)\.csv$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    filename       TEXT PRIMARY KEY,
+    path           TEXT NOT NULL,
+    search_type    TEXT,
+    lat            REAL,
+    lng            REAL,
+    region         TEXT,
+    uf             TEXT,
+    rows           INTEGER,
+    mtime          REAL,
+    schema_version INTEGER,
+    updated_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_type_coord ON results(search_type, lat, lng);
+CREATE INDEX IF NOT EXISTS idx_results_region ON results(region);
+"""
+
+_COLUMNS = ("filename", "path", "search_type", "lat", "lng", "region", "uf",
+            "rows", "mtime", "schema_version", "updated_at")
+
+def parse_results_filename(filename: str):
+    """'<tipo>_near_<lat>_<lng>.csv' -> (tipo, lat, lng); None se não seguir o padrão."""
+    m = _FILENAME_RE.match(os.path.basename(filename))
+    if not m:
+        return None
+    return m.group("type"), float(m.group("lat")), float(m.group("lng"))
+
+def schema_version_from_columns(columns) -> int:
+    """Maior versão de SCHEMA_VERSIONS cujas colunas estão todas presentes (0 = desconhecido)."""
+    cols = set(columns)
+    found = [v for v, required in SCHEMA_VERSIONS.items() if required <= cols]
+    return max(found) if found else 0
+
+def _scan_csv(path: str):
+    """(colunas, nº de linhas, city_state da 1ª linha) lendo o CSV em streaming."""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f, delimiter=";")
+        header = next(reader, [])
+        first = next(reader, None)
+        rows = 0 if first is None else 1 + sum(1 for _ in reader)
+    city_state = None
+    if first is not None and "city_state" in header:
+        city_state = first[header.index("city_state")]
+    return header, rows, city_state
+
+
+class ResultsManifest:
+    """Catálogo dos arquivos de resultados (uma linha por nome de arquivo)."""
+
+    def __init__(self, path: str = MANIFEST_PATH, results_dir: str = RESULTS_DIR):
+        self.path = path
+        self.results_dir = results_dir
+        self._db = ThreadLocalDB(path, _SCHEMA)
+
+    def _conn(self):
+        return self._db.conn()
+
+    def close(self):
+        self._db.close()
+
+    def record(self, csv_path: str, rows: int | None = None, region: str | None = None,
+               uf: str | None = None, columns=None):
+        """Registra/atualiza o arquivo (chamado logo após gravar ou mover o CSV)."""
+        filename = os.path.basename(csv_path)
+        parsed = parse_results_filename(filename) or (None, None, None)
+        if rows is None or columns is None or uf is None:
+            header, counted, city_state = _scan_csv(csv_path)
+            rows = counted if rows is None else rows
+            columns = header if columns is None else columns
+            uf = uf or uf_from_city_state(city_state)
+        if region is None:
+            folder = os.path.basename(os.path.dirname(os.path.abspath(csv_path)))
+            region = folder if folder in UF_TO_REGION.values() else UF_TO_REGION.get(uf)
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO results({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+            (filename, os.path.relpath(csv_path), *parsed, region, uf, rows,
+             os.path.getmtime(csv_path), schema_version_from_columns(columns), time.time()))
+
+    def move(self, filename: str, new_path: str, region: str | None = None):
+        cur = self._conn().execute(
+            "UPDATE results SET path = ?, region = COALESCE(?, region), mtime = ?, updated_at = ? "
+            "WHERE filename = ?",
+            (os.path.relpath(new_path), region, os.path.getmtime(new_path), time.time(), filename))
+        if cur.rowcount == 0:
+            self.record(new_path, region=region)
+
+    def remove(self, filename: str):
+        self._conn().execute("DELETE FROM results WHERE filename = ?", (filename,))
+
+    def lookup(self, filename: str) -> dict | None:
+        """Entrada do arquivo, ou None. Entradas cujo arquivo sumiu do disco são descartadas."""
+        row = self._conn().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM results WHERE filename = ?", (filename,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(_COLUMNS, row))
+        if not os.path.exists(entry["path"]):
+            self.remove(filename)
+            return None
+        return entry
+
+    def find_path(self, filename: str) -> str | None:
+        entry = self.lookup(filename)
+        return entry["path"] if entry else None
+
+    def entries(self, search_type: str | None = None, region: str | None = None) -> list[dict]:
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM results WHERE 1 = 1"
+        params = []
+        if search_type:
+            sql += " AND search_type = ?"
+            params.append(search_type)
+        if region:
+            sql += " AND region = ?"
+            params.append(region)
+        return [dict(zip(_COLUMNS, row)) for row in self._conn().execute(sql + " ORDER BY filename", params)]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def rebuild(self) -> int:
+        """Recria o catálogo varrendo results_dir (uma única vez). Retorna o nº de arquivos."""
+        paths = glob(os.path.join(self.results_dir, "**", "*.csv"), recursive=True)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM results")
+            for path in sorted(paths):
+                self.record(path)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(paths)
+
+    def reconcile(self) -> dict:
+        """
+        Acerta o catálogo com a árvore sem recriá-lo: registra os CSVs que não
+        estão nele (ou mudaram de pasta/mtime) e tira os que sumiram do disco.
+        """
+        on_disk = {os.path.relpath(p): p
+                   for p in glob(os.path.join(self.results_dir, "**", "*.csv"), recursive=True)}
+        known = {entry["path"]: entry for entry in self.entries()}
+        added = removed = 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for rel_path, path in sorted(on_disk.items()):
+                entry = known.get(rel_path)
+                if entry is None or entry["mtime"] != os.path.getmtime(path):
+                    self.record(path)
+                    added += 1
+            for rel_path, entry in known.items():
+                if rel_path not in on_disk:
+                    # se o arquivo só mudou de pasta, a linha já aponta para o caminho novo e fica
+                    removed += conn.execute("DELETE FROM results WHERE filename = ? AND path = ?",
+                                            (entry["filename"], rel_path)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {"recorded": added, "removed": removed}
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        by_region = dict(conn.execute(
+            "SELECT COALESCE(region, '-'), COUNT(*) FROM results GROUP BY region").fetchall())
+        rows = conn.execute("SELECT COALESCE(SUM(rows), 0) FROM results").fetchone()[0]
+        return {"files": self.count(), "rows": rows, "by_region": by_region}
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def get_manifest() -> ResultsManifest:
+    """
+    Catálogo padrão do processo. Na primeira abertura, se estiver vazio e já
+    houver resultados em disco, é reconstruído a partir da árvore.
+    """
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            manifest = ResultsManifest()
+            if manifest.count() == 0 and glob(os.path.join(RESULTS_DIR, "**", "*.csv"), recursive=True):
+                manifest.rebuild()
+            _manifest = manifest
+        return _manifest
+
+def reset_manifest():
+    """Fecha o catálogo padrão; o próximo get_manifest() abre o da pasta atual."""
+    global _manifest
+    with _manifest_lock:
+        if _manifest is not None:
+            _manifest.close()
+        _manifest = None
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    manifest = ResultsManifest()
+    if command == "rebuild":
+        print(f"{manifest.rebuild()} arquivos catalogados em {MANIFEST_PATH}")
+    elif command == "reconcile":
+        print(manifest.reconcile())
+    elif command == "find" and len(sys.argv) > 2:
+        print(manifest.lookup(sys.argv[2]) or "não encontrado")
+    print(manifest.stats())
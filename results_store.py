@@ -0,0 +1,233 @@
+# Store colunar (Parquet) dos resultados, particionado por região e tipo:
+#   system/store/results/region=<Região>/search_type=<tipo>/*.parquet
+# Fica ao lado dos CSVs por busca (que continuam sendo gravados); análises e
+# concatenações leem um único dataset com filtros empurrados para a leitura.
+#
+# Requer pyarrow (pip install pyarrow).
+#
+# Uso pela linha de comando:
+#   python results_store.py import    (importa toda a árvore de CSVs de system/results)
+#   python results_store.py compact   (junta os arquivos pequenos de cada partição, sem duplicatas)
+#   python results_store.py stats
+#
+# A mesma linha pode entrar mais de uma vez (import seguido de append do mesmo
+# CSV, ou append depois de compact): read_results e compact ficam só com a mais
+# recente de cada (source_file, id). Appends e imports seguram um lock
+# compartilhado em <store>.lock e o compact um exclusivo, para ele não apagar
+# um arquivo gravado enquanto juntava a partição.
+import os
+import sys
+import time
+import uuid
+import shutil
+from glob import glob
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # dependência opcional
+    pa = ds = pq = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from regions import UF_TO_REGION, uf_from_city_state
+from results_manifest import RESULTS_DIR, parse_results_filename
+from opening_hours import intervals_column
+
+STORE_DIR = os.path.join("system", "store", "results")
+UNKNOWN_REGION = "Desconhecida"
+
+# colunas gravadas nos arquivos (region e search_type ficam nos diretórios)
+STRING_COLUMNS = ["id", "city_state", "uf", "name", "address", "business_status",
+                  "weekday_text", "hours_intervals", "types", "viewport", "source_file"]
+FLOAT_COLUMNS = ["latitude", "longitude", "origin_lat", "origin_lng"]
+DEDUP_KEY = ["source_file", "id"]
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow não está instalado: rode 'pip install pyarrow' para usar o store Parquet.")
+
+def _schema():
+    fields = [pa.field(c, pa.string()) for c in STRING_COLUMNS]
+    fields += [pa.field(c, pa.float64()) for c in FLOAT_COLUMNS]
+    fields += [pa.field("open_now", pa.bool_()), pa.field("enriched", pa.bool_()), pa.field("fetched_at", pa.timestamp("s")),
+               pa.field("region", pa.string()), pa.field("search_type", pa.string())]
+    return pa.schema(fields)
+
+@contextmanager
+def _store_lock(store_dir: str, exclusive: bool = False):
+    """Lock entre processos do store (no Windows, sempre exclusivo)."""
+    lock_path = os.path.normpath(store_dir) + ".lock"
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _dedupe(df: pd.DataFrame) -> pd.DataFrame:
+    """Uma linha por (source_file, id): a de fetched_at mais recente, na ordem original."""
+    return (df.sort_values("fetched_at", kind="stable")
+              .drop_duplicates(subset=DEDUP_KEY, keep="last")
+              .sort_index())
+
+def _partitioning():
+    return ds.partitioning(pa.schema([("region", pa.string()), ("search_type", pa.string())]), flavor="hive")
+
+def frame_from_csv(csv_path: str, region: str | None = None) -> pd.DataFrame:
+    """Lê um CSV de resultados e devolve o DataFrame com as colunas/tipos do store."""
+    df = pd.read_csv(csv_path, sep=";", encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    parsed = parse_results_filename(csv_path)
+    filename = os.path.basename(csv_path)
+    if region is None:
+        folder = os.path.basename(os.path.dirname(os.path.abspath(csv_path)))
+        region = folder if folder in UF_TO_REGION.values() else None
+
+    out = pd.DataFrame({c: df[c] if c in df.columns else "" for c in STRING_COLUMNS if c not in ("uf", "source_file")})
+    out["hours_intervals"] = intervals_column(out)
+    out["uf"] = out["city_state"].map(uf_from_city_state)
+    out["source_file"] = filename
+    out["latitude"] = pd.to_numeric(df.get("latitude"), errors="coerce")
+    out["longitude"] = pd.to_numeric(df.get("longitude"), errors="coerce")
+    out["origin_lat"] = parsed[1] if parsed else float("nan")
+    out["origin_lng"] = parsed[2] if parsed else float("nan")
+    out["open_now"] = df.get("open_now", pd.Series("", index=df.index)).str.strip().str.lower() == "true"
+    # CSVs anteriores ao modo lite sempre passaram pelo Place Details
+    out["enriched"] = df.get("enriched", pd.Series("", index=df.index)).str.strip().str.lower() != "false"
+    out["fetched_at"] = pd.Timestamp(os.path.getmtime(csv_path), unit="s").floor("s")
+    if region is None:
+        region = UF_TO_REGION.get(out["uf"].dropna().iloc[0]) if out["uf"].notna().any() else None
+    out["region"] = region or UNKNOWN_REGION
+    search_type = df["search_type"] if "search_type" in df.columns else pd.Series("", index=df.index)
+    out["search_type"] = search_type.where(search_type != "", parsed[0] if parsed else "desconhecido")
+    return out
+
+def _write(df: pd.DataFrame, store_dir: str, basename: str):
+    table = pa.Table.from_pandas(df[_schema().names], schema=_schema(), preserve_index=False)
+    ds.write_dataset(table, store_dir, format="parquet", partitioning=_partitioning(),
+                     basename_template=basename + "-{i}.parquet",
+                     existing_data_behavior="overwrite_or_ignore")
+
+def append_csv(csv_path: str, region: str | None = None, store_dir: str = STORE_DIR):
+    """
+    Acrescenta um CSV de resultados ao store. O nome do arquivo Parquet
+    deriva do nome do CSV, então reimportar o mesmo CSV sobrescreve em vez de duplicar.
+    """
+    require_pyarrow()
+    df = frame_from_csv(csv_path, region)
+    if df.empty:
+        return 0
+    with _store_lock(store_dir):
+        _write(df, store_dir, os.path.splitext(os.path.basename(csv_path))[0])
+    return len(df)
+
+def import_csv_tree(results_dir: str = RESULTS_DIR, store_dir: str = STORE_DIR, batch_files: int = 500) -> int:
+    """Importa de uma vez toda a árvore de CSVs (em lotes, já gerando arquivos grandes)."""
+    require_pyarrow()
+    paths = sorted(glob(os.path.join(results_dir, "**", "*.csv"), recursive=True))
+    total = 0
+    for i in range(0, len(paths), batch_files):
+        frames = []
+        for path in paths[i:i + batch_files]:
+            try:
+                frames.append(frame_from_csv(path))
+            except Exception as e:
+                print(f"Aviso: {path} ignorado ({e})")
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            continue
+        batch = pd.concat(frames, ignore_index=True)
+        with _store_lock(store_dir):
+            _write(batch, store_dir, f"import-{i // batch_files:05d}")
+        total += len(batch)
+    return total
+
+def open_dataset(store_dir: str = STORE_DIR):
+    require_pyarrow()
+    return ds.dataset(store_dir, format="parquet", partitioning="hive", schema=_schema())
+
+def read_results(region: str | None = None, search_type: str | None = None, columns: list[str] | None = None,
+                 filter=None, store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """
+    Lê o dataset como DataFrame, sem linhas repetidas por (source_file, id).
+    region/search_type podam partições inteiras; `filter` aceita uma expressão
+    pyarrow (ex.: ds.field("open_now") == True).
+    """
+    expr = filter
+    for name, value in (("region", region), ("search_type", search_type)):
+        if value is not None:
+            cond = ds.field(name) == value
+            expr = cond if expr is None else expr & cond
+    # a deduplicação precisa da chave e de fetched_at mesmo quando não foram pedidos
+    read_columns = None if columns is None else list(dict.fromkeys([*columns, *DEDUP_KEY, "fetched_at"]))
+    df = _dedupe(open_dataset(store_dir).to_table(columns=read_columns, filter=expr).to_pandas())
+    df = df.reset_index(drop=True)
+    return df if columns is None else df[list(columns)]
+
+def compact(store_dir: str = STORE_DIR) -> dict:
+    """
+    Junta os arquivos de cada partição em um só, descartando linhas repetidas
+    (mesmo source_file + id, fica a mais recente). Retorna {partição: linhas}.
+    """
+    require_pyarrow()
+    with _store_lock(store_dir, exclusive=True):
+        return _compact(store_dir)
+
+def _compact(store_dir: str) -> dict:
+    result = {}
+    for region_dir in sorted(glob(os.path.join(store_dir, "region=*"))):
+        for part_dir in sorted(glob(os.path.join(region_dir, "search_type=*"))):
+            files = sorted(glob(os.path.join(part_dir, "*.parquet")))
+            if len(files) <= 1:
+                continue
+            df = pd.concat([pq.read_table(f).to_pandas() for f in files], ignore_index=True)
+            df = _dedupe(df).sort_values(["source_file"], kind="stable")
+            # grava o compactado antes de apagar os originais (nunca fica sem dados)
+            tmp_path = os.path.join(part_dir, f".compact-{uuid.uuid4().hex}.tmp")
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+            final_path = os.path.join(part_dir, f"compacted-{int(time.time())}.parquet")
+            for f in files:
+                os.remove(f)
+            os.replace(tmp_path, final_path)
+            result[os.path.relpath(part_dir, store_dir)] = len(df)
+    return result
+
+def stats(store_dir: str = STORE_DIR) -> dict:
+    require_pyarrow()
+    files = glob(os.path.join(store_dir, "**", "*.parquet"), recursive=True)
+    if not files:
+        return {"files": 0, "rows": 0, "partitions": 0}
+    rows = open_dataset(store_dir).count_rows()
+    partitions = {os.path.dirname(f) for f in files}
+    return {"files": len(files), "rows": rows, "partitions": len(partitions)}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "import":
+        if os.path.isdir(STORE_DIR) and "--replace" in sys.argv:
+            with _store_lock(STORE_DIR, exclusive=True):
+                shutil.rmtree(STORE_DIR)
+        print(f"{import_csv_tree()} linhas importadas de {RESULTS_DIR} para {STORE_DIR}")
+    elif command == "compact":
+        for part, rows in compact().items():
+            print(f"  {part}: {rows} linhas")
+    print(stats())
@@ -3,56 +3,161 @@
 # todos os retornos da função nearbyPlaces registrados no dataframe.
 # O json retornado é percorrido e as informações desejadas são registradas
 # junto ao dataframe.
+#
+# Os destinos de cada arquivo são divididos em lotes dentro dos limites da
+# API (até 25 destinos e 100 elementos por requisição). Lotes e arquivos
+# rodam em paralelo; o ritmo das chamadas é o do limitador de QPS do
+# endpoint distance_matrix (rate_limit.py), compartilhado pelo processo.
+#
+# Modos: 'walking' (padrão, API para todas as linhas) e 'geodesic' (só a
+# distância em linha reta, sem API). Com top_k, a API só é chamada para os K
+# destinos mais próximos em linha reta de cada tipo do arquivo.
+#
+# O pandas, a matriz geodésica e a barra de progresso do rich são importados
+# dentro das funções: importar o módulo (main.py) não carrega o pandas.
 
-from setup import *
+import os
+from glob import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
 
-def routesMatrix():
-    globed = glob(f'{path_system}*&.csv')
-    for caso in track(globed, description='Aplicando [green]DistanceMatrix...', style='black', complete_style='white', finished_style='green'):
-        print(separators)
-        df = pd.read_csv(caso, sep=';')
-        coord = caso.split('&')[2]
-        coord = coord.split('+')
-        pin_point = {'lat': coord[0].replace(',', '.'), 'lng': coord[1].replace(',', '.')}
-        coord_destinations = []
-        for i in df.index:
-            json_format = df.at[i, 'coordenada_do_local'].replace("'", "\"")
-            json_format = json.loads(json_format)
-            coord_destinations.append(json_format)
-        print(f'Searching [green]Matrix[/green] for [deep_pink4]{caso}[/deep_pink4] with coordinates {pin_point}\n')
-        response = client.distance_matrix(
-            origins=pin_point,
-            destinations=coord_destinations,
+from setup import path_system, drop_unnamed, get_maps_client
+from metrics import get_metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from geodesic_matrix import MatrixSavings
+
+MAX_DESTINATIONS = 25     # destinos por requisição
+MAX_ELEMENTS = 100        # origens x destinos por requisição
+FILE_WORKERS = 4          # arquivos processados ao mesmo tempo
+CHUNK_WORKERS = 8         # requisições (lotes) em voo ao mesmo tempo
+
+DISTANCE_COLUMN = 'distancia(metros)'
+DURATION_COLUMN = 'tempo_de_viagem(minutos)'
+TYPE_COLUMNS = ('search_type', 'tipo', 'type')   # coluna do tipo, quando o arquivo tiver
+MODES = ('walking', 'geodesic')
+
+_COORD_RE = r"""['"]lat['"]\s*:\s*(?P<lat>-?\d+(?:\.\d+)?(?:[eE]-?\d+)?).*?['"]lng['"]\s*:\s*(?P<lng>-?\d+(?:\.\d+)?(?:[eE]-?\d+)?)"""
+
+
+class MatrixError(RuntimeError):
+    """Resposta do Distance Matrix fora do esperado."""
+
+
+def parse_coordinates(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Coluna coordenada_do_local ("{'lat': .., 'lng': ..}") -> DataFrame lat/lng (texto) de uma vez."""
+    coords = df['coordenada_do_local'].astype(str).str.extract(_COORD_RE)
+    if coords.isna().any().any():
+        bad = coords.index[coords.isna().any(axis=1)].tolist()
+        raise MatrixError(f'coordenada_do_local inválida nas linhas {bad[:10]}')
+    return coords
+
+def parse_destinations(df: "pd.DataFrame") -> list[str]:
+    """Coluna coordenada_do_local -> ['lat,lng', ...]."""
+    coords = parse_coordinates(df)
+    return (coords['lat'] + ',' + coords['lng']).tolist()
+
+def chunk_destinations(destinations: list, n_origins: int = 1) -> list[list]:
+    size = max(1, min(MAX_DESTINATIONS, MAX_ELEMENTS // max(1, n_origins)))
+    return [destinations[i:i + size] for i in range(0, len(destinations), size)]
+
+def request_chunk(origin: dict, destinations: list[str]) -> list[dict]:
+    """Uma requisição (origem x lote de destinos); devolve os elementos na ordem dos destinos."""
+    with get_metrics().stage('matrix_chunk'):
+        response = get_maps_client().distance_matrix(
+            origins=origin,
+            destinations=destinations,
             mode='walking',
             language='pt-BR',
             units='metric'
         )
+    rows = response.get('rows') or []
+    elements = rows[0].get('elements') if rows else None
+    if response.get('status') not in (None, 'OK') or elements is None or len(elements) != len(destinations):
+        raise MatrixError(f'Resposta inesperada para {len(destinations)} destinos: {response}')
+    return elements
+
+def elements_to_frame(elements: list[dict], index=None) -> "pd.DataFrame":
+    """Distância (m) e tempo (min) de todos os elementos numa passada (NaN quando status != OK)."""
+    import pandas as pd
+
+    flat = pd.json_normalize(elements)
+    distance, duration = (pd.to_numeric(flat[key], errors='coerce') if key in flat else pd.Series(float('nan'), index=flat.index)
+                          for key in ('distance.value', 'duration.value'))
+    out = pd.DataFrame({DISTANCE_COLUMN: distance, DURATION_COLUMN: (duration / 60).round(2)})
+    if index is not None:
+        out.index = index
+    return out
+
+def _pin_point(caso: str) -> dict:
+    coord = caso.split('&')[2].split('+')
+    return {'lat': coord[0].replace(',', '.'), 'lng': coord[1].replace(',', '.')}
+
+def _write_problem(caso: str, pin_point: dict, error):
+    empreendimento = caso.split('&')[1]
+    error_description = f"Problem: Could not create a proper DataFrame for API response\n\nName: {empreendimento}\n\nCoordinates: {pin_point}\n\nOrigin DataFrame: {caso}\n\nAPI Response: {error}"
+    os.makedirs('system/problems', exist_ok=True)
+    with open(f'system/problems/MATRIX_at_{empreendimento}.txt', 'w', encoding="latin-1", errors="replace") as file:
+        file.write(error_description)
 
-        try:        
-            rows = response.get('rows')[0].get('elements')
-            print(f'[purple]Returned[/purple]:\n{response}\n')
-            df_response = pd.DataFrame(rows)
-            df_response.drop(columns=['status'], axis=1, inplace=True)
-
-            for i in df_response.index:
-                minutos = int(df_response.at[i, 'duration'].get('value')) / 60
-                df_response.at[i, 'distance'] = df_response.at[i, 'distance'].get('value')
-                df_response.at[i, 'duration'] = round(minutos, 2)
-            df_response.columns = ['distancia(metros)', 'tempo_de_viagem(minutos)']
-            print(f'DataFrame from response:\n{df_response}\n\n')
-
-            df_response = pd.concat([df, df_response], axis=1)
-            print(f'DataFrame concatenated:\n{df_response}\n\n')
-            print(f'\n[green]Updating[/green] CSV [purple]{caso}[/purple]\n')
-            df_response = drop_unnamed(df_response)
-            updt_name = f"{caso.split('.csv')[0]}MATRIX_APPLIED.csv"
-            df_response.to_csv(updt_name, sep=';')
-            os.remove(caso)
-            print(f'[yellow]Created {updt_name}\n\n')
-        except:
-            empreendimento = caso.split('&')[1]
-            row = 0
-            print('\n[bright_red]WARNING:[/bright_red] Response not expected\nCSV will not be updated, [yellow]txt file with description will be created instead[/yellow]\n')
-            error_description = f"Problem: Could not create a proper DataFrame for API response\n\nName: {empreendimento}\n\nCoordinates: {pin_point}\n\nOrigin DataFrame: {caso}\n\nAPI Response: {response}" # CEP: {df.at[row, 'txt_cep']} / Vicinity: {df.at[row, 'txt_uf']} {df.at[row, 'txt_municipio']} {df.at[row, 'txt_endereco']}
-            with open(f'system/problems/MATRIX_at_{empreendimento}.txt', 'w', encoding="latin-1") as file:
-                file.write(error_description)
+def apply_matrix(caso: str, chunk_pool: ThreadPoolExecutor, mode: str = 'walking', top_k: int | None = None,
+                 savings: "MatrixSavings | None" = None) -> str | None:
+    """Aplica o Distance Matrix a um arquivo; devolve o nome do *MATRIX_APPLIED.csv ou None se falhar."""
+    import pandas as pd
+    from rich import print
+    from geodesic_matrix import GEODESIC_COLUMN, geodesic_meters, top_k_mask
+
+    pin_point = _pin_point(caso)
+    df = pd.read_csv(caso, sep=';')
+    try:
+        coords = parse_coordinates(df)
+        geodesic = pd.Series(geodesic_meters(float(pin_point['lat']), float(pin_point['lng']),
+                                             coords['lat'].astype(float).to_numpy(),
+                                             coords['lng'].astype(float).to_numpy()), index=df.index)
+        type_col = next((c for c in TYPE_COLUMNS if c in df.columns), None)
+        if mode == 'geodesic':
+            selected = pd.Series(False, index=df.index)
+        else:
+            selected = top_k_mask(geodesic, top_k, df[type_col] if type_col else None)
+        destinations = (coords['lat'] + ',' + coords['lng'])[selected].tolist()
+        chunks = chunk_destinations(destinations)
+        if savings is not None:
+            savings.add(len(df), len(destinations))
+        print(f'Searching [green]Matrix[/green] for [deep_pink4]{caso}[/deep_pink4] with coordinates {pin_point} '
+              f'({len(destinations)} de {len(df)} destinos em {len(chunks)} lotes)')
+        futures = [chunk_pool.submit(request_chunk, pin_point, chunk) for chunk in chunks]
+        elements = [element for future in futures for element in future.result()]
+        df_response = elements_to_frame(elements, index=df.index[selected]).reindex(df.index)
+        df_response[GEODESIC_COLUMN] = geodesic
+    except Exception as e:
+        print(f'\n[bright_red]WARNING:[/bright_red] Response not expected for {caso}\nCSV will not be updated, [yellow]txt file with description will be created instead[/yellow]\n')
+        _write_problem(caso, pin_point, e)
+        return None
+
+    df_response = drop_unnamed(pd.concat([df, df_response], axis=1))
+    updt_name = f"{caso.split('.csv')[0]}MATRIX_APPLIED.csv"
+    df_response.to_csv(updt_name, sep=';')
+    os.remove(caso)
+    return updt_name
+
+def routesMatrix(file_workers: int = FILE_WORKERS, chunk_workers: int = CHUNK_WORKERS,
+                 mode: str = 'walking', top_k: int | None = None) -> "MatrixSavings":
+    from rich import print
+    from rich.progress import track
+    from geodesic_matrix import MatrixSavings
+
+    if mode not in MODES:
+        raise ValueError(f'mode deve ser um de {MODES}')
+    globed = glob(f'{path_system}*&.csv')
+    savings = MatrixSavings()
+    # pools separados: um arquivo esperando seus lotes nunca ocupa a vaga de um lote
+    with ThreadPoolExecutor(max_workers=max(1, chunk_workers)) as chunk_pool, \
+         ThreadPoolExecutor(max_workers=max(1, file_workers)) as file_pool:
+        futures = {file_pool.submit(apply_matrix, caso, chunk_pool, mode, top_k, savings): caso for caso in globed}
+        for future in track(as_completed(futures), total=len(futures), description='Aplicando [green]DistanceMatrix...', style='black', complete_style='white', finished_style='green'):
+            updt_name = future.result()
+            if updt_name:
+                print(f'[yellow]Created {updt_name}')
+    print(savings)
+    return savings
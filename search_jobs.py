@@ -0,0 +1,184 @@
+# Buscas em segundo plano para a interface web. Em vez de segurar a requisição
+# HTTP durante o reverse geocode + Nearby Search + até 20 Place Details, o
+# cliente cria um job (POST), recebe o id e acompanha por polling ou SSE.
+# Cada lugar vira um evento assim que os detalhes dele chegam.
+#
+# Os jobs rodam num pool limitado (JOB_WORKERS); o ritmo das chamadas à API
+# continua sendo o do limitador de QPS do transport.
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from places import PlacesApiError, get_city_state, search_places, save_results, make_csv_filename
+from results_manifest import get_manifest
+from result_cache import row_to_result, read_rows
+
+JOB_WORKERS = 4          # buscas simultâneas
+MAX_JOBS = 200           # jobs guardados em memória (os concluídos mais antigos saem primeiro)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def results_path(filename: str) -> str | None:
+    """Caminho atual do CSV de resultados pelo catálogo (inclui as pastas por região)."""
+    return get_manifest().find_path(filename)
+
+def run_search(place_type: str, lat: str, lng: str, source: str, api_key: str, on_place=None,
+               lite: bool = False) -> dict:
+    """
+    Executa uma busca. source=auto responde pelo índice local quando os dados
+    guardados cobrem o ponto e estão frescos; source=index força o índice;
+    source=api força a API. Retorna {source, coverage, csv_filename, csv_path,
+    rows}; `rows` só vem preenchido na resposta parcial do índice (sem arquivo).
+    lite=True pula o Place Details na busca pela API (horários sob demanda).
+    Lança ValueError para lat/lng inválidos.
+    """
+    from places_index import get_places_index, rows_for_csv, fetched_at   # pandas: só na primeira busca
+
+    csv_filename = make_csv_filename(place_type, lat, lng)
+    out = {"source": source, "coverage": None, "csv_filename": csv_filename, "csv_path": None, "rows": None}
+    if source in ("auto", "index"):
+        nearest, coverage = get_places_index().answer(float(lat), float(lng), place_type)
+        out["coverage"] = coverage
+        # as linhas guardadas trazem o município da busca de origem; vale o do ponto consultado
+        def here():
+            return get_city_state(float(lat), float(lng), api_key)
+
+        if source == "index" and not coverage["covered"]:
+            # resposta parcial do índice: não vira arquivo (não pode passar por uma busca completa)
+            out["rows"] = rows_for_csv(nearest, place_type, here() if len(nearest) else None)
+        elif source == "index" or (coverage["covered"] and coverage["fresh"]):
+            source = "index"
+            # a própria busca já guardada responde o ponto: não regrava (o cache continua válido)
+            same_search = coverage["origin_distance_km"] == 0 and results_path(csv_filename)
+            if len(nearest) and not same_search:
+                city_state = here()
+                save_results(rows_for_csv(nearest, place_type, city_state), place_type, lat, lng,
+                             city_state, fetched_at=fetched_at(nearest))
+        else:
+            source = "api"
+    if source != "index":
+        source = "api"
+        print(f"Rodando search_places para {place_type} em ({lat}, {lng})")
+        search_places(lat, lng, place_type, api_key=api_key, on_place=on_place, lite=lite)
+    out["source"] = source
+    if out["rows"] is None:
+        out["csv_path"] = results_path(csv_filename)
+    return out
+
+
+class SearchJob:
+    """Estado de uma busca e a fila de eventos (place, done, error) numerada a partir de 0."""
+
+    def __init__(self, place_type: str, lat: str, lng: str, source: str, lite: bool = False):
+        self.id = uuid.uuid4().hex
+        self.params = {"type": place_type, "lat": lat, "lng": lng, "source": source, "lite": lite}
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self._cond = threading.Condition()
+
+    def emit(self, kind: str, data: dict):
+        with self._cond:
+            self.events.append({"seq": len(self.events), "event": kind, "data": data})
+            self._cond.notify_all()
+
+    def start(self):
+        with self._cond:
+            self.state = RUNNING
+            self._cond.notify_all()
+
+    def finish(self, state: str, kind: str, data: dict):
+        with self._cond:
+            self.state = state
+            self.finished_at = time.time()
+            self.events.append({"seq": len(self.events), "event": kind, "data": data})
+            self._cond.notify_all()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED)
+
+    def wait_events(self, since: int, timeout: float) -> list[dict]:
+        """Eventos com seq >= since, esperando até timeout segundos se ainda não houver."""
+        with self._cond:
+            if len(self.events) <= since and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[since:]
+
+    def snapshot(self, since: int = 0) -> dict:
+        with self._cond:
+            return {"job_id": self.id, "state": self.state, "params": self.params,
+                    "events": self.events[since:], "next": len(self.events)}
+
+
+class SearchJobManager:
+    """Pool limitado de buscas + registro dos jobs em memória."""
+
+    def __init__(self, api_key: str, workers: int = JOB_WORKERS, max_jobs: int = MAX_JOBS):
+        self.api_key = api_key
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, place_type: str, lat: str, lng: str, source: str = "auto", lite: bool = False) -> SearchJob:
+        job = SearchJob(place_type, lat, lng, source, lite)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> SearchJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict(self):
+        for job_id in [j for j, job in self._jobs.items() if job.finished]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+
+    def _run(self, job: SearchJob):
+        job.start()
+        p = job.params
+
+        def on_place(position, row, total):
+            job.emit("place", {"position": position, "total": total, "place": row_to_result(row)})
+
+        try:
+            result = run_search(p["type"], p["lat"], p["lng"], p["source"], self.api_key, on_place=on_place,
+                                lite=p["lite"])
+            if result["rows"] is not None or result["source"] == "index":
+                # respostas do índice chegam de uma vez
+                rows = result["rows"] if result["rows"] is not None else (
+                    read_rows(result["csv_path"])[1] if result["csv_path"] else [])
+                for position, row in enumerate(rows):
+                    on_place(position, row, len(rows))
+            download_url = f"/download/{result['csv_filename']}" if result["csv_path"] else None
+            job.finish(DONE, "done", {"download_url": download_url, "source": result["source"],
+                                      "coverage": result["coverage"]})
+        except PlacesApiError as e:
+            job.finish(FAILED, "error", {"error": f"A Places API recusou a busca ({e.status})", "detail": str(e)})
+        except Exception as e:
+            job.finish(FAILED, "error", {"error": f"Falha ao consultar Places ({type(e).__name__})",
+                                         "detail": str(e)})
+
+
+def sse_stream(job: SearchJob, since: int = 0, heartbeat: float = 15.0):
+    """Gerador de Server-Sent Events do job (termina após o evento final)."""
+    while True:
+        events = job.wait_events(since, heartbeat)
+        if not events:
+            yield ": keep-alive\n\n"
+            continue
+        for event in events:
+            yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+        since = events[-1]["seq"] + 1
+        if job.finished and since >= len(job.events):
+            return
@@ -1,22 +1,24 @@
 # Aqui dentro são criadas as variáveis a serem usadas pelo sistema, além de serem feitos os imports
 # e a instalação/atualização de pacotes
+#
+# Importar este módulo não lê arquivos, não abre conexões e não carrega
+# bibliotecas pesadas: a chave e o cliente do Google Maps são criados no
+# primeiro uso (get_key/get_maps_client), o pandas e a barra de progresso do
+# rich são importados dentro das funções que os usam e os tracebacks do rich
+# só são instalados pelos pontos de entrada (init_console). Assim a linha de
+# comando e processos de trabalho sobem rápido.
 
 
 # Importação de bibliotecas
-import pandas as pd
-import googlemaps
-import json
 from glob import glob
-from rich.progress import track
-from rich.traceback import install
 from rich import print
 from datetime import datetime
 import warnings
 import os
-
-# Impede avisos desnecessários aos usuários
-warnings.filterwarnings('ignore')
-install()
+import csv
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 # Define os caminhos dos diretórios pelo sistema
@@ -26,9 +28,38 @@ path_output = r'output/'
 path_key = f'{path_system}api_key.txt'
 
 
-# Lê a chave de acesso ao Google Maps API
-key = open(path_key, 'r').read()
-client = googlemaps.Client(key)
+# Configuração do terminal para os pontos de entrada (main.py, batch_runner.py)
+def init_console():
+    from rich.traceback import install
+
+    # Impede avisos desnecessários aos usuários
+    warnings.filterwarnings('ignore')
+    install()
+
+
+# Chave de acesso ao Google Maps API e cliente googlemaps, lidos/criados no primeiro uso
+_key = None
+_key_lock = threading.Lock()
+
+def get_key() -> str:
+    global _key
+    with _key_lock:
+        if _key is None:
+            with open(path_key, 'r') as f:
+                _key = f.read().strip()
+        return _key
+
+def get_maps_client():
+    from transport import get_client
+    return get_client(get_key())
+
+def __getattr__(name):
+    # compatibilidade com setup.key / setup.client (antes criados na importação)
+    if name == 'key':
+        return get_key()
+    if name == 'client':
+        return get_maps_client()
+    raise AttributeError(f"module 'setup' has no attribute {name!r}")
 
 
 # Lista de zonas de interesse a ser buscado via API
@@ -53,20 +84,82 @@ interest_zones = [
     ]
 
 
-# Função para concatenar vários arquivos de resultados em um só
-def concatenate_dataframes(output_name: str):
-    concat_glob = glob(f'{path_system}*MATRIX_APPLIED.csv')
-    concat_df = pd.read_csv(concat_glob.pop(0), sep=';')
-    for cache in track(concat_glob, description=f'Concatenando DataFrames...', style='black', complete_style='white', finished_style='green'):
-        new_df = pd.read_csv(cache, sep=';')
-        concat_df = pd.concat([concat_df, new_df], axis=0, ignore_index=True)
-    concat_df = drop_unnamed(concat_df)
+# Função para concatenar vários arquivos de resultados em um só.
+# Em streaming: o schema de saída é a união dos cabeçalhos (lidos antes, sem
+# carregar os dados) e cada arquivo é lido em blocos de CONCAT_CHUNK_ROWS
+# linhas e anexado direto no CSV de saída, então a memória não cresce com o
+# número de arquivos. Com workers > 1, até 2*workers arquivos são lidos
+# adiantados em paralelo (mantendo a ordem de saída).
+CONCAT_CHUNK_ROWS = 50_000
+
+def _is_unnamed(column: str) -> bool:
+    return not column or 'Unnamed' in column
+
+def _csv_header(path: str, sep: str = ';') -> list:
+    with open(path, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+        return next(csv.reader(f, delimiter=sep), [])
+
+def union_columns(paths: list) -> list:
+    """União das colunas de todos os arquivos, na ordem em que aparecem (sem as 'Unnamed')."""
+    columns = {}
+    for path in paths:
+        for column in _csv_header(path):
+            if not _is_unnamed(column):
+                columns.setdefault(column, None)
+    return list(columns)
+
+def _read_chunks(path: str):
+    import pandas as pd
+    return pd.read_csv(path, sep=';', chunksize=CONCAT_CHUNK_ROWS)
+
+def _read_whole(path: str):
+    import pandas as pd
+    return [pd.read_csv(path, sep=';')]
+
+def concatenate_dataframes(output_name: str, pattern: str | None = None, workers: int = 1):
+    import pandas as pd
+    from rich.progress import track
+
+    concat_glob = sorted(glob(pattern or f'{path_system}*MATRIX_APPLIED.csv', recursive=True))
+    if not concat_glob:
+        print('[bright_red]Nenhum arquivo para concatenar')
+        return None
+    columns = union_columns(concat_glob)
     now = datetime.now().strftime('%d-%m-%Y_%H-%M')
-    concat_df.to_csv(f'{path_output}hab_entorno_{now}_{output_name}', sep=';')
-    print(f'\n[yellow]CSV {path_output}hab_entorno_{now}_{output_name} successfully created')
+    out_path = f'{path_output}hab_entorno_{now}_{output_name}'
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    tmp_path = f'{out_path}.{os.getpid()}.tmp'
+
+    def chunk_lists():
+        if workers <= 1:
+            for path in concat_glob:
+                yield _read_chunks(path)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for path in concat_glob:
+                pending.append(pool.submit(_read_whole, path))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    written = 0
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+        # cabeçalho com a coluna de índice vazia, como o to_csv com index=True
+        pd.DataFrame(columns=columns).to_csv(out, sep=';')
+        for chunks in track(chunk_lists(), total=len(concat_glob), description='Concatenando DataFrames...', style='black', complete_style='white', finished_style='green'):
+            for chunk in chunks:
+                chunk = chunk.reindex(columns=columns)
+                chunk.index = range(written, written + len(chunk))
+                chunk.to_csv(out, sep=';', header=False)
+                written += len(chunk)
+    os.replace(tmp_path, out_path)
+    print(f'\n[yellow]CSV {out_path} successfully created ({written} linhas de {len(concat_glob)} arquivos)')
+    return out_path
 
 # Função auxiliar para remover colunas "Unnamed" geradas pelo pandas
-def drop_unnamed(df: pd.DataFrame):
+def drop_unnamed(df):
     unnamed_list = []
     for unnamed in df.columns:
         if 'Unnamed' in unnamed:
@@ -74,23 +167,18 @@ def drop_unnamed(df: pd.DataFrame):
     df.drop(unnamed_list, axis=1, inplace=True)
     return df
 
-# Identifica duplicidade de locais com coordenadas idênticas ou semelhantes
+# Identifica duplicidade de locais com coordenadas idênticas ou semelhantes.
+# Usa as mesmas regras (distância em metros + semelhança de nome/endereço) do
+# detector em lote dedupe.py, que gera um relatório único para todo o dataset.
 def match_coordinates(lat, lng, vicinity, place_name, cache_coordinates:dict, cache_vicinity:str, cache_name:str):
-    if str(lat)[:7] == str(cache_coordinates['lat'])[:7] and str(lng)[:7] == str(cache_coordinates['lng'])[:7]:
+    from dedupe import match_pair
+    kind = match_pair(lat, lng, vicinity, place_name,
+                      cache_coordinates['lat'], cache_coordinates['lng'], cache_vicinity, cache_name)
+    if kind == 'same_coordinates':
         print(f'[bright_red]Found same coordinates for different places, adding it to a remove list for future removal[/bright_red]\nPlace:{place_name} {vicinity} ({lat} {lng})\nPlace at cache: {cache_name} {cache_vicinity} ({cache_coordinates})')
-        message = f'Found places with same coordinates\n\n{"- "*20}\nSaved at cache: {cache_name}\nVicinity: {cache_vicinity}\nCoordinates: {cache_coordinates}\n{"- "*20}\n\nPlace next to it: {place_name}\nVicinity: {vicinity}\nCoordinates: {lat} {lng}\n'
-        open(f'system/problems/SAME_COORDINATES_AT_{str(lat)[:10]}+{str(lng)[:10]}_AND_{str(cache_coordinates["lat"])[:10]}+{str(cache_coordinates["lng"])[:10]}.txt', 'w', encoding="utf-8").write(message)
-        return True
-    elif str(lat)[:5] == str(cache_coordinates['lat'])[:5] and str(lng)[:5] == str(cache_coordinates['lng'])[:5]:
-        if vicinity[:15] == cache_vicinity[:15]:
-            print(f'[bright_red]Found lookalike coordinates and vicinities for different places, adding it to a remove list for future removal[/bright_red]\nPlace: {vicinity} ({lat} {lng})\nPlace at cache: {cache_name} {cache_vicinity} ({cache_coordinates})')
-            message = f'Found places with same lookalike coordinates and vicinities\n\n{"- "*20}\nSaved at cache: {cache_name}\nVicinity: {cache_vicinity}\nCoordinates: {cache_coordinates}\n{"- "*20}\n\nPlace next to it: {place_name}\nVicinity: {vicinity}\nCoordinates: {lat} {lng}\n'
-            open(f'system/problems/LOOKALIKE_PLACES_AT_{str(lat)[:10]}+{str(lng)[:10]}_AND_{str(cache_coordinates["lat"])[:10]}+{str(cache_coordinates["lng"])[:10]}.txt', 'w', encoding="utf-8").write(message)
-            return True
-        else:
-            return False
-    else:
-        return False
+    elif kind == 'lookalike':
+        print(f'[bright_red]Found lookalike coordinates and vicinities for different places, adding it to a remove list for future removal[/bright_red]\nPlace: {vicinity} ({lat} {lng})\nPlace at cache: {cache_name} {cache_vicinity} ({cache_coordinates})')
+    return kind is not None
 
 # ASCII ART/CONFIGS 
 
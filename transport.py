@@ -0,0 +1,186 @@
+# Camada HTTP única para todas as chamadas ao Google Maps.
+# Uma só requests.Session (keep-alive + pool de conexões) é compartilhada
+# pelas chamadas diretas (Nearby Search, Place Details) e pelos clientes
+# googlemaps (Geocoding, Distance Matrix), com timeout por endpoint, retry
+# do urllib3 com backoff exponencial + jitter em 5xx e erros de conexão e o
+# limitador de QPS adaptativo de rate_limit.py. OVER_QUERY_LIMIT e HTTP 429
+# não passam pelo retry do urllib3: o MapsSession refaz a chamada depois de
+# frear o limitador, respeitando o Retry-After. Cada resposta
+# (inclusive as refeitas após throttle) entra nas métricas de metrics.py.
+#
+# MAPS_BASE_URL (ambiente) troca o servidor, ex.: a imitação local de
+# maps_standin.py para testes de desempenho.
+import os
+import time
+import threading
+from typing import TYPE_CHECKING
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from rate_limit import get_limiter
+from metrics import get_metrics
+
+if TYPE_CHECKING:
+    import googlemaps
+
+BASE_URL = os.environ.get("MAPS_BASE_URL", "https://maps.googleapis.com")
+
+ENDPOINTS = {
+    "nearby": "/maps/api/place/nearbysearch/json",
+    "details": "/maps/api/place/details/json",
+    "geocode": "/maps/api/geocode/json",
+    "distance_matrix": "/maps/api/distancematrix/json",
+}
+
+# (connect, read) em segundos
+TIMEOUTS = {
+    "nearby": (3.05, 10),
+    "details": (3.05, 5),
+    "geocode": (3.05, 10),
+    "distance_matrix": (3.05, 30),
+}
+DEFAULT_TIMEOUT = (3.05, 10)
+
+POOL_SIZE = 32            # conexões mantidas abertas (>= workers de details/batch)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5      # 0.5s, 1s, 2s ...
+BACKOFF_JITTER = 0.5      # + até 0.5s aleatórios para não sincronizar as threads
+RETRY_STATUS = (500, 502, 503, 504)   # 429 fica de fora: é refeito pelo MapsSession (ver THROTTLE_RETRIES)
+THROTTLE_RETRIES = 5      # novas tentativas após OVER_QUERY_LIMIT/429, com o limitador freado e o Retry-After respeitado
+
+def endpoint_for_url(url: str) -> str | None:
+    for name, path in ENDPOINTS.items():
+        if path in url:
+            return name
+    return None
+
+
+def _decode(response):
+    """
+    JSON da resposta, decodificado uma vez só: o resultado fica no lugar de
+    response.json(), que get_json e o cliente googlemaps chamam depois.
+    None se o corpo não for JSON (p.ex. página HTML de um 5xx).
+    """
+    if "json" not in response.headers.get("Content-Type", ""):
+        return None
+    try:
+        payload = response.json()
+    except ValueError:
+        return None
+    response.json = lambda **kwargs: payload
+    return payload
+
+def _api_status(response, payload) -> str:
+    """Status da resposta para métricas/throttle: o 'status' do JSON da API ou o código HTTP."""
+    if response.status_code != 200 or not isinstance(payload, dict):
+        return str(response.status_code)
+    return payload.get("status") or "200"
+
+def _is_throttled(status: str) -> bool:
+    return status in ("429", "OVER_QUERY_LIMIT")
+
+def _retry_after(response) -> float | None:
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class MapsSession(requests.Session):
+    """
+    Session que aplica o timeout do endpoint quando a chamada não define um
+    e passa cada chamada pelo limitador de QPS do endpoint.
+    """
+
+    def request(self, method, url, **kwargs):
+        endpoint = endpoint_for_url(url)
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        limiter = get_limiter(endpoint)
+        metrics = get_metrics()
+        for attempt in range(THROTTLE_RETRIES + 1):
+            limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, **kwargs)
+            except Exception as e:
+                metrics.observe_call(endpoint, time.perf_counter() - start, type(e).__name__)
+                raise
+            status = _api_status(response, _decode(response))
+            metrics.observe_call(endpoint, time.perf_counter() - start, status)
+            if not _is_throttled(status):
+                limiter.on_success()
+                return response
+            limiter.on_throttle(_retry_after(response))
+        return response
+
+
+def _adapter() -> HTTPAdapter:
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        backoff_jitter=BACKOFF_JITTER,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    return HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+
+def _mount(session: requests.Session):
+    adapter = _adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+def _build_session() -> MapsSession:
+    session = MapsSession()
+    _mount(session)
+    return session
+
+
+_session = None
+_clients = {}
+_lock = threading.Lock()
+
+def configure_pool(size: int):
+    """
+    Ajusta o nº de conexões do pool. Se a Session compartilhada já existe (uma
+    chamada anterior a criou), o HTTPAdapter é remontado com o novo tamanho;
+    o antigo não é fechado, para não cortar requisições em andamento.
+    """
+    global POOL_SIZE
+    with _lock:
+        POOL_SIZE = int(size)
+        if _session is not None:
+            _mount(_session)
+
+def get_session() -> MapsSession:
+    """Session compartilhada do processo (criada na primeira chamada)."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+def get_client(api_key: str) -> "googlemaps.Client":
+    """Cliente googlemaps (um por chave) usando a Session compartilhada."""
+    import googlemaps   # só Geocoding/Distance Matrix usam o cliente; as buscas vão direto por get_json
+
+    session = get_session()
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = googlemaps.Client(key=api_key, requests_session=session, base_url=BASE_URL)
+            _clients[api_key] = client
+        return client
+
+def get_json(endpoint: str, params: dict, timeout=None) -> dict:
+    """GET em um endpoint de ENDPOINTS e devolve o JSON da resposta."""
+    url = BASE_URL + ENDPOINTS[endpoint]
+    response = get_session().get(url, params=params, timeout=timeout or TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT))
+    return response.json()